@@ -1,22 +1,32 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, g, has_app_context, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_limiter import Limiter
 from flask_mail import Mail, Message # type: ignore
 from flask_limiter.util import get_remote_address
+from limits.storage import Storage as AlmacenLimites
 from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect, CSRFError, generate_csrf
 from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from dotenv import load_dotenv
 import json
 import datetime
 import os
 import csv
 import psycopg2, psycopg2.extras
+from psycopg2 import pool as pg_pool
 import io
 import shutil
 import logging
+import threading
+import time
+import queue
+import atexit
 from functools import wraps
+from contextlib import contextmanager
+from collections import OrderedDict, deque
 import uuid
+import hashlib
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, SelectField, EmailField
 from wtforms.validators import DataRequired, Email, EqualTo, Length
 import re
@@ -41,6 +51,12 @@ try:
 except Exception:
     TZ = None
 
+# NumPy es opcional: acelera el cálculo de costos por lotes (ver MotorCostos)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 def now_local():
     """Fecha/hora local consistente. Por defecto America/Bogota, configurable con APP_TZ."""
     try:
@@ -55,6 +71,102 @@ def today_local_iso():
     except Exception:
         return datetime.date.today().isoformat()
 
+def rango_mes(ano, mes):
+    """Primer y último día (date) de un mes, para filtrar con BETWEEN y poder usar índices."""
+    primer_dia = datetime.date(ano, mes, 1)
+    siguiente = datetime.date(ano + 1, 1, 1) if mes == 12 else datetime.date(ano, mes + 1, 1)
+    return primer_dia, siguiente - datetime.timedelta(days=1)
+
+# -------------------
+# Costos de nómina
+# -------------------
+class MotorCostos:
+    """
+    Costo de horas ordinarias y extras. El valor de la hora es salario_minimo / horas_mes
+    del año de cada registro (configurable por año); las extras llevan un recargo según
+    el día: lunes a viernes 1.25, sábado 1.75 y domingo 2.0.
+    costos() trabaja por columnas (fechas, horas, extras) y usa NumPy si está instalado;
+    sin NumPy no compensa armar las columnas y la exportación calcula fila a fila con
+    valor_hora() y RECARGOS.
+    """
+
+    RECARGOS = (1.25, 1.25, 1.25, 1.25, 1.25, 1.75, 2.0)  # Por weekday(): lunes = 0
+    TARIFA_BASE = {'salario_minimo': 1384308, 'horas_mes': 240}
+
+    def __init__(self, tarifas=None):
+        # {año: {'salario_minimo': ..., 'horas_mes': ...}}; un año sin tarifa usa la del
+        # año configurado más cercano anterior (o la primera si es anterior a todas).
+        self.tarifas = {int(ano): {**self.TARIFA_BASE, **valores} for ano, valores in (tarifas or {}).items()}
+        self._anos = sorted(self.tarifas)
+
+    def tarifa(self, ano):
+        if not self._anos:
+            return self.TARIFA_BASE
+        anteriores = [a for a in self._anos if a <= ano]
+        return self.tarifas[anteriores[-1] if anteriores else self._anos[0]]
+
+    def valor_hora(self, ano):
+        tarifa = self.tarifa(ano)
+        return tarifa['salario_minimo'] / tarifa['horas_mes']
+
+    def recargo(self, fecha):
+        return self.RECARGOS[fecha.weekday()]
+
+    def sql_recargo(self, columna_fecha):
+        """Expresión SQL con el recargo de extras para una columna DATE."""
+        casos = " ".join(f"WHEN {isodow} THEN {self.RECARGOS[isodow - 1]}" for isodow in (6, 7))
+        return f"CASE EXTRACT(ISODOW FROM {columna_fecha}) {casos} ELSE {self.RECARGOS[0]} END"
+
+    def costos(self, fechas, horas, extras):
+        """
+        Costos por registro a partir de columnas paralelas. Retorna
+        {'ordinarias': [...], 'extras': [...], 'total': [...]} (arrays de NumPy si está disponible).
+        """
+        if np is not None:
+            return self._costos_numpy(fechas, horas, extras)
+        valores = {}
+        recargos = self.RECARGOS
+        ordinarias, costo_extras, total = [], [], []
+        for fecha, h, e in zip(fechas, horas, extras):
+            valor = valores.get(fecha.year)
+            if valor is None:
+                valor = valores[fecha.year] = self.valor_hora(fecha.year)
+            o = float(h or 0) * valor
+            x = float(e or 0) * valor * recargos[fecha.weekday()]
+            ordinarias.append(o)
+            costo_extras.append(x)
+            total.append(o + x)
+        return {'ordinarias': ordinarias, 'extras': costo_extras, 'total': total}
+
+    def _costos_numpy(self, fechas, horas, extras):
+        if isinstance(fechas, np.ndarray):
+            dias = fechas.astype('datetime64[D]').astype('int64')
+        else:
+            # toordinal() es mucho más rápido que convertir objetos date a datetime64
+            dias = np.fromiter((f.toordinal() for f in fechas), dtype='int64', count=len(fechas)) - 719163
+        horas = self._columna(horas)
+        extras = self._columna(extras)
+        weekday = (dias + 3) % 7  # 1970-01-01 fue jueves
+        anos = dias.astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
+        anos_unicos, indice = np.unique(anos, return_inverse=True)
+        valor = np.array([self.valor_hora(int(a)) for a in anos_unicos])[indice]
+        ordinarias = horas * valor
+        costo_extras = extras * valor * np.asarray(self.RECARGOS)[weekday]
+        return {'ordinarias': ordinarias, 'extras': costo_extras, 'total': ordinarias + costo_extras}
+
+    @staticmethod
+    def _columna(valores):
+        if isinstance(valores, np.ndarray):
+            return valores.astype(float)
+        return np.fromiter((float(v or 0) for v in valores), dtype=float, count=len(valores))
+
+    def costo_extras_ponderadas(self, fechas, extras_ponderadas):
+        """Costo total de extras ya multiplicadas por su recargo (p. ej. de resumen_asistencia)."""
+        return sum(float(e or 0) * self.valor_hora(f.year) for f, e in zip(fechas, extras_ponderadas))
+
+
+motor_costos = MotorCostos(json.loads(os.environ.get('PAYROLL_RATES') or '{}'))
+
 app = Flask(__name__, template_folder='Templates')
 
 # Configuración de SECRET_KEY robusta (Fallback seguro)
@@ -93,10 +205,91 @@ app.jinja_env.filters['strftime'] = jinja2_strftime
 
 
 # Rate Limiting para proteger contra ataques de fuerza bruta
+class AlmacenLimitesPostgres(AlmacenLimites):
+    """
+    Contadores de Flask-Limiter en una tabla UNLOGGED de PostgreSQL (limites_peticiones),
+    compartidos por todos los workers de gunicorn. Ventana fija: cada incremento es un
+    solo INSERT ... ON CONFLICT atómico que reinicia el contador si la ventana venció.
+    Cada operación usa su propia conexión del pool y se confirma al momento, fuera de
+    la transacción de la petición, para no retener el bloqueo de la fila mientras corre la ruta.
+    Las filas vencidas se purgan de vez en cuando desde incr().
+    """
+
+    STORAGE_SCHEME = ["postgres-app"]
+    PURGA_CADA = 60.0  # Segundos entre purgas de filas vencidas (por proceso)
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._proxima_purga = 0.0
+
+    @property
+    def base_exceptions(self):
+        return psycopg2.Error
+
+    @contextmanager
+    def _cursor(self):
+        conn = _nueva_conexion_pool()
+        try:
+            with conn.cursor() as cursor:
+                yield cursor
+            conn.commit()
+        finally:
+            conn.close()  # Si algo falló, el pool deshace lo pendiente al recibirla
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO limites_peticiones AS l (clave, contador, expira)
+                VALUES (%s, %s, clock_timestamp() + make_interval(secs => %s))
+                ON CONFLICT (clave) DO UPDATE SET
+                    contador = CASE WHEN l.expira <= clock_timestamp() THEN EXCLUDED.contador
+                                    ELSE l.contador + EXCLUDED.contador END,
+                    expira = CASE WHEN l.expira <= clock_timestamp() OR %s THEN EXCLUDED.expira
+                                  ELSE l.expira END
+                RETURNING contador
+            """, (key, amount, expiry, bool(elastic_expiry)))
+            contador = cursor.fetchone()[0]
+            if time.monotonic() >= self._proxima_purga:
+                self._proxima_purga = time.monotonic() + self.PURGA_CADA
+                cursor.execute("DELETE FROM limites_peticiones WHERE expira < clock_timestamp()")
+        return contador
+
+    def get(self, key):
+        with self._cursor() as cursor:
+            cursor.execute("SELECT contador FROM limites_peticiones WHERE clave = %s AND expira > clock_timestamp()", (key,))
+            fila = cursor.fetchone()
+        return fila[0] if fila else 0
+
+    def get_expiry(self, key):
+        with self._cursor() as cursor:
+            cursor.execute("SELECT EXTRACT(EPOCH FROM expira) FROM limites_peticiones WHERE clave = %s", (key,))
+            fila = cursor.fetchone()
+        return float(fila[0]) if fila else time.time()
+
+    def check(self):
+        try:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT 1 FROM limites_peticiones LIMIT 1")
+            return True
+        except Exception:
+            return False
+
+    def reset(self):
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM limites_peticiones")
+            return cursor.rowcount
+
+    def clear(self, key):
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM limites_peticiones WHERE clave = %s", (key,))
+
+# Por defecto los contadores viven en PostgreSQL (compartidos entre workers); si la BD no
+# responde, Flask-Limiter usa memoria del proceso hasta que check() vuelva a pasar.
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    storage_uri="memory://"
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'postgres-app://'),
+    in_memory_fallback_enabled=True
 )
 
 # ✅ Configuración de Sesión y Seguridad Robusta (Solución de Raíz)
@@ -122,6 +315,112 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Debes iniciar sesión para acceder a esta página.'
 login_manager.login_message_category = 'error'
 
+# ✅ Tiempos por petición: Server-Timing, línea de log estructurada y ventana para /admin/perf
+def _percentil(ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return None
+    return ordenados[max(0, -(-len(ordenados) * p // 100) - 1)]
+
+class MetricasEndpoints:
+    """
+    Muestras de los últimos `ventana` segundos (por proceso) con la duración, el tiempo en
+    base de datos y las consultas de cada petición. resumen() agrupa por endpoint, peores primero.
+    """
+
+    def __init__(self, ventana=900, max_muestras=20000):
+        self.ventana = ventana
+        self._muestras = deque(maxlen=max_muestras)
+        self._lock = threading.Lock()
+
+    def registrar(self, endpoint, segundos, registro):
+        lenta = registro.lentas[0] if registro.lentas else None
+        with self._lock:
+            self._muestras.append((time.monotonic(), endpoint, segundos, registro.tiempo,
+                                   registro.consultas, bool(registro.n_mas_1()), lenta))
+
+    def resumen(self, limite=20):
+        desde = time.monotonic() - self.ventana
+        with self._lock:
+            while self._muestras and self._muestras[0][0] < desde:
+                self._muestras.popleft()
+            muestras = list(self._muestras)
+
+        grupos = {}
+        for _, endpoint, segundos, db, consultas, n_mas_1, lenta in muestras:
+            grupos.setdefault(endpoint, []).append((segundos, db, consultas, n_mas_1, lenta))
+        filas = []
+        for endpoint, datos in grupos.items():
+            tiempos = sorted(d[0] * 1000 for d in datos)
+            lentas = [d[4] for d in datos if d[4]]
+            peor = max(lentas, key=lambda l: l[0]) if lentas else None
+            filas.append({
+                'endpoint': endpoint,
+                'peticiones': len(datos),
+                'p50_ms': round(_percentil(tiempos, 50), 1),
+                'p95_ms': round(_percentil(tiempos, 95), 1),
+                'max_ms': round(tiempos[-1], 1),
+                'db_ms_media': round(sum(d[1] for d in datos) * 1000 / len(datos), 1),
+                'consultas_media': round(sum(d[2] for d in datos) / len(datos), 1),
+                'consultas_max': max(d[2] for d in datos),
+                'n_mas_1': sum(1 for d in datos if d[3]),
+                'sentencia_lenta': {'ms': round(peor[0] * 1000, 1), 'sql': peor[1]} if peor else None,
+            })
+        filas.sort(key=lambda f: f['p95_ms'], reverse=True)
+        return filas[:limite]
+
+
+metricas_endpoints = MetricasEndpoints(ventana=float(os.environ.get('PERF_VENTANA_S', 900)))
+# Server-Timing para todos (p. ej. pruebas de carga); si no, solo para administradores
+app.config['PERF_SERVER_TIMING'] = os.environ.get('PERF_SERVER_TIMING', 'False').lower() in ['true', 'on', '1']
+
+@app.before_request
+def _iniciar_medicion():
+    g._inicio_peticion = time.perf_counter()
+
+@app.after_request
+def _registrar_tiempos(respuesta):
+    """
+    Registra la petición en metricas_endpoints y en el log. Server-Timing (tiempos y
+    consultas) solo va a administradores, o a todos con PERF_SERVER_TIMING activo.
+    Las respuestas en streaming leen la base mientras se envía el cuerpo: se registran
+    al cerrarse, sin Server-Timing porque las cabeceras ya salieron.
+    """
+    inicio = g.pop('_inicio_peticion', None)
+    if inicio is None or (request.endpoint and 'static' in request.endpoint):
+        return respuesta
+    endpoint = f"{request.method} {request.url_rule.rule if request.url_rule else '<sin ruta>'}"
+    if respuesta.is_streamed:
+        registro = registro_consultas()  # El generador (stream_with_context) anota en este mismo registro
+        estado = respuesta.status_code
+        respuesta.call_on_close(lambda: _anotar_tiempos(endpoint, estado, time.perf_counter() - inicio, registro))
+        return respuesta
+
+    segundos = time.perf_counter() - inicio
+    registro = g.get('_registro_consultas') or RegistroConsultas()
+    if app.config['PERF_SERVER_TIMING'] or getattr(current_user, 'admin', False):
+        metricas = [f'db;dur={registro.tiempo * 1000:.2f};desc="{registro.consultas} consultas"',
+                    f'app;dur={segundos * 1000:.2f}']
+        if registro.n_mas_1():
+            metricas.append(f'n1;desc="{len(registro.n_mas_1())} repetidas"')
+        respuesta.headers.add('Server-Timing', ', '.join(metricas))
+    _anotar_tiempos(endpoint, respuesta.status_code, segundos, registro)
+    return respuesta
+
+def _anotar_tiempos(endpoint, estado, segundos, registro):
+    repetidas = registro.n_mas_1()
+    metricas_endpoints.registrar(endpoint, segundos, registro)
+    if registro.consultas:
+        logger.info("perf " + json.dumps({
+            'endpoint': endpoint,
+            'estado': estado,
+            'ms': round(segundos * 1000, 1),
+            'db_ms': round(registro.tiempo * 1000, 1),
+            'consultas': registro.consultas,
+            'lentas': [{'ms': round(s * 1000, 1), 'sql': h} for s, h in registro.lentas],
+            'n_mas_1': [{'sql': h, 'veces': n} for h, n in repetidas.items()],
+        }, ensure_ascii=False))
+
 # Protección centralizada de rutas administrativas
 @app.before_request
 def _proteger_rutas_admin():
@@ -267,30 +566,417 @@ def validar_username(username):
     return bool(re.match(r'^[a-zA-Z0-9_-]{3,50}$', username))
 
 # --- Funciones de Base de Datos PostgreSQL ---
-def get_db_connection():
-    """Crea y retorna una conexión a la base de datos PostgreSQL."""
-    conn_args = {'cursor_factory': psycopg2.extras.DictCursor}
+# --- Instrumentación de consultas por petición ---
+PERF_N_MAS_1_UMBRAL = int(os.environ.get('PERF_N_MAS_1_UMBRAL', 5))  # Repeticiones que cuentan como N+1
+PERF_LENTAS_POR_PETICION = 3
+
+def _huella_sql(sql):
+    """Sentencia sin literales ni espacios repetidos: agrupa las repeticiones de una misma consulta."""
+    if isinstance(sql, bytes):  # Sentencias armadas por execute_values
+        sql = sql.decode('utf-8', 'replace')
+    sql = re.sub(r"'(?:[^']|'')*'", '?', str(sql))
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return ' '.join(sql.split())[:300]
+
+class RegistroConsultas:
+    """Sentencias SQL de una petición: cantidad, tiempo total, las más lentas y las repetidas."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo = 0.0
+        self.lentas = []        # [(segundos, huella)] ordenadas de mayor a menor
+        self.repeticiones = {}  # huella -> veces
+
+    def registrar(self, sql, segundos, repetible=True):
+        """`repetible=False` para lecturas que se repiten por diseño (FETCH por lotes): no cuentan como N+1."""
+        huella = _huella_sql(sql)
+        self.consultas += 1
+        self.tiempo += segundos
+        if repetible:
+            self.repeticiones[huella] = self.repeticiones.get(huella, 0) + 1
+        if len(self.lentas) < PERF_LENTAS_POR_PETICION or segundos > self.lentas[-1][0]:
+            self.lentas.append((segundos, huella))
+            self.lentas.sort(key=lambda x: x[0], reverse=True)
+            del self.lentas[PERF_LENTAS_POR_PETICION:]
+
+    def n_mas_1(self):
+        """Sentencias ejecutadas PERF_N_MAS_1_UMBRAL veces o más (típico bucle con una consulta por fila)."""
+        return {huella: veces for huella, veces in self.repeticiones.items() if veces >= PERF_N_MAS_1_UMBRAL}
+
+def registro_consultas():
+    """Registro de la petición actual, o None fuera de un contexto de aplicación (hilos, scripts)."""
+    if not has_app_context():
+        return None
+    registro = g.get('_registro_consultas')
+    if registro is None:
+        registro = g._registro_consultas = RegistroConsultas()
+    return registro
+
+class CursorInstrumentado(psycopg2.extras.DictCursor):
+    """
+    DictCursor que anota cada sentencia y su duración en el registro de la petición.
+    En los cursores con nombre (de servidor) cada fetchmany()/fetchall() es un FETCH
+    aparte y también se anota.
+    """
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            registro = registro_consultas()
+            if registro is not None:
+                registro.registrar(query, time.perf_counter() - inicio)
+
+    def fetchmany(self, size=None):
+        if self.name is None:
+            return super().fetchmany(size)
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(size)
+        finally:
+            self._anotar_fetch(inicio)
+
+    def fetchall(self):
+        if self.name is None:
+            return super().fetchall()
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._anotar_fetch(inicio)
+
+    def _anotar_fetch(self, inicio):
+        registro = registro_consultas()
+        if registro is not None:
+            # Sin el sufijo aleatorio del nombre, para que los FETCH de una misma vista se agrupen
+            registro.registrar(f"FETCH FROM {self.name.rsplit('_', 1)[0]}", time.perf_counter() - inicio, repetible=False)
+
+def _parametros_conexion():
+    """Argumentos para psycopg2.connect según el entorno (Render o local)."""
+    conn_args = {'cursor_factory': CursorInstrumentado}
     db_url = os.environ.get('DATABASE_URL')
-    
+
     if db_url: # En producción (Render)
-        return psycopg2.connect(db_url, **conn_args)
-    else: # En desarrollo (local) - USAR VARIABLES DE ENTORNO
+        return (db_url,), conn_args
+    # En desarrollo (local) - USAR VARIABLES DE ENTORNO
+    conn_args.update(
+        host=os.environ.get('DB_HOST', 'localhost'),
+        user=os.environ.get('DB_USER', 'postgres'),
+        password=os.environ.get('DB_PASSWORD', ''),
+        dbname=os.environ.get('DB_NAME', 'sistema_empleados'),
+    )
+    return (), conn_args
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones PostgreSQL de un proceso.
+    Abre `minconn` conexiones al crearse y conserva libres hasta `maxconn`; limita las
+    conexiones a `maxconn` (esperando hasta `timeout` segundos por un cupo), verifica
+    con SELECT 1 las conexiones que llevan más de `chequeo_tras` segundos inactivas y
+    lleva métricas de uso.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10.0, chequeo_tras=30.0):
+        args, kwargs = _parametros_conexion()
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, *args, **kwargs)
+        # psycopg2 cierra al devolverla toda conexión por encima de `minconn` libres; con
+        # minconn = 1 la petición, el limitador y la auditoría reconectarían en cada uso.
+        # El total ya lo limitan los cupos, así que se conservan todas.
+        self._pool.minconn = maxconn
+        self._cupos = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._ultimo_uso = {}  # id(conn) -> time.monotonic() de la última devolución
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.chequeo_tras = chequeo_tras
+        self.pid = os.getpid()
+        self.en_uso = 0
+        self.metricas = {
+            'checkouts': 0,
+            'esperas': 0,
+            'tiempo_espera_total': 0.0,
+            'timeouts': 0,
+            'fallos_salud': 0,
+        }
+
+    def obtener(self):
+        """Saca una conexión sana del pool, esperando si todas están en uso."""
+        inicio = time.monotonic()
+        if not self._cupos.acquire(blocking=False):
+            with self._lock:
+                self.metricas['esperas'] += 1
+            if not self._cupos.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.metricas['timeouts'] += 1
+                raise pg_pool.PoolError(f"Pool de conexiones agotado ({self.maxconn} en uso) tras {self.timeout}s de espera")
+        try:
+            conn = self._verificar(self._pool.getconn())
+        except Exception:
+            self._cupos.release()
+            raise
+        with self._lock:
+            self.metricas['checkouts'] += 1
+            self.metricas['tiempo_espera_total'] += time.monotonic() - inicio
+            self.en_uso += 1
+        return conn
+
+    def _verificar(self, conn):
+        """
+        Descarta conexiones cerradas o caídas; solo hace ping si la conexión estuvo inactiva
+        un rato. Tras un reinicio de la base todas las libres están caídas: se sigue
+        descartando hasta dar con una sana o con una recién creada por el pool.
+        """
+        while True:
+            # Solo las conexiones libres tienen entrada; la que sale del pool deja de tenerla
+            ultimo = self._ultimo_uso.pop(id(conn), None)
+            if not conn.closed and (ultimo is None or time.monotonic() - ultimo < self.chequeo_tras):
+                return conn  # Recién creada por el pool, o usada hace poco
+            try:
+                if conn.closed:
+                    raise psycopg2.InterfaceError('conexión cerrada')
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except psycopg2.Error as e:
+                logger.warning(f"Conexión del pool descartada por chequeo de salud: {e}")
+                with self._lock:
+                    self.metricas['fallos_salud'] += 1
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+
+    def devolver(self, conn):
+        """Devuelve la conexión al pool, deshaciendo cualquier transacción abierta."""
+        cerrar = bool(conn.closed)
+        if not cerrar and conn.status != psycopg2.extensions.STATUS_READY:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                cerrar = True
+        if not cerrar:
+            self._ultimo_uso[id(conn)] = time.monotonic()
         try:
-            conn = psycopg2.connect(
-                host=os.environ.get('DB_HOST', 'localhost'),
-                user=os.environ.get('DB_USER', 'postgres'),
-                password=os.environ.get('DB_PASSWORD', ''),
-                dbname=os.environ.get('DB_NAME', 'sistema_empleados'),
-                **conn_args
+            self._pool.putconn(conn, close=cerrar)
+        finally:
+            if conn.closed:  # Cerrada por psycopg2 (o por nosotros): su id() puede reutilizarse
+                self._ultimo_uso.pop(id(conn), None)
+            with self._lock:
+                self.en_uso -= 1
+            self._cupos.release()
+
+    def estadisticas(self):
+        """Métricas del pool: tamaño actual, conexiones libres/en uso, esperas y checkouts."""
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['en_uso'] = self.en_uso
+        datos['tamano'] = len(self._pool._pool) + len(self._pool._used)
+        datos['libres'] = len(self._pool._pool)
+        datos['min'] = self.minconn
+        datos['max'] = self.maxconn
+        datos['pid'] = self.pid
+        datos['tiempo_espera_total'] = round(datos['tiempo_espera_total'], 4)
+        return datos
+
+    def cerrar(self):
+        self._pool.closeall()
+
+
+class ConexionPool:
+    """Envoltura de una conexión del pool: close() la devuelve al pool en lugar de cerrarla."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.devolver(conn)
+
+
+_pool_conexiones = None
+_pool_lock = threading.Lock()
+# Pools heredados de un proceso padre (gunicorn --preload). Se conservan sin cerrarlos:
+# cerrar sus sockets desde el hijo terminaría las sesiones que el padre sigue usando.
+_pools_heredados = []
+
+def obtener_pool():
+    """Retorna el pool del proceso actual, creándolo en el primer uso (y tras un fork)."""
+    global _pool_conexiones
+    pool_actual = _pool_conexiones
+    if pool_actual is not None and pool_actual.pid == os.getpid():
+        return pool_actual
+    with _pool_lock:
+        if _pool_conexiones is not None and _pool_conexiones.pid != os.getpid():
+            _pools_heredados.append(_pool_conexiones)
+            _pool_conexiones = None
+        if _pool_conexiones is None:
+            _pool_conexiones = PoolConexiones(
+                minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+                maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+                timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                chequeo_tras=float(os.environ.get('DB_POOL_HEALTHCHECK', 30)),
             )
-            return conn
-        except psycopg2.OperationalError as e:
-            logger.error(f"Error de conexión a BD: {e}")
-            logger.error("Asegúrate de que:")
-            logger.error("  1. PostgreSQL esté corriendo")
-            logger.error("  2. Archivo .env esté configurado")
-            logger.error("  3. Usuario y contraseña sean correctos")
+            logger.info(f"Pool de conexiones creado (pid={os.getpid()}, min={_pool_conexiones.minconn}, max={_pool_conexiones.maxconn})")
+        return _pool_conexiones
+
+class ConexionPeticion:
+    """
+    Conexión compartida por todo el código que corre dentro de una misma petición
+    (rutas, load_user y funciones auxiliares).
+    - close() no la libera: se confirma y devuelve al pool en el teardown.
+    - Dentro de un bloque transaccion_db(), commit() se difiere y rollback() solo
+      deshace hasta el SAVEPOINT del bloque, de modo que las escrituras de varios
+      pasos quedan atómicas y se confirman una sola vez.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._savepoints = []  # Pila de bloques abiertos; None = bloque sin SAVEPOINT
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    @property
+    def closed(self):
+        return self._conn.closed
+
+    @property
+    def en_bloque(self):
+        return bool(self._savepoints)
+
+    def close(self):
+        pass  # Se libera en el teardown de la petición
+
+    def commit(self):
+        if self._savepoints:
+            return  # Lo confirma quien abrió el bloque más externo (o el teardown)
+        self._conn.commit()
+
+    def rollback(self):
+        if self._savepoints and self._savepoints[-1]:
+            with self._conn.cursor() as cursor:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {self._savepoints[-1]}")
+        else:
+            self._conn.rollback()
+
+    @contextmanager
+    def bloque(self):
+        # Si no hay trabajo pendiente en la transacción no hace falta SAVEPOINT:
+        # deshacer el bloque equivale a deshacer toda la transacción.
+        if self._savepoints or self._conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            nombre = f"sp_{len(self._savepoints) + 1}"
+            with self._conn.cursor() as cursor:
+                cursor.execute(f"SAVEPOINT {nombre}")
+        else:
+            nombre = None
+        self._savepoints.append(nombre)
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
             raise
+        else:
+            if nombre:
+                with self._conn.cursor() as cursor:
+                    cursor.execute(f"RELEASE SAVEPOINT {nombre}")
+        finally:
+            self._savepoints.pop()
+
+    def finalizar(self, exito):
+        """Confirma (o deshace) lo pendiente y devuelve la conexión al pool."""
+        try:
+            if not self._conn.closed:
+                if exito:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        except psycopg2.Error as e:
+            logger.error(f"Error al finalizar la transacción de la petición: {e}")
+        finally:
+            self._conn.close()
+
+
+def _nueva_conexion_pool():
+    try:
+        pool_db = obtener_pool()
+        return ConexionPool(pool_db, pool_db.obtener())
+    except psycopg2.OperationalError as e:
+        logger.error(f"Error de conexión a BD: {e}")
+        logger.error("Asegúrate de que:")
+        logger.error("  1. PostgreSQL esté corriendo")
+        logger.error("  2. Archivo .env esté configurado")
+        logger.error("  3. Usuario y contraseña sean correctos")
+        raise
+
+def get_db_connection():
+    """
+    Retorna una conexión del pool de PostgreSQL del proceso.
+    Dentro de una petición todas las llamadas comparten la misma conexión, que se
+    confirma y devuelve al pool en el teardown. Fuera de contexto (scripts, hilos)
+    cada llamada saca su propia conexión y close() la devuelve al pool.
+    """
+    if not has_app_context():
+        return _nueva_conexion_pool()
+
+    conn = g.get('_conexion_peticion')
+    if conn is None or conn.closed:
+        conn = ConexionPeticion(_nueva_conexion_pool())
+        g._conexion_peticion = conn
+    return conn
+
+@contextmanager
+def transaccion_db():
+    """
+    Bloque transaccional anidable sobre la conexión actual.
+    Si el bloque lanza una excepción se deshace solo su trabajo; si termina bien,
+    el commit queda para el final de la petición (o para el commit() que la ruta
+    haga fuera de cualquier bloque). Fuera de una petición confirma al salir.
+    """
+    conn = get_db_connection()
+    if isinstance(conn, ConexionPeticion):
+        with conn.bloque():
+            yield conn
+        return
+
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@app.teardown_appcontext
+def _devolver_conexiones_db(exc):
+    """
+    Confirma la transacción de la petición (o la deshace si hubo error), libera la
+    conexión y sube la versión de datos si la petición escribió algo que se cachea.
+    """
+    conn = g.pop('_conexion_peticion', None)
+    if conn is not None:
+        conn.finalizar(exito=exc is None)
+    # Aunque la petición falle, lo confirmado antes con conn.commit() ya es visible
+    if g.pop('_version_datos_pendiente', False):
+        version_datos_diferida.subir()
+
+def metricas_pool():
+    """Métricas del pool del proceso actual (None si aún no se ha creado)."""
+    pool_actual = _pool_conexiones
+    if pool_actual is None or pool_actual.pid != os.getpid():
+        return None
+    return pool_actual.estadisticas()
 
 def init_db():
     """Inicializa la base de datos: crea tablas si no existen y el usuario admin."""
@@ -460,12 +1146,131 @@ def init_db():
     cursor.close()
     conn.close()
 
+    # Cambios de esquema posteriores a la creación de tablas
+    aplicar_migraciones()
+    catalogo_turnos.invalidar()
+    motor_rotacion.invalidar()
+
+# ✅ Escritor asíncrono de la bitácora de auditoría
+class BitacoraAuditoria:
+    """
+    Acumula entradas de auditoría en una cola acotada y un hilo de fondo las
+    inserta por lotes (INSERT multi-fila) con su propia conexión del pool.
+    Si la cola está llena, la entrada se escribe en el momento (nunca se descarta),
+    también con una conexión propia: nunca la de la petición, cuya transacción
+    confirmaría o desharía a destiempo.
+    Al terminar el proceso se vacía lo pendiente (atexit).
+    """
+
+    SQL_INSERT = "INSERT INTO bitacora_auditoria (fecha_hora, usuario_responsable, accion, detalle, ip_origen) VALUES %s"
+
+    def __init__(self, max_cola=10000, tamano_lote=200, intervalo=1.0):
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = None
+        self._detener = threading.Event()
+        self.metricas = {'encoladas': 0, 'escritas': 0, 'lotes': 0, 'sincronas': 0, 'errores': 0}
+
+    def registrar(self, entrada):
+        """Encola una entrada (fecha_hora, responsable, accion, detalle, ip)."""
+        self._asegurar_hilo()
+        try:
+            self._cola.put_nowait(entrada)
+            self._contar(encoladas=1)
+        except queue.Full:
+            logger.warning("Cola de auditoría llena; escribiendo la entrada de forma síncrona.")
+            self._contar(sincronas=1)
+            self._escribir([entrada])
+
+    def _contar(self, **incrementos):
+        # Lo actualizan a la vez el hilo de escritura y los hilos de las peticiones
+        with self._lock:
+            for clave, valor in incrementos.items():
+                self.metricas[clave] += valor
+
+    def _asegurar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive() or self._pid != os.getpid():
+                self._detener.clear()
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._bucle, name='bitacora-auditoria', daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while not self._detener.is_set() or not self._cola.empty():
+            try:
+                lote = [self._cola.get(timeout=self.intervalo)]
+            except queue.Empty:
+                continue
+            while len(lote) < self.tamano_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._escribir(lote)
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    def _escribir(self, lote):
+        conn = None
+        try:
+            conn = _nueva_conexion_pool()
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(cursor, self.SQL_INSERT, lote, page_size=self.tamano_lote)
+            conn.commit()
+            cursor.close()
+            self._contar(escritas=len(lote), lotes=1)
+        except Exception as e:
+            self._contar(errores=1)
+            if conn:
+                conn.rollback()
+            logger.error(f"Error al escribir {len(lote)} entradas de auditoría: {e}")
+            for entrada in lote:
+                logger.error(f"Auditoría no guardada: {entrada}")
+        finally:
+            if conn:
+                conn.close()
+
+    def vaciar(self):
+        """Espera a que todo lo encolado esté escrito."""
+        if self._hilo is not None and self._hilo.is_alive():
+            self._cola.join()
+
+    def cerrar(self, timeout=10.0):
+        """Detiene el hilo tras escribir lo pendiente."""
+        self._detener.set()
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            self._hilo.join(timeout)
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self.metricas)
+        datos['pendientes'] = self._cola.qsize()
+        return datos
+
+
+bitacora = BitacoraAuditoria(
+    max_cola=int(os.environ.get('AUDIT_QUEUE_SIZE', 10000)),
+    tamano_lote=int(os.environ.get('AUDIT_BATCH_SIZE', 200)),
+    intervalo=float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0)),
+)
+atexit.register(bitacora.cerrar)
+
 # ✅ Función para registrar en bitácora
-def registrar_auditoria(accion, detalle, usuario=None):
+def registrar_auditoria(accion, detalle, usuario=None, durable=False):
+    """
+    Registra una acción en la bitácora. Por defecto la entrada se encola y se escribe
+    por lotes en segundo plano; con durable=True se inserta dentro de la transacción
+    de la petición, de modo que se confirma (o se deshace) junto con la operación auditada.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Determinar usuario responsable de forma segura
         resp = 'Sistema/Anónimo'
         if usuario:
@@ -483,76 +1288,737 @@ def registrar_auditoria(accion, detalle, usuario=None):
                 ip = request.remote_addr
         except:
             pass
-        
-        cursor.execute(
-            "INSERT INTO bitacora_auditoria (usuario_responsable, accion, detalle, ip_origen) VALUES (%s, %s, %s, %s)",
-            (resp, accion, detalle, ip)
+
+        entrada = (now_local(), resp, accion, detalle, ip)
+        if not durable:
+            bitacora.registrar(entrada)
+            return
+
+        with transaccion_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO bitacora_auditoria (fecha_hora, usuario_responsable, accion, detalle, ip_origen) VALUES (%s, %s, %s, %s, %s)",
+                entrada
+            )
+            cursor.close()
+    except Exception as e:
+        logger.error(f"Error al registrar auditoría: {e}")
+
+# -------------------
+# Migraciones versionadas del esquema
+# -------------------
+def _migracion_unique_turnos_asignados(cursor):
+    """Cambia UNIQUE (id_usuario, fecha_asignacion) por (id_usuario, fecha_asignacion, id_turno_disponible)."""
+    cursor.execute("""
+        SELECT constraint_name
+        FROM information_schema.table_constraints
+        WHERE table_name = 'turnos_asignados' AND constraint_type = 'UNIQUE';
+    """)
+    for row in cursor.fetchall():
+        nombre = row['constraint_name']
+        # Solo la restricción antigua termina así; la nueva incluye id_turno_disponible
+        if nombre.endswith('id_usuario_fecha_asignacion_key'):
+            logger.info(f"Encontrada restricción antigua: {nombre}. Procediendo a migrar.")
+            cursor.execute(f"ALTER TABLE turnos_asignados DROP CONSTRAINT {nombre};")
+            cursor.execute("""
+                ALTER TABLE turnos_asignados
+                ADD CONSTRAINT turnos_asignados_id_usuario_fecha_asignacion_id_turno_dispo_key
+                UNIQUE (id_usuario, fecha_asignacion, id_turno_disponible);
+            """)
+
+def _migracion_indices_consultas(cursor):
+    """
+    Índices para los filtros más usados. (id_usuario, fecha_asignacion) en turnos_asignados
+    y (id_usuario, fecha) en registros_asistencia ya los cubren sus restricciones UNIQUE,
+    que empiezan por esas columnas.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_turnos_asignados_fecha ON turnos_asignados (fecha_asignacion)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_asistencia_fecha ON registros_asistencia (fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bitacora_auditoria_fecha_hora ON bitacora_auditoria (fecha_hora)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_bloqueado_admin ON usuarios (bloqueado, admin)")
+
+def _migracion_patrones_rotacion(cursor):
+    """Tabla de patrones de rotación semanal por cédula, sembrada con los patrones vigentes."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patrones_rotacion (
+            cedula VARCHAR(255) PRIMARY KEY,
+            horas VARCHAR(5)[] NOT NULL, -- Un turno por semana, en orden de rotación
+            activo BOOLEAN DEFAULT TRUE,
+            actualizado_en TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
         )
+    """)
+    psycopg2.extras.execute_values(
+        cursor,
+        "INSERT INTO patrones_rotacion (cedula, horas) VALUES %s ON CONFLICT (cedula) DO NOTHING",
+        [
+            ("1070963486", ["06:30", "08:30"]),
+            ("1067949514", ["08:00", "06:30"]),
+            ("1140870406", ["08:30", "09:00"]),
+            ("1068416077", ["09:00", "08:00", "06:30"]),
+        ]
+    )
+
+def _migracion_resumen_asistencia(cursor):
+    """Tabla de totales de asistencia por usuario y día/semana/mes, poblada desde el histórico."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_asistencia (
+            periodo VARCHAR(6) NOT NULL, -- 'dia' | 'semana' | 'mes' | 'ano'
+            inicio DATE NOT NULL, -- Primer día del periodo (las semanas empiezan en lunes)
+            id_usuario INT NOT NULL,
+            registros INT DEFAULT 0,
+            horas_trabajadas DECIMAL(10,2) DEFAULT 0.0,
+            horas_extras DECIMAL(10,2) DEFAULT 0.0,
+            extras_ponderadas DECIMAL(10,2) DEFAULT 0.0, -- Extras x recargo (sáb 1.75, dom 2.0, resto 1.25)
+            PRIMARY KEY (periodo, inicio, id_usuario),
+            FOREIGN KEY (id_usuario) REFERENCES usuarios(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_resumen_asistencia_usuario ON resumen_asistencia (id_usuario, periodo, inicio)")
+    reconstruir_resumen_asistencia(cursor)
+
+def _migracion_resumen_anual(cursor):
+    """Fila de totales por usuario y año en resumen_asistencia (contadores de toda la vida)."""
+    reconstruir_resumen_asistencia(cursor, periodos=('ano',))
+
+def _migracion_version_datos(cursor):
+    """Contador de versión de los datos de asistencia, para invalidar la caché de fragmentos."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS version_datos (
+            clave VARCHAR(30) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT INTO version_datos (clave, version) VALUES ('asistencia', 0) ON CONFLICT (clave) DO NOTHING")
+
+def _migracion_version_datos_fecha(cursor):
+    """Fecha de la última escritura en version_datos, para el encabezado Last-Modified."""
+    cursor.execute("ALTER TABLE version_datos ADD COLUMN IF NOT EXISTS actualizado_en TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP")
+
+def _migracion_limites_peticiones(cursor):
+    """Contadores del rate limiter compartidos entre workers (UNLOGGED: no pasan por el WAL)."""
+    cursor.execute("""
+        CREATE UNLOGGED TABLE IF NOT EXISTS limites_peticiones (
+            clave TEXT PRIMARY KEY,
+            contador INT NOT NULL,
+            expira TIMESTAMPTZ NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_limites_peticiones_expira ON limites_peticiones (expira)")
+
+def _migracion_marcaciones_lote(cursor):
+    """Claves de idempotencia de las marcaciones recibidas por lote desde kioscos."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS marcaciones_lote (
+            clave TEXT PRIMARY KEY,
+            id_usuario INT NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            marcada_en TIMESTAMPTZ NOT NULL,
+            recibida_en TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_marcaciones_lote_usuario ON marcaciones_lote (id_usuario, marcada_en)")
+
+# (versión, descripción, función). Las versiones nunca se reutilizan ni se reordenan:
+# para cambiar el esquema se agrega una entrada nueva al final.
+MIGRACIONES = [
+    (1, 'UNIQUE de turnos_asignados incluye el turno', _migracion_unique_turnos_asignados),
+    (2, 'Índices para filtros por fecha y estado de usuario', _migracion_indices_consultas),
+    (3, 'Patrones de rotación de turnos en tabla', _migracion_patrones_rotacion),
+    (4, 'Resúmenes de asistencia por día, semana y mes', _migracion_resumen_asistencia),
+    (5, 'Resumen de asistencia por año', _migracion_resumen_anual),
+    (6, 'Versión de datos para la caché de fragmentos', _migracion_version_datos),
+    (7, 'Fecha de modificación en version_datos', _migracion_version_datos_fecha),
+    (8, 'Tabla UNLOGGED para el rate limiter', _migracion_limites_peticiones),
+    (9, 'Claves de idempotencia de marcaciones por lote', _migracion_marcaciones_lote),
+]
+
+# Clave arbitraria del advisory lock que serializa migraciones entre workers
+_LOCK_MIGRACIONES = 7150421
+
+def aplicar_migraciones():
+    """
+    Aplica en orden las migraciones pendientes y las registra en schema_migraciones.
+    Cada una corre en su propia transacción; un advisory lock evita que dos procesos
+    apliquen la misma versión a la vez. Retorna la lista de versiones aplicadas.
+    """
+    aplicadas = []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migraciones (
+                version INT PRIMARY KEY,
+                descripcion VARCHAR(255),
+                aplicada_en TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
         conn.commit()
+
+        for version, descripcion, migracion in MIGRACIONES:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MIGRACIONES,))
+            cursor.execute("SELECT 1 FROM schema_migraciones WHERE version = %s", (version,))
+            if cursor.fetchone():
+                conn.commit()  # Libera el lock
+                continue
+            logger.info(f"Aplicando migración {version}: {descripcion}")
+            migracion(cursor)
+            cursor.execute("INSERT INTO schema_migraciones (version, descripcion) VALUES (%s, %s)", (version, descripcion))
+            conn.commit()
+            aplicadas.append(version)
+    except Exception as e:
+        logger.error(f"Error durante la migración de la base de datos: {e}")
+        conn.rollback()
+        raise
+    finally:
         cursor.close()
         conn.close()
-    except Exception as e:
-        logger.error(f"Error al registrar auditoría: {e}")
+
+    if aplicadas:
+        logger.info(f"Migraciones aplicadas: {aplicadas}")
+    return aplicadas
+
+# -------------------
+# Caché en memoria (por proceso)
+# -------------------
+class CacheTTL:
+    """
+    Caché LRU con expiración por entrada, segura entre hilos.
+    Es local a cada proceso: con varios workers de gunicorn, una invalidación solo
+    limpia el worker que la ejecuta y los demás ven el cambio al vencer el TTL.
+    """
+
+    def __init__(self, max_entradas=1024, ttl=60.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (expira, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave=None):
+        """Elimina una entrada, o toda la caché si no se indica clave."""
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+cache_usuarios = CacheTTL(
+    max_entradas=int(os.environ.get('USER_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 60)),
+)
+
+def invalidar_usuario_cache(user_id):
+    """Descarta el User cacheado tras modificar o eliminar la fila en `usuarios`."""
+    cache_usuarios.invalidar(str(user_id))
+
+class CatalogoTurnos:
+    """
+    Catálogo de turnos_disponibles en memoria: (dia_semana, hora) <-> id.
+    Es estático (lo siembra init_db), así que se carga una vez por proceso. Cada
+    `intervalo_verificacion` segundos se compara su versión (COUNT, MAX(id)) con la
+    base de datos y solo se recarga si cambió; invalidar() fuerza la recarga.
+    """
+
+    SQL_VERSION = "SELECT COUNT(*) AS total, COALESCE(MAX(id), 0) AS max_id FROM turnos_disponibles"
+
+    def __init__(self, intervalo_verificacion=300.0):
+        self.intervalo_verificacion = intervalo_verificacion
+        self._por_clave = {}
+        self._por_id = {}
+        self.version = None
+        self._verificado_en = None
+        self._lock = threading.Lock()
+        self.cargas = 0
+
+    def _vigente(self):
+        return self._verificado_en is not None and time.monotonic() - self._verificado_en < self.intervalo_verificacion
+
+    def _asegurar(self):
+        if self._vigente():
+            return
+        with self._lock:
+            if self._vigente():
+                return
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.SQL_VERSION)
+                row = cursor.fetchone()
+                version = (row['total'], row['max_id'])
+                if version != self.version:
+                    cursor.execute("SELECT id, dia_semana, hora FROM turnos_disponibles")
+                    filas = cursor.fetchall()
+                    self._por_clave = {(f['dia_semana'], f['hora']): f['id'] for f in filas}
+                    self._por_id = {f['id']: (f['dia_semana'], f['hora']) for f in filas}
+                    self.version = version
+                    self.cargas += 1
+                self._verificado_en = time.monotonic()
+            finally:
+                cursor.close()
+                conn.close()
+
+    def id_turno(self, dia_semana, hora):
+        """Id del turno disponible para (dia_semana, hora), o None si no existe."""
+        self._asegurar()
+        return self._por_clave.get((dia_semana, hora))
+
+    def turno(self, id_turno):
+        """(dia_semana, hora) de un id de turno disponible, o None."""
+        self._asegurar()
+        return self._por_id.get(id_turno)
+
+    def invalidar(self):
+        with self._lock:
+            self._verificado_en = None
+            self.version = None
+
+
+catalogo_turnos = CatalogoTurnos(
+    intervalo_verificacion=float(os.environ.get('SHIFT_CATALOG_TTL', 300)),
+)
+
+DIAS_SEMANA = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+class MotorRotacion:
+    """
+    Turnos rotativos a partir de la tabla patrones_rotacion.
+    Cada empleado rota semanalmente por su lista de horas, contando semanas desde
+    `fecha_base` (lunes de la semana 1): el turno de cualquier fecha es
+    horas[(semana - 1) % len(horas)], sin consultas por día.
+    Los patrones se cachean por proceso durante `ttl` segundos; invalidar() los recarga.
+    """
+
+    def __init__(self, fecha_base, ttl=300.0):
+        self.fecha_base = fecha_base
+        self.ttl = ttl
+        self._patrones = None
+        self._cargado_en = None
+        self._lock = threading.Lock()
+
+    def patrones(self):
+        """{cedula: [horas]} de los patrones activos."""
+        if self._patrones is not None and time.monotonic() - self._cargado_en < self.ttl:
+            return self._patrones
+        with self._lock:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT cedula, horas FROM patrones_rotacion WHERE activo IS NOT FALSE ORDER BY cedula")
+                self._patrones = {row['cedula']: list(row['horas']) for row in cursor.fetchall()}
+                self._cargado_en = time.monotonic()
+            finally:
+                cursor.close()
+                conn.close()
+            return self._patrones
+
+    def patron(self, cedula):
+        return self.patrones().get(cedula)
+
+    def invalidar(self):
+        with self._lock:
+            self._patrones = None
+
+    def semana(self, fecha):
+        """Número de semana de rotación (1 = semana de fecha_base)."""
+        return (fecha - self.fecha_base).days // 7 + 1
+
+    def hora_turno(self, cedula, fecha):
+        """Hora del turno que le corresponde a `cedula` en `fecha`, o None si no rota."""
+        patron = self.patron(cedula)
+        if not patron:
+            return None
+        return patron[(self.semana(fecha) - 1) % len(patron)]
+
+    def filas_periodo(self, empleados, desde, hasta):
+        """
+        Filas (id_usuario, id_turno_disponible, fecha) para cada día entre desde y hasta.
+        `empleados` es una lista de (id_usuario, cedula); los que no rotan se omiten.
+        """
+        filas = []
+        dias = [desde + datetime.timedelta(days=i) for i in range((hasta - desde).days + 1)]
+        for id_usuario, cedula in empleados:
+            patron = self.patron(cedula)
+            if not patron:
+                continue
+            for fecha in dias:
+                hora = patron[(self.semana(fecha) - 1) % len(patron)]
+                id_turno = catalogo_turnos.id_turno(DIAS_SEMANA[fecha.weekday()], hora)
+                if id_turno:
+                    filas.append((id_usuario, id_turno, fecha))
+        return filas
+
+    def generar(self, cursor, empleados, desde, hasta):
+        """
+        Asigna en un solo INSERT los turnos rotativos del periodo. Los días en que un
+        empleado ya tiene algún turno se respetan. Retorna el número de filas insertadas.
+        """
+        filas = self.filas_periodo(empleados, desde, hasta)
+        if not filas:
+            return 0
+        psycopg2.extras.execute_values(
+            cursor,
+            """INSERT INTO turnos_asignados (id_usuario, id_turno_disponible, fecha_asignacion)
+               SELECT v.id_usuario, v.id_turno, v.fecha FROM (VALUES %s) AS v(id_usuario, id_turno, fecha)
+               WHERE NOT EXISTS (SELECT 1 FROM turnos_asignados ta
+                                 WHERE ta.id_usuario = v.id_usuario AND ta.fecha_asignacion = v.fecha)
+               ON CONFLICT (id_usuario, id_turno_disponible, fecha_asignacion) DO NOTHING""",
+            filas, template="(%s::int, %s::int, %s::date)", page_size=len(filas)
+        )
+        insertados = cursor.rowcount
+        if insertados:
+            incrementar_version_datos(cursor)
+        return insertados
+
+    def empleados(self, cursor):
+        """Usuarios con patrón de rotación activo (id, username, nombre, cedula, cargo)."""
+        cedulas = list(self.patrones())
+        if not cedulas:
+            return []
+        cursor.execute("SELECT id, username, nombre, cedula, cargo FROM usuarios WHERE cedula = ANY(%s)", (cedulas,))
+        return cursor.fetchall()
+
+
+motor_rotacion = MotorRotacion(
+    fecha_base=datetime.date.fromisoformat(os.environ.get('ROTATION_START_DATE', '2025-11-03')),
+    ttl=float(os.environ.get('ROTATION_CACHE_TTL', 300)),
+)
+
+# -------------------
+# Resúmenes de asistencia (resumen_asistencia)
+# -------------------
+PERIODOS_RESUMEN = ('dia', 'semana', 'mes', 'ano')
+
+# Columnas agregadas de resumen_asistencia a partir de registros_asistencia (alias ra)
+SQL_AGREGADOS_RESUMEN = """
+    COUNT(ra.id), COALESCE(SUM(ra.horas_trabajadas), 0), COALESCE(SUM(ra.horas_extras), 0),
+    COALESCE(SUM(ra.horas_extras * """ + motor_costos.sql_recargo('ra.fecha') + """), 0)
+"""
+
+def rango_periodo(periodo, fecha):
+    """(inicio, fin) del día, semana (lunes a domingo), mes o año que contiene `fecha`."""
+    if periodo == 'dia':
+        return fecha, fecha
+    if periodo == 'semana':
+        lunes = fecha - datetime.timedelta(days=fecha.weekday())
+        return lunes, lunes + datetime.timedelta(days=6)
+    if periodo == 'ano':
+        return datetime.date(fecha.year, 1, 1), datetime.date(fecha.year, 12, 31)
+    return rango_mes(fecha.year, fecha.month)
+
+# Espacio de advisory locks (clave de dos enteros: espacio, id_usuario) del recálculo de resúmenes
+_LOCK_RESUMEN_USUARIO = 7150422
+
+def actualizar_resumen_asistencia(cursor, claves):
+    """
+    Recalcula las filas de resumen_asistencia afectadas por cambios en los registros
+    de `claves` [(id_usuario, fecha)]: su día, su semana, su mes y su año. Se recalculan
+    desde registros_asistencia (no se suman deltas), así el resumen no se desvía
+    aunque la misma fila se escriba varias veces.
+
+    Dos transacciones pueden tocar la misma semana/mes/año de un usuario (un lote de
+    ayer y la marcación de hoy), así que el recálculo es un upsert, y un advisory lock
+    por usuario (hasta el commit) hace que la segunda vea lo que confirmó la primera.
+    Tres sentencias por llamada: candado, upsert y borrado de los periodos que se
+    quedaron sin registros. La versión de datos se sube después del commit (ver
+    incrementar_version_datos).
+    """
+    periodos = set()
+    for id_usuario, fecha in claves:
+        if isinstance(fecha, str):
+            fecha = datetime.date.fromisoformat(fecha[:10])
+        for periodo in PERIODOS_RESUMEN:
+            inicio, fin = rango_periodo(periodo, fecha)
+            periodos.add((periodo, inicio, fin, int(id_usuario)))
+    if not periodos:
+        return
+    periodos = sorted(periodos)
+    # En orden de id para que dos lotes con usuarios en común no se bloqueen en cruz
+    cursor.execute("SELECT pg_advisory_xact_lock(%s, u) FROM unnest(%s::int[]) AS u ORDER BY u",
+                   (_LOCK_RESUMEN_USUARIO, sorted({u for _, _, _, u in periodos})))
+    psycopg2.extras.execute_values(
+        cursor,
+        f"""INSERT INTO resumen_asistencia (periodo, inicio, id_usuario, registros, horas_trabajadas, horas_extras, extras_ponderadas)
+            SELECT v.periodo, v.inicio, v.id_usuario, {SQL_AGREGADOS_RESUMEN}
+            FROM (VALUES %s) AS v(periodo, inicio, fin, id_usuario)
+            JOIN registros_asistencia ra ON ra.id_usuario = v.id_usuario AND ra.fecha BETWEEN v.inicio AND v.fin
+            GROUP BY v.periodo, v.inicio, v.id_usuario
+            ON CONFLICT (periodo, inicio, id_usuario) DO UPDATE
+            SET registros = EXCLUDED.registros, horas_trabajadas = EXCLUDED.horas_trabajadas,
+                horas_extras = EXCLUDED.horas_extras, extras_ponderadas = EXCLUDED.extras_ponderadas""",
+        periodos, template="(%s, %s::date, %s::date, %s::int)", page_size=len(periodos)
+    )
+    psycopg2.extras.execute_values(
+        cursor,
+        """DELETE FROM resumen_asistencia r USING (VALUES %s) AS v(periodo, inicio, fin, id_usuario)
+           WHERE r.periodo = v.periodo AND r.inicio = v.inicio AND r.id_usuario = v.id_usuario
+             AND NOT EXISTS (SELECT 1 FROM registros_asistencia ra
+                             WHERE ra.id_usuario = v.id_usuario AND ra.fecha BETWEEN v.inicio AND v.fin)""",
+        periodos, template="(%s, %s::date, %s::date, %s::int)", page_size=len(periodos)
+    )
+    incrementar_version_datos(cursor)
+
+def reconstruir_resumen_asistencia(cursor, desde=None, hasta=None, periodos=PERIODOS_RESUMEN):
+    """
+    Rehace resumen_asistencia desde registros_asistencia: todo el histórico, o solo los
+    periodos que tocan el rango [desde, hasta] (para cargas masivas o correcciones).
+    """
+    truncar = {'dia': 'day', 'semana': 'week', 'mes': 'month', 'ano': 'year'}
+    for periodo in periodos:
+        filtro, params = "", []
+        if desde is not None and hasta is not None:
+            inicio, fin = rango_periodo(periodo, desde)[0], rango_periodo(periodo, hasta)[1]
+            filtro, params = " AND inicio BETWEEN %s AND %s", [inicio, fin]
+        cursor.execute("DELETE FROM resumen_asistencia WHERE periodo = %s" + filtro, [periodo] + params)
+        cursor.execute(f"""
+            INSERT INTO resumen_asistencia (periodo, inicio, id_usuario, registros, horas_trabajadas, horas_extras, extras_ponderadas)
+            SELECT %s, date_trunc(%s, ra.fecha)::date, ra.id_usuario, {SQL_AGREGADOS_RESUMEN}
+            FROM registros_asistencia ra
+            {"WHERE ra.fecha BETWEEN %s AND %s" if params else ""}
+            GROUP BY 2, ra.id_usuario
+        """, [periodo, truncar[periodo]] + params)
+
+def totales_historicos_usuario(cursor, id_usuario):
+    """
+    (registros, costo de horas extras) de toda la vida de un usuario, desde sus filas
+    anuales de resumen_asistencia: una por año, valoradas con la tarifa de ese año.
+    """
+    cursor.execute(
+        "SELECT inicio, registros, extras_ponderadas FROM resumen_asistencia WHERE periodo = 'ano' AND id_usuario = %s",
+        (id_usuario,)
+    )
+    anos = cursor.fetchall()
+    registros = sum(a['registros'] for a in anos)
+    costo = motor_costos.costo_extras_ponderadas([a['inicio'] for a in anos], [a['extras_ponderadas'] for a in anos])
+    return registros, costo
+
+# -------------------
+# Caché de fragmentos del dashboard
+# -------------------
+SQL_SUBIR_VERSION = "UPDATE version_datos SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE clave = 'asistencia'"
+
+def incrementar_version_datos(cursor):
+    """
+    Marca que cambiaron registros, turnos o usuarios: los fragmentos cacheados y los
+    ETag con la versión anterior dejan de servir. Dentro de una petición solo se anota
+    y la versión se sube al final, después del commit (ver VersionDatosDiferida); así
+    las escrituras concurrentes no hacen cola en la única fila de version_datos.
+    Fuera de contexto (scripts) va dentro de la transacción del cursor.
+    """
+    if has_app_context():
+        g._version_datos_pendiente = True
+        return
+    cursor.execute(SQL_SUBIR_VERSION)
+
+class VersionDatosDiferida:
+    """
+    Sube version_datos una vez terminada la escritura, en una transacción propia de una
+    sola sentencia: el candado de la fila dura eso y no lo que dure cada marcación.
+    Las peticiones que llegan mientras otra subida está en curso se agrupan en la
+    siguiente, que empieza después de sus commits y por tanto también las cubre.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()       # Contadores y métricas
+        self._escritura = threading.Lock()  # Una subida a la vez por proceso
+        self._pedidas = 0
+        self._cubiertas = 0
+        self.metricas = {'pedidas': 0, 'subidas': 0, 'errores': 0}
+
+    def subir(self):
+        """Llamar después del commit de los datos. Bloquea hasta que una subida posterior al commit termine."""
+        with self._lock:
+            self._pedidas += 1
+            turno = self._pedidas
+            self.metricas['pedidas'] += 1
+        with self._escritura:
+            with self._lock:
+                if self._cubiertas >= turno:
+                    return  # La subió otra petición, después de nuestro commit
+                hasta = self._pedidas
+            conn = None
+            try:
+                conn = _nueva_conexion_pool()
+                cursor = conn.cursor()
+                cursor.execute(SQL_SUBIR_VERSION)
+                conn.commit()
+                cursor.close()
+                with self._lock:
+                    self._cubiertas = hasta
+                    self.metricas['subidas'] += 1
+            except Exception as e:
+                with self._lock:
+                    self.metricas['errores'] += 1
+                if conn:
+                    conn.rollback()
+                logger.error(f"Error al subir la versión de datos: {e}")
+            finally:
+                if conn:
+                    conn.close()
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self.metricas)
+
+
+version_datos_diferida = VersionDatosDiferida()
+
+def version_datos(cursor):
+    """Versión actual de los datos de asistencia, o None si no se puede leer (sin caché)."""
+    cursor.execute("SELECT version FROM version_datos WHERE clave = 'asistencia'")
+    fila = cursor.fetchone()
+    return fila['version'] if fila else None
+
+class CacheFragmentos:
+    """
+    Secciones ya renderizadas (HTML o JSON) por (sección, periodo, versión de datos).
+    La versión sale de version_datos en cada petición, así que una escritura en cualquier
+    worker hace que los demás dejen de usar sus fragmentos; el TTL solo libera memoria
+    de versiones viejas. Lleva aciertos y fallos por sección.
+    """
+
+    def __init__(self, max_entradas=256, ttl=300.0):
+        self._cache = CacheTTL(max_entradas=max_entradas, ttl=ttl)
+        self._lock = threading.Lock()
+        self._secciones = {}  # seccion -> {'aciertos': n, 'fallos': n}
+
+    def obtener(self, seccion, periodo, version, generar):
+        """Fragmento cacheado, o el resultado de `generar()` (que se guarda)."""
+        if version is None:
+            return generar()
+        clave = (seccion, periodo, version)
+        valor = self._cache.obtener(clave)
+        acierto = valor is not None
+        if not acierto:
+            valor = generar()
+            self._cache.guardar(clave, valor)
+        with self._lock:
+            contadores = self._secciones.setdefault(seccion, {'aciertos': 0, 'fallos': 0})
+            contadores['aciertos' if acierto else 'fallos'] += 1
+        return valor
+
+    def invalidar(self):
+        self._cache.invalidar()
+
+    def estadisticas(self):
+        datos = self._cache.estadisticas()
+        with self._lock:
+            datos['secciones'] = {seccion: dict(c) for seccion, c in self._secciones.items()}
+        return datos
+
+
+fragmentos_dashboard = CacheFragmentos(
+    max_entradas=int(os.environ.get('FRAGMENT_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+)
 
 # -------------------
-# ✅ NUEVO: Función de Migración de Base de Datos (Segura)
+# GET condicional (ETag / Last-Modified)
 # -------------------
-def migrar_db_v1():
+def sello_datos(cursor):
     """
-    Aplica cambios a la estructura de la base de datos sin perder datos.
-    Específicamente, actualiza la restricción UNIQUE en 'turnos_asignados'.
+    (versión, última modificación) de los datos que muestran las páginas de consulta:
+    la versión de version_datos y la fecha de cambio más reciente entre ella y los
+    patrones de rotación. Una sola lectura por clave primaria. None si no se puede leer.
     """
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        logger.info("Iniciando migración de base de datos v1...")
+    cursor.execute("""
+        SELECT v.version, GREATEST(v.actualizado_en, p.actualizado_en) AS actualizado_en
+        FROM version_datos v
+        LEFT JOIN (SELECT MAX(actualizado_en) AS actualizado_en FROM patrones_rotacion) p ON TRUE
+        WHERE v.clave = 'asistencia'
+    """)
+    fila = cursor.fetchone()
+    return (fila['version'], fila['actualizado_en']) if fila else None
 
-        # 1. Encontrar el nombre de la vieja restricción UNIQUE en 'turnos_asignados'
-        cursor.execute("""
-            SELECT constraint_name 
-            FROM information_schema.table_constraints 
-            WHERE table_name = 'turnos_asignados' AND constraint_type = 'UNIQUE';
-        """)
-        constraint_row = cursor.fetchone()
-        
-        if constraint_row:
-            old_constraint_name = constraint_row['constraint_name']
-            
-            # Solo intentar la migración si la restricción vieja es la que esperamos
-            if 'id_usuario_fecha_asignacion_key' in old_constraint_name:
-                logger.info(f"Encontrada restricción antigua: {old_constraint_name}. Procediendo a migrar.")
-                
-                # 2. Eliminar la restricción antigua
-                cursor.execute(f"ALTER TABLE turnos_asignados DROP CONSTRAINT {old_constraint_name};")
-                logger.info("Restricción antigua eliminada.")
+def respuesta_condicional(vista):
+    """
+    Decorador para páginas de solo lectura que se refrescan a menudo. Calcula un ETag con
+    la vista, el usuario, la URL, el día, el sello de datos y el token CSRF de la sesión
+    (las páginas llevan formularios: tras un nuevo login la copia vieja ya no sirve); si
+    el navegador ya tiene esa versión (If-None-Match, o If-Modified-Since) responde 304
+    sin ejecutar la vista. Con mensajes flash pendientes siempre se renderiza.
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if request.method != 'GET' or not current_user.is_authenticated or session.get('_flashes'):
+                return funcion(*args, **kwargs)
 
-                # 3. Añadir la nueva restricción UNIQUE
-                cursor.execute("""
-                    ALTER TABLE turnos_asignados 
-                    ADD CONSTRAINT turnos_asignados_id_usuario_fecha_asignacion_id_turno_dispo_key 
-                    UNIQUE (id_usuario, fecha_asignacion, id_turno_disponible);
-                """)
-                logger.info("Nueva restricción UNIQUE (id_usuario, fecha_asignacion, id_turno_disponible) añadida.")
-                
-                conn.commit()
-                flash("✅ Migración de base de datos completada exitosamente.", "message")
-                logger.info("Migración completada y confirmada.")
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                sello = sello_datos(cursor)
+            finally:
+                cursor.close()
+                conn.close()
+            if sello is None:
+                return funcion(*args, **kwargs)
+
+            version, actualizado_en = sello
+            hoy = now_local()
+            # El contenido depende del día (hoy, semana actual), así que la medianoche también lo cambia
+            medianoche = hoy.replace(hour=0, minute=0, second=0, microsecond=0)
+            if medianoche.tzinfo is None:
+                medianoche = medianoche.astimezone()  # Sin APP_TZ: hora local del sistema
+            modificado = max(actualizado_en, medianoche) if actualizado_en else medianoche
+            generate_csrf()  # Crea el token de la sesión si aún no existe, antes de usarlo en el ETag
+            token_sesion = session.get(app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+            etag = hashlib.sha1(
+                f"{vista}|{current_user.get_id()}|{request.full_path}|{hoy.date()}|{version}|{actualizado_en}|{token_sesion}".encode()
+            ).hexdigest()
+
+            if request.if_none_match:
+                sin_cambios = request.if_none_match.contains(etag)
             else:
-                logger.info("La restricción UNIQUE ya parece estar actualizada. No se necesita migración.")
-                flash("La base de datos ya está en la versión más reciente.", "info")
-        else:
-            logger.info("No se encontró una restricción UNIQUE para migrar en 'turnos_asignados'.")
-
-    except Exception as e:
-        logger.error(f"Error durante la migración de la base de datos: {e}")
-        flash(f"Error durante la migración: {e}", "error")
-        if conn: conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
+                sin_cambios = request.if_modified_since is not None and \
+                    request.if_modified_since >= modificado.replace(microsecond=0)
+            if sin_cambios:
+                respuesta = Response(status=304)
+            else:
+                respuesta = app.make_response(funcion(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+            respuesta.set_etag(etag)
+            respuesta.last_modified = modificado
+            respuesta.headers['Cache-Control'] = 'private, no-cache'
+            return respuesta
+        return envoltura
+    return decorador
 
 # -------------------
 # Flask-Login user loader
@@ -561,6 +2027,9 @@ def migrar_db_v1():
 def load_user(user_id):
     if not user_id:
         return None
+    user = cache_usuarios.obtener(str(user_id))
+    if user is not None:
+        return user
     try:
         conn = get_db_connection()
         cursor = conn.cursor() # Ya es DictCursor por la conexión
@@ -569,7 +2038,7 @@ def load_user(user_id):
         cursor.close()
         conn.close()
         if user_data:
-            return User(
+            user = User(
                 id=user_data['id'],
                 username=user_data['username'],
                 admin=user_data['admin'],
@@ -581,6 +2050,8 @@ def load_user(user_id):
                 bloqueado=user_data.get('bloqueado', False),
                 fecha_creacion=user_data.get('fecha_creacion', datetime.datetime.now())
             )
+            cache_usuarios.guardar(str(user_id), user)
+            return user
     except Exception as e:
         logger.error(f"Error critico en load_user: {e}")
         return None
@@ -665,82 +2136,27 @@ def login():
 # Función para asignar turnos automáticamente basado en cédula y rotación
 def asignar_turnos_automaticos(cedula, id_usuario):
     """
-    Asigna turnos rotativos según el patrón de cada empleado.
-    Basado en historial desde Nov 3, 2025.
-    
-    Patrones de rotación:
-    - Natalia (1070963486): 6:30, 8:30 (rotación cada semana)
-    - Lesly (1067949514): 8:00, 6:30 (rotación cada semana)
-    - Paola (1140870406): 8:30, 9:00 (rotación cada semana)
-    - Dayana (1068416077): 9:00, 8:00, 6:30 (rotación cada 3 semanas)
+    Asigna los turnos rotativos de la semana actual (lunes a domingo) según el
+    patrón del empleado en patrones_rotacion (ver MotorRotacion). Los días en que
+    ya tiene un turno se respetan.
     """
-    shift_assignments = {
-        "1070963486": ["06:30", "08:30"],
-        "1067949514": ["08:00", "06:30"],
-        "1140870406": ["08:30", "09:00"],
-        "1068416077": ["09:00", "08:00", "06:30"]
-    }
-
-    if cedula not in shift_assignments:
+    if not motor_rotacion.patron(cedula):
         return
 
-    # Calcular qué semana estamos desde Nov 3
-    fecha_base = datetime.datetime(2025, 11, 3)
-    hoy = now_local() # Puede ser aware o naive
-    # Hacemos ambas fechas naive para poder compararlas sin error
-    hoy_naive = hoy.replace(tzinfo=None)
-    semanas_transcurridas = ((hoy_naive - fecha_base).days // 7) + 1
-    
-    # Obtener patrón de turnos para esta cédula
-    patron = shift_assignments[cedula]
-    
-    # Determinar qué turno le toca esta semana según rotación
-    # Semana 1 (Nov 3-8): primer turno del patrón
-    # Semana 2 (Nov 10-15): segundo turno del patrón
-    # Para Dayana con 3 turnos, rota cada 3 semanas
-    indice_turno = (semanas_transcurridas - 1) % len(patron)
-    turno_asignado_hora = patron[indice_turno]
-    
-    # Asignar el turno de esta semana (de lunes a sábado)
-    dias_semana = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
-    # Asignar el turno para la semana actual (de lunes a domingo)
-    dias_semana = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
     hoy_dt = now_local().date()
     inicio_semana_actual = hoy_dt - datetime.timedelta(days=hoy_dt.weekday())
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    for i, dia in enumerate(dias_semana):
-        fecha_del_dia = inicio_semana_actual + datetime.timedelta(days=i)
-        cursor.execute("SELECT id FROM turnos_disponibles WHERE dia_semana = %s AND hora = %s", (dia, turno_asignado_hora))
-        turno_disponible_id = cursor.fetchone()
-        
-        if turno_disponible_id:
-            turno_disponible_id = turno_disponible_id['id']
-            
-            # Verificar si el turno ya está asignado para hoy
-            # Verificar si el turno ya está asignado para ese día
-            cursor.execute(
-                "SELECT id FROM turnos_asignados WHERE id_usuario = %s AND fecha_asignacion = %s",
-                (id_usuario, fecha_del_dia)
-            )
-            if not cursor.fetchone():
-                try:
-                    logger.info(f"Inserting turno asignado automatico: id_usuario={id_usuario}, turno_id={turno_disponible_id}, fecha={today_local_iso()}")
-                    cursor.execute("INSERT INTO turnos_asignados (id_usuario, id_turno_disponible, fecha_asignacion) VALUES (%s, %s, %s) ON CONFLICT (id_usuario, id_turno_disponible, fecha_asignacion) DO NOTHING",
-                                (id_usuario, turno_disponible_id, today_local_iso()))
-                    logger.info(f"Asignando turno automático para {id_usuario} el {fecha_del_dia} a las {turno_asignado_hora}")
-                    cursor.execute("INSERT INTO turnos_asignados (id_usuario, id_turno_disponible, fecha_asignacion) VALUES (%s, %s, %s)",
-                                (id_usuario, turno_disponible_id, fecha_del_dia))
-                    conn.commit()
-                except psycopg2.Error as err:
-                    if err.pgcode == '23505': # unique_violation
-                        pass
-                    else:
-                        logger.error(f"Error al asignar turno automático: {err}")
-    cursor.close()
-    conn.close()
+    try:
+        # Toda la semana en un solo INSERT sobre la conexión de la petición (p.ej. /register):
+        # o se asignan todos los días o ninguno.
+        with transaccion_db() as conn:
+            cursor = conn.cursor()
+            insertados = motor_rotacion.generar(cursor, [(id_usuario, cedula)],
+                                                inicio_semana_actual, inicio_semana_actual + datetime.timedelta(days=6))
+            logger.info(f"Asignados {insertados} turnos automáticos para {id_usuario} desde {inicio_semana_actual}")
+            cursor.close()
+    except psycopg2.Error as err:
+        logger.error(f"Error al asignar turno automático: {err}")
 
 # ✅ Registro - Hash de contraseñas
 @app.route('/register', methods=['GET', 'POST'])
@@ -792,13 +2208,15 @@ def register():
         try:
             hashed_password = generate_password_hash(contrasena)
             logger.info(f"Inserting new user: username={username}, cedula={cedula}")
-            cursor.execute(
-                "INSERT INTO usuarios (username, contrasena, admin, nombre, cedula, cargo, correo, telefono) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                (username, hashed_password, False, nombre, cedula, cargo, correo, telefono)
-            )
-            id_nuevo_usuario = cursor.fetchone()['id']
-            conn.commit()
-            asignar_turnos_automaticos(cedula, id_nuevo_usuario)
+            with transaccion_db():
+                cursor.execute(
+                    "INSERT INTO usuarios (username, contrasena, admin, nombre, cedula, cargo, correo, telefono) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
+                    (username, hashed_password, False, nombre, cedula, cargo, correo, telefono)
+                )
+                id_nuevo_usuario = cursor.fetchone()['id']
+                asignar_turnos_automaticos(cedula, id_nuevo_usuario)
+                incrementar_version_datos(cursor)
+            conn.commit() # Usuario y turnos iniciales se confirman juntos
             logger.info(f"Nuevo usuario registrado: {username}")
             flash('Usuario registrado con éxito. Ahora puedes iniciar sesión.', 'message')
         except psycopg2.DatabaseError as e:
@@ -843,7 +2261,9 @@ def register_legacy():
                     "UPDATE usuarios SET nombre = %s, cargo = %s, correo = %s, telefono = %s, contrasena = %s WHERE id = %s",
                     (nombre, cargo, correo, telefono, generate_password_hash(contrasena), usuario_existente['id'])
                 )
+                incrementar_version_datos(cursor)
                 conn.commit()
+                invalidar_usuario_cache(usuario_existente['id'])
                 logger.info(f"Usuario actualizado: {usuario_existente['username']}")
                 flash(f'Usuario actualizado: {usuario_existente["username"]}.', 'message')
             except psycopg2.DatabaseError as e:
@@ -861,6 +2281,7 @@ def register_legacy():
                     (username, hashed_password, False, nombre, cedula, cargo, correo, telefono)
                 )
                 id_nuevo_usuario = cursor.fetchone()['id']
+                incrementar_version_datos(cursor)
                 conn.commit()
                 flash('Usuario registrado con éxito.', 'message')
             except psycopg2.DatabaseError as e:
@@ -907,9 +2328,9 @@ def user_dashboard():
     if registro_hoy and registro_hoy.get('inicio') and not registro_hoy.get('salida'):
         attendance_status = 'active'
 
-    # Obtener registros del usuario
+    # Obtener los registros que se muestran: las últimas 7 fechas (índice UNIQUE (id_usuario, fecha))
     cursor.execute(
-        "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC",
+        "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC LIMIT 7",
         (usuario_id,)
     )
     registros_db = cursor.fetchall()
@@ -929,27 +2350,12 @@ def user_dashboard():
     for reg in registros_db:
         fechas_horas[reg['fecha'].isoformat()] = float(reg['horas_trabajadas'])
 
-    fechas_ordenadas = sorted(fechas_horas.keys())[-7:]
+    fechas_ordenadas = sorted(fechas_horas.keys())
     horas_fechas = [fechas_horas.get(fecha, 0) for fecha in fechas_ordenadas]
 
-    # Estadísticas básicas para el usuario
-    contador_inicios = len(registros_db)
-    costo_horas_extras = 0
-    salario_minimo = 1384308
-    valor_hora_ordinaria = salario_minimo / (30 * 8)
-
-    for reg in registros_db:
-        horas_extras = float(reg['horas_extras'])
-        try:
-            fecha_obj = reg['fecha']
-            dia_semana = fecha_obj.weekday()
-            if dia_semana >= 5:
-                multiplicador = 1.75 if dia_semana == 5 else 2.0
-            else:
-                multiplicador = 1.25
-            costo_horas_extras += horas_extras * valor_hora_ordinaria * multiplicador
-        except:
-            pass
+    # Estadísticas de toda la vida del usuario, desde su resumen anual
+    valor_hora_ordinaria = motor_costos.valor_hora(year)
+    contador_inicios, costo_horas_extras = totales_historicos_usuario(cursor, usuario_id)
     
     cursor.close()
     conn.close()
@@ -970,6 +2376,7 @@ def user_dashboard():
 # ✅ Dashboard - Usuarios normales ven solo su info, admins ven todo
 @app.route('/dashboard')
 @login_required
+@respuesta_condicional('dashboard')
 def dashboard():
     if not current_user.is_authenticated:
         flash('Debes iniciar sesión primero', 'error')
@@ -988,13 +2395,13 @@ def dashboard():
     usuarios_iniciados_hoy = 0
     total_usuarios_nuevos = 0
     fechas_ordenadas = [] # FIX 5: Inicializar variable
+    horas_fechas = []
+    total_registros = 0
     turnos_usuarios = {}  # ✅ NUEVO: Almacenar turnos seleccionados por usuario
 
-    salario_minimo = 1384308
-    valor_hora_ordinaria = salario_minimo / (30 * 8)
-
     year = now_local().year
     hoy_date = now_local().date()
+    valor_hora_ordinaria = motor_costos.valor_hora(year)
     hoy_iso = hoy_date.isoformat()
 
     # FIX 3: Calcular estado de asistencia para el usuario actual
@@ -1009,81 +2416,34 @@ def dashboard():
             attendance_status = 'active'
 
     if admin:
-        cursor.execute("SELECT id, username, nombre FROM usuarios")
-        all_users = cursor.fetchall()
-        total_usuarios_nuevos = len(all_users)
-
-        for user_info in all_users:
-            user_id = user_info['id']
-            username = user_info['username']
-            
-            # Obtener registros de asistencia
-            cursor.execute(
-                "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC",
-                (user_id,)
-            )
-            user_registros_db = cursor.fetchall()
-            
-            registros_limpios[username] = {}
-            for reg in user_registros_db:
-                # ✅ Incluir hora de inicio/salida en formato HH:MM
-                inicio_time = None
-                salida_time = None
-                if reg['inicio']:
-                    inicio_dt = reg['inicio']
-                    inicio_time = f"{inicio_dt.hour:02d}:{inicio_dt.minute:02d}"
-                if reg['salida']:
-                    salida_dt = reg['salida']
-                    salida_time = f"{salida_dt.hour:02d}:{salida_dt.minute:02d}"
-                
-                registros_limpios[username][reg['fecha'].isoformat()] = {
-                    'inicio': reg['inicio'].isoformat() if reg['inicio'] else None,
-                    'salida': reg['salida'].isoformat() if reg['salida'] else None,
-                    'inicio_time': inicio_time,  # ✅ NUEVO
-                    'salida_time': salida_time,  # ✅ NUEVO
-                    'horas_trabajadas': float(reg['horas_trabajadas']),
-                    'horas_extras': float(reg['horas_extras'])
-                }
-            
-            contador_inicios[username] = len(user_registros_db)
-            
-            costo_total_user = 0
-            for reg in user_registros_db:
-                horas_extras = float(reg['horas_extras'])
-                try:
-                    fecha_obj = reg['fecha']
-                    dia_semana = fecha_obj.weekday()
-                    multiplicador = 1.75 if dia_semana == 5 else (2.0 if dia_semana == 6 else 1.25)
-                    costo_total_user += horas_extras * valor_hora_ordinaria * multiplicador
-                except:
-                    pass
-            costos_por_usuario[username] = round(costo_total_user, 2)
-
-            if hoy_iso in registros_limpios[username] and registros_limpios[username][hoy_iso].get('inicio'):
-                usuarios_iniciados_hoy += 1
-            
-            # ✅ NUEVO: Obtener turnos seleccionados del usuario
-            cursor.execute("""
-                SELECT td.dia_semana, td.hora
-                FROM turnos_asignados ta
-                JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-                WHERE ta.id_usuario = %s
-                ORDER BY CASE td.dia_semana
-                    WHEN 'monday' THEN 1 WHEN 'tuesday' THEN 2 WHEN 'wednesday' THEN 3
-                    WHEN 'thursday' THEN 4 WHEN 'friday' THEN 5 WHEN 'saturday' THEN 6 ELSE 7
-                END, td.hora
-            """, (user_id,))
-            turnos_db = cursor.fetchall()
-            turnos_usuarios[username] = [(t['dia_semana'], t['hora']) for t in turnos_db]
-        
-        fechas_horas = {}
-        cursor.execute("SELECT fecha, SUM(horas_trabajadas) as total_horas FROM registros_asistencia GROUP BY fecha ORDER BY fecha DESC LIMIT 7")
-        fechas_horas_db = cursor.fetchall()
-        for fh in fechas_horas_db:
-            fechas_horas[fh['fecha'].isoformat()] = float(fh['total_horas'])
-
-        fechas_ordenadas = sorted(fechas_horas.keys())
-        horas_fechas = [fechas_horas.get(fecha, 0) for fecha in fechas_ordenadas]
+        # Totales por usuario y año desde los resúmenes anuales: número de registros,
+        # horas extras ponderadas por recargo (ver MotorCostos) y si inició hoy.
+        # El año permite valorar las extras con la tarifa que correspondía.
+        cursor.execute("""
+            SELECT u.id, u.username, u.nombre,
+                   EXTRACT(YEAR FROM r.inicio)::int AS ano,
+                   COALESCE(SUM(r.registros), 0) AS total_registros,
+                   COALESCE(SUM(r.extras_ponderadas), 0) AS extras_ponderadas,
+                   COALESCE(BOOL_OR(ra.inicio IS NOT NULL), FALSE) AS inicio_hoy
+            FROM usuarios u
+            LEFT JOIN resumen_asistencia r ON r.id_usuario = u.id AND r.periodo = 'ano'
+            LEFT JOIN registros_asistencia ra ON ra.id_usuario = u.id AND ra.fecha = %s
+            GROUP BY u.id, u.username, u.nombre, ano
+        """, (hoy_date,))
+        totales_usuarios = cursor.fetchall()
+        iniciaron_hoy = set()
+
+        for fila in totales_usuarios:
+            username = fila['username']
+            ano = fila['ano'] or year
+            contador_inicios[username] = contador_inicios.get(username, 0) + fila['total_registros']
+            costos_por_usuario[username] = costos_por_usuario.get(username, 0) + float(fila['extras_ponderadas']) * motor_costos.valor_hora(ano)
+            total_registros += fila['total_registros']
+            if fila['inicio_hoy']:
+                iniciaron_hoy.add(username)
+        costos_por_usuario = {username: round(costo, 2) for username, costo in costos_por_usuario.items()}
+        total_usuarios_nuevos = len(contador_inicios)
+        usuarios_iniciados_hoy = len(iniciaron_hoy)
         
         costo_total_empresa = sum(costos_por_usuario.values())
 
@@ -1093,8 +2453,9 @@ def dashboard():
         nombre = current_user.nombre
         total_usuarios_nuevos = 1
 
+        # Solo la ventana que se grafica: las últimas 7 fechas con registro
         cursor.execute(
-            "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC",
+            "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC LIMIT 7",
             (usuario_id,)
         )
         user_registros_db = cursor.fetchall()
@@ -1120,12 +2481,13 @@ def dashboard():
                 'horas_extras': float(reg['horas_extras'])
             }
         
-        contador_inicios = {username: len(user_registros_db)}
+        total_registros, _ = totales_historicos_usuario(cursor, usuario_id)
+        contador_inicios = {username: total_registros}
 
         fechas_horas_filtradas = {}
         for reg in user_registros_db:
             fechas_horas_filtradas[reg['fecha'].isoformat()] = float(reg['horas_trabajadas'])
-        fechas_ordenadas = sorted(fechas_horas_filtradas.keys())[-7:]
+        fechas_ordenadas = sorted(fechas_horas_filtradas.keys())
         horas_fechas = [fechas_horas_filtradas.get(fecha, 0) for fecha in fechas_ordenadas]
         
         # --- Ocultar costos para usuarios normales ---
@@ -1150,137 +2512,147 @@ def dashboard():
 
     # Obtener offset de semana para la tabla del dashboard
     semana_offset = request.args.get('semana_offset', 0, type=int)
-
-    # Obtener turnos de la semana actual para la tabla del dashboard
-    turnos_semana_actual = {}
     inicio_semana = (hoy_date - datetime.timedelta(days=hoy_date.weekday())) + datetime.timedelta(weeks=semana_offset)
     fin_semana = inicio_semana + datetime.timedelta(days=6)
-    
-    params = [inicio_semana, fin_semana]
-
-    # CORRECCIÓN: Separar la lógica para admin y para usuario normal
-    if admin:
-        # El admin ve la tabla con todos los usuarios
-        cursor.execute("SELECT username, nombre FROM usuarios WHERE bloqueado IS NOT TRUE AND admin IS NOT TRUE ORDER BY nombre")
-        all_active_users = cursor.fetchall()
-        turnos_semana_actual = {user['username']: {} for user in all_active_users}
+    inicio_mes, fin_mes = rango_mes(hoy_date.year, hoy_date.month)
+
+    # Las tablas de la semana y del mes se sirven desde la caché de fragmentos mientras
+    # no cambie la versión de los datos (ver CacheFragmentos). Los admins comparten
+    # fragmentos; cada usuario normal tiene los suyos.
+    ambito = 'admin' if admin else current_user.id
+    version = version_datos(cursor)
+
+    def generar_semana():
+        # Obtener turnos de la semana actual para la tabla del dashboard
+        turnos_semana_actual = {}
+        params = [inicio_semana, fin_semana]
+
+        # CORRECCIÓN: Separar la lógica para admin y para usuario normal
+        if admin:
+            # El admin ve la tabla con todos los usuarios
+            cursor.execute("SELECT username, nombre FROM usuarios WHERE bloqueado IS NOT TRUE AND admin IS NOT TRUE ORDER BY nombre")
+            all_active_users = cursor.fetchall()
+            turnos_semana_actual = {user['username']: {} for user in all_active_users}
         
-        query_turnos = """
-            SELECT u.username, ta.fecha_asignacion, td.hora
-            FROM turnos_asignados ta
-            JOIN usuarios u ON ta.id_usuario = u.id AND u.admin IS NOT TRUE
-            JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-            WHERE ta.fecha_asignacion BETWEEN %s AND %s
-        """
-    else:
-        # El usuario normal solo debe verse a sí mismo en la tabla
-        turnos_semana_actual = {current_user.username: {}}
-        query_turnos = """
-            SELECT u.username, ta.fecha_asignacion, td.hora
-            FROM turnos_asignados ta
-            JOIN usuarios u ON ta.id_usuario = u.id
-            JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-            WHERE ta.fecha_asignacion BETWEEN %s AND %s AND u.id = %s
+            query_turnos = """
+                SELECT u.username, ta.fecha_asignacion, td.hora
+                FROM turnos_asignados ta
+                JOIN usuarios u ON ta.id_usuario = u.id AND u.admin IS NOT TRUE
+                JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
+                WHERE ta.fecha_asignacion BETWEEN %s AND %s
+            """
+        else:
+            # El usuario normal solo debe verse a sí mismo en la tabla
+            turnos_semana_actual = {current_user.username: {}}
+            query_turnos = """
+                SELECT u.username, ta.fecha_asignacion, td.hora
+                FROM turnos_asignados ta
+                JOIN usuarios u ON ta.id_usuario = u.id
+                JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
+                WHERE ta.fecha_asignacion BETWEEN %s AND %s AND u.id = %s
+            """
+            params.append(current_user.id)
+
+        query_turnos += " ORDER BY u.nombre"
+        cursor.execute(query_turnos, tuple(params))
+
+        # Poblar la estructura con los turnos encontrados
+        for turno in cursor.fetchall():
+            fecha_str = turno['fecha_asignacion'].strftime('%Y-%m-%d')
+            if turno['username'] in turnos_semana_actual:
+                turnos_semana_actual[turno['username']][fecha_str] = datetime.datetime.strptime(turno['hora'], '%H:%M').strftime('%-I:%M %p')
+
+        # Obtener fechas de la semana actual
+        fechas_semana_actual = [inicio_semana + datetime.timedelta(days=i) for i in range(7)]
+
+        # ✅ NUEVO: Obtener registros de asistencia para la semana actual
+        registros_semana_actual = []
+        query_semana = """
+            SELECT u.nombre, ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas
+            FROM registros_asistencia ra
+            JOIN usuarios u ON ra.id_usuario = u.id
+            WHERE ra.fecha BETWEEN %s AND %s
         """
-        params.append(current_user.id)
-
-    query_turnos += " ORDER BY u.nombre"
-    cursor.execute(query_turnos, tuple(params))
-
-    # Poblar la estructura con los turnos encontrados
-    for turno in cursor.fetchall():
-        fecha_str = turno['fecha_asignacion'].strftime('%Y-%m-%d')
-        if turno['username'] in turnos_semana_actual:
-            turnos_semana_actual[turno['username']][fecha_str] = datetime.datetime.strptime(turno['hora'], '%H:%M').strftime('%-I:%M %p')
-
-    # Obtener fechas de la semana actual
-    fechas_semana_actual = [inicio_semana + datetime.timedelta(days=i) for i in range(7)]
-
-    # ✅ NUEVO: Obtener registros de asistencia para la semana actual
-    registros_semana_actual = []
-    query_semana = """
-        SELECT u.nombre, ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas
-        FROM registros_asistencia ra
-        JOIN usuarios u ON ra.id_usuario = u.id
-        WHERE ra.fecha BETWEEN %s AND %s
-    """
-    params_semana = [inicio_semana, fin_semana]
-
-    if admin:
-        query_semana += " AND u.admin IS NOT TRUE ORDER BY u.nombre, ra.fecha DESC"
-    else:
-        query_semana += " AND u.id = %s ORDER BY ra.fecha DESC"
-        params_semana.append(current_user.id)
+        params_semana = [inicio_semana, fin_semana]
 
-    cursor.execute(query_semana, tuple(params_semana))
-    registros_db = cursor.fetchall()
-    for reg in registros_db:
-        registros_semana_actual.append({
-            'usuario': reg['nombre'],
-            'fecha': reg['fecha'].strftime('%A, %d/%m/%Y'),
-            'inicio': reg['inicio'].strftime('%I:%M %p') if reg['inicio'] else '-',
-            'salida': reg['salida'].strftime('%I:%M %p') if reg['salida'] else '-',
-            'horas_trabajadas': float(reg['horas_trabajadas'] or 0.0)
-        })
-
-    # ✅ NUEVO: Obtener registros de asistencia para el mes actual
-    registros_mes_actual = []
-    inicio_mes = hoy_date.replace(day=1)
-    # Calcular el último día del mes
-    import calendar
-    _, num_dias = calendar.monthrange(hoy_date.year, hoy_date.month)
-    fin_mes = hoy_date.replace(day=num_dias)
+        if admin:
+            query_semana += " AND u.admin IS NOT TRUE ORDER BY u.nombre, ra.fecha DESC"
+        else:
+            query_semana += " AND u.id = %s ORDER BY ra.fecha DESC"
+            params_semana.append(current_user.id)
+
+        cursor.execute(query_semana, tuple(params_semana))
+        registros_db = cursor.fetchall()
+        for reg in registros_db:
+            registros_semana_actual.append({
+                'usuario': reg['nombre'],
+                'fecha': reg['fecha'].strftime('%A, %d/%m/%Y'),
+                'inicio': reg['inicio'].strftime('%I:%M %p') if reg['inicio'] else '-',
+                'salida': reg['salida'].strftime('%I:%M %p') if reg['salida'] else '-',
+                'horas_trabajadas': float(reg['horas_trabajadas'] or 0.0)
+            })
+        return render_template('dashboard_semana.html',
+                               turnos_semana_actual=turnos_semana_actual,
+                               fechas_semana_actual=fechas_semana_actual,
+                               registros_semana_actual=registros_semana_actual,
+                               semana_offset=semana_offset)
+
+    def generar_mes():
+        # ✅ NUEVO: Obtener registros de asistencia para el mes actual
+        registros_mes_actual = []
+
+        query_mes = """
+            SELECT u.nombre, ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas
+            FROM registros_asistencia ra
+            JOIN usuarios u ON ra.id_usuario = u.id
+            WHERE ra.fecha BETWEEN %s AND %s
+        """
+        params_mes = [inicio_mes, fin_mes]
 
-    query_mes = """
-        SELECT u.nombre, ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas
-        FROM registros_asistencia ra
-        JOIN usuarios u ON ra.id_usuario = u.id
-        WHERE ra.fecha BETWEEN %s AND %s
-    """
-    params_mes = [inicio_mes, fin_mes]
+        if admin:
+            query_mes += " AND u.admin IS NOT TRUE ORDER BY u.nombre, ra.fecha DESC"
+        else:
+            query_mes += " AND u.id = %s ORDER BY ra.fecha DESC"
+            params_mes.append(current_user.id)
+
+        cursor.execute(query_mes, tuple(params_mes))
+        for reg in cursor.fetchall():
+            registros_mes_actual.append({
+                'usuario': reg['nombre'],
+                'fecha': reg['fecha'].strftime('%A, %d/%m/%Y'),
+                'inicio': reg['inicio'].strftime('%I:%M %p') if reg['inicio'] else '-',
+                'salida': reg['salida'].strftime('%I:%M %p') if reg['salida'] else '-',
+                'horas_trabajadas': float(reg['horas_trabajadas'] or 0.0)
+            })
+        return render_template('dashboard_mes.html', registros_mes_actual=registros_mes_actual)
 
-    if admin:
-        query_mes += " AND u.admin IS NOT TRUE ORDER BY u.nombre, ra.fecha DESC"
-    else:
-        query_mes += " AND u.id = %s ORDER BY ra.fecha DESC"
-        params_mes.append(current_user.id)
-
-    cursor.execute(query_mes, tuple(params_mes))
-    for reg in cursor.fetchall():
-        registros_mes_actual.append({
-            'usuario': reg['nombre'],
-            'fecha': reg['fecha'].strftime('%A, %d/%m/%Y'),
-            'inicio': reg['inicio'].strftime('%I:%M %p') if reg['inicio'] else '-',
-            'salida': reg['salida'].strftime('%I:%M %p') if reg['salida'] else '-',
-            'horas_trabajadas': float(reg['horas_trabajadas'] or 0.0)
-        })
+    fragmento_semana = fragmentos_dashboard.obtener('semana', (ambito, inicio_semana, semana_offset), version, generar_semana)
+    fragmento_mes = fragmentos_dashboard.obtener('mes', (ambito, inicio_mes), version, generar_mes)
 
     # ✅ NUEVO: Calcular resumen de horas extras para el admin
     resumen_horas_extras = []
     if admin:
-        cursor.execute("SELECT id, username, nombre FROM usuarios WHERE bloqueado IS NOT TRUE AND admin IS NOT TRUE")
-        todos_usuarios = cursor.fetchall()
-        
-        for usuario in todos_usuarios:
-            # Extras del día
-            cursor.execute("SELECT SUM(horas_extras) FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s", (usuario['id'], hoy_date))
-            extras_hoy = cursor.fetchone()[0] or 0.0
-
-            # Extras de la semana
-            cursor.execute("SELECT SUM(horas_extras) FROM registros_asistencia WHERE id_usuario = %s AND fecha BETWEEN %s AND %s", (usuario['id'], inicio_semana, fin_semana))
-            extras_semana = cursor.fetchone()[0] or 0.0
-
-            # Extras del mes
-            inicio_mes = hoy_date.replace(day=1)
-            fin_mes = (inicio_mes + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
-            cursor.execute("SELECT SUM(horas_extras) FROM registros_asistencia WHERE id_usuario = %s AND fecha BETWEEN %s AND %s", (usuario['id'], inicio_mes, fin_mes))
-            extras_mes = cursor.fetchone()[0] or 0.0
-
+        # Extras del día, de la semana mostrada y del mes, por usuario, con agregación condicional
+        desde = min(hoy_date, inicio_semana, inicio_mes)
+        hasta = max(hoy_date, fin_semana, fin_mes)
+        cursor.execute("""
+            SELECT u.nombre,
+                   COALESCE(SUM(ra.horas_extras) FILTER (WHERE ra.fecha = %s), 0) AS hoy,
+                   COALESCE(SUM(ra.horas_extras) FILTER (WHERE ra.fecha BETWEEN %s AND %s), 0) AS semana,
+                   COALESCE(SUM(ra.horas_extras) FILTER (WHERE ra.fecha BETWEEN %s AND %s), 0) AS mes
+            FROM usuarios u
+            LEFT JOIN registros_asistencia ra ON ra.id_usuario = u.id AND ra.fecha BETWEEN %s AND %s
+            WHERE u.bloqueado IS NOT TRUE AND u.admin IS NOT TRUE
+            GROUP BY u.id, u.nombre
+            ORDER BY u.id
+        """, (hoy_date, inicio_semana, fin_semana, inicio_mes, fin_mes, desde, hasta))
+
+        for usuario in cursor.fetchall():
             resumen_horas_extras.append({
                 'nombre': usuario['nombre'],
-                'hoy': float(extras_hoy),
-                'semana': float(extras_semana),
-                'mes': float(extras_mes)
+                'hoy': float(usuario['hoy']),
+                'semana': float(usuario['semana']),
+                'mes': float(usuario['mes'])
             })
         # Ordenar por el que más horas extras tiene en el mes
         resumen_horas_extras.sort(key=lambda x: x['mes'], reverse=True)
@@ -1290,19 +2662,37 @@ def dashboard():
 
     # ✅ SOLUCIÓN DEFINITIVA: Construir el diccionario de datos para los gráficos
     # Esto es lo que faltaba y causaba que el JavaScript se viera en la pantalla.
-    cursor.execute("SELECT username, cargo FROM usuarios WHERE bloqueado IS NOT TRUE")
-    all_users_for_charts = cursor.fetchall()
-    usuarios_chart_data = {u['username']: {'cargo': u['cargo']} for u in all_users_for_charts}
-
-    server_data = {
-        "fechas": fechas_ordenadas,
-        "horas": horas_fechas,
-        "contadores": contador_inicios,
-        "costos": costos_por_usuario,
-        "usuarios": usuarios_chart_data
-    }
-    # Convertir a JSON para pasarlo de forma segura a la plantilla
-    server_data_json = json.dumps(server_data, default=str) # default=str para manejar fechas
+    def generar_graficos():
+        fechas, horas = fechas_ordenadas, horas_fechas
+        if admin:
+            # Últimas 7 fechas con registros, desde los resúmenes diarios
+            cursor.execute("""
+                SELECT inicio AS fecha, SUM(horas_trabajadas) AS total_horas
+                FROM resumen_asistencia
+                WHERE periodo = 'dia' AND inicio IN (
+                    SELECT DISTINCT inicio FROM resumen_asistencia WHERE periodo = 'dia' ORDER BY inicio DESC LIMIT 7
+                )
+                GROUP BY inicio ORDER BY inicio DESC
+            """)
+            fechas_horas = {fh['fecha'].isoformat(): float(fh['total_horas']) for fh in cursor.fetchall()}
+            fechas = sorted(fechas_horas.keys())
+            horas = [fechas_horas.get(fecha, 0) for fecha in fechas]
+
+        cursor.execute("SELECT username, cargo FROM usuarios WHERE bloqueado IS NOT TRUE")
+        all_users_for_charts = cursor.fetchall()
+        usuarios_chart_data = {u['username']: {'cargo': u['cargo']} for u in all_users_for_charts}
+
+        server_data = {
+            "fechas": fechas,
+            "horas": horas,
+            "contadores": contador_inicios,
+            "costos": costos_por_usuario,
+            "usuarios": usuarios_chart_data
+        }
+        # Convertir a JSON para pasarlo de forma segura a la plantilla
+        return json.dumps(server_data, default=str) # default=str para manejar fechas
+
+    server_data_json = fragmentos_dashboard.obtener('graficos', (ambito, hoy_date), version, generar_graficos)
 
 
     cursor.close()
@@ -1311,11 +2701,10 @@ def dashboard():
     return render_template(
         'dashboard.html',
         registros=registros_limpios or {},
+        total_registros=total_registros,
         admin=admin,
         nombre=current_user.nombre,
         year=year,
-        fechas=fechas_ordenadas or [],
-        horas_fechas=horas_fechas or [],
         usuarios_iniciados_hoy=usuarios_iniciados_hoy,
         contador_inicios=contador_inicios or {},
         total_usuarios_nuevos=total_usuarios_nuevos,
@@ -1323,9 +2712,7 @@ def dashboard():
         costo_total_empresa=costo_total_empresa,
         valor_hora_ordinaria=round(valor_hora_ordinaria, 2),
         data={'usuarios': {}, 'turnos': {'shifts': {}, 'monthly_assignments': {}}},
-        turnos_semana_actual=turnos_semana_actual,
         turnos_usuarios=turnos_usuarios,  # ✅ NUEVO: Pasar turnos seleccionados
-        fechas_semana_actual=fechas_semana_actual,
         calendario_semanal_usuario=calendario_semanal_usuario,
         semana_offset=semana_offset, # Pasar offset a la plantilla
         attendance_status=attendance_status, # FIX 3: Pasar estado de asistencia
@@ -1333,59 +2720,10 @@ def dashboard():
         form=form,  # ✅ Pasar el formulario a la plantilla
         resumen_horas_extras=resumen_horas_extras, # ✅ NUEVO: Pasar resumen de extras
         server_data_json=server_data_json,
-        registros_semana_actual=registros_semana_actual,
-        registros_mes_actual=registros_mes_actual # ✅ NUEVO: Pasar registros del mes
+        fragmento_semana=fragmento_semana, # Tablas de la semana (caché de fragmentos)
+        fragmento_mes=fragmento_mes # ✅ NUEVO: Registros del mes (caché de fragmentos)
     )
 
-# ✅ Marcar inicio
-@app.route('/marcar_inicio', methods=['POST'])
-@login_required
-def marcar_inicio():
-    if not current_user.is_authenticated:
-        return redirect(url_for('login'))
-
-    form = EmptyForm()
-    if form.validate_on_submit():
-        # ✅ FIX: Usar la hora del cliente (navegador) para mayor precisión.
-        # Si no llega, usar la del servidor como respaldo.
-        client_timestamp = request.form.get('client_timestamp')
-
-        conn = None
-        cursor = None
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            usuario_id = current_user.id
-            hoy = today_local_iso()
-            
-            # FIX: Convertir el timestamp del cliente (UTC) a la zona horaria local del servidor
-            if client_timestamp:
-                ahora = datetime.datetime.fromisoformat(client_timestamp.replace('Z', '+00:00')).astimezone(TZ)
-            else:
-                ahora = now_local()
-            ahora_iso = ahora.isoformat()
-
-            cursor.execute(
-                "SELECT id FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s AND inicio IS NOT NULL",
-                (usuario_id, hoy)
-            )
-            if cursor.fetchone():
-                flash('Ya registraste tu inicio hoy', 'error')
-            else:
-                logger.info(f"Inserting registro asistencia inicio: id_usuario={usuario_id}, fecha={hoy}")
-                cursor.execute("INSERT INTO registros_asistencia (id_usuario, fecha, inicio) VALUES (%s, %s, %s) ON CONFLICT (id_usuario, fecha) DO NOTHING", (usuario_id, hoy, ahora_iso))
-                conn.commit()
-                flash('Hora de inicio registrada.', 'message')
-        except Exception as e:
-            flash(f'Error al registrar inicio: {e}', 'error')
-            logger.error(f"Error al marcar inicio para {current_user.username}: {e}")
-        finally:
-            if cursor: cursor.close()
-            if conn: conn.close()
-
-    return redirect(url_for('dashboard'))
-
 def calcular_horas(inicio_iso, fin_iso):
     """
     Calcula horas netas (descontando 1h almuerzo) y horas extras (>8h netas).
@@ -1413,197 +2751,509 @@ def calcular_horas(inicio_iso, fin_iso):
         # Captura errores si las fechas son inválidas o nulas
         return 0.0, 0.0
 
-# ✅ Marcar salida
-@app.route('/marcar_salida', methods=['POST'])
-@login_required
-def marcar_salida():
-    if not current_user.is_authenticated:
-        return redirect(url_for('login'))
+def _sql_horas(inicio, salida):
+    """Misma regla que calcular_horas, como expresiones SQL (ordinarias, extras)."""
+    brutas = f"(EXTRACT(EPOCH FROM ({salida} - {inicio}))::numeric / 3600)"
+    netas = f"(CASE WHEN {brutas} > 5 THEN {brutas} - 1 ELSE {brutas} END)"
+    return f"ROUND(LEAST(8, {netas}), 2)", f"ROUND(GREATEST(0, {netas} - 8), 2)"
+
+_ORDINARIAS_ALTERNAR, _EXTRAS_ALTERNAR = _sql_horas('registros_asistencia.inicio', 'EXCLUDED.inicio')
+_ORDINARIAS_SALIDA, _EXTRAS_SALIDA = _sql_horas('inicio', '%(ahora)s')
+
+# Una sola sentencia por marcación: el candado de fila de ON CONFLICT / UPDATE serializa
+# los clics simultáneos del mismo usuario, sin SELECT previo ni ventana de carrera.
+SQL_MARCACION = {
+    # Entrada. Si la fila ya existe (p. ej. creada por el admin sin inicio) solo se completa.
+    'inicio': """
+        INSERT INTO registros_asistencia (id_usuario, fecha, inicio) VALUES (%(usuario)s, %(fecha)s, %(ahora)s)
+        ON CONFLICT (id_usuario, fecha) DO UPDATE SET inicio = EXCLUDED.inicio
+        WHERE registros_asistencia.inicio IS NULL
+        RETURNING inicio, salida, horas_trabajadas, horas_extras""",
+    # Salida. Sin entrada pendiente no hay fila que insertar, por eso es un UPDATE.
+    'salida': f"""
+        UPDATE registros_asistencia
+        SET salida = %(ahora)s, horas_trabajadas = {_ORDINARIAS_SALIDA}, horas_extras = {_EXTRAS_SALIDA}
+        WHERE id_usuario = %(usuario)s AND fecha = %(fecha)s AND inicio IS NOT NULL AND salida IS NULL
+        RETURNING inicio, salida, horas_trabajadas, horas_extras""",
+    # Entrada/salida inteligente: inserta la entrada (o la completa en una fila sin inicio,
+    # como 'inicio') o, si está pendiente, cierra la jornada.
+    'alternar': f"""
+        INSERT INTO registros_asistencia (id_usuario, fecha, inicio) VALUES (%(usuario)s, %(fecha)s, %(ahora)s)
+        ON CONFLICT (id_usuario, fecha) DO UPDATE
+        SET inicio = CASE WHEN registros_asistencia.inicio IS NULL THEN EXCLUDED.inicio ELSE registros_asistencia.inicio END,
+            salida = CASE WHEN registros_asistencia.inicio IS NULL THEN registros_asistencia.salida ELSE EXCLUDED.inicio END,
+            horas_trabajadas = CASE WHEN registros_asistencia.inicio IS NULL THEN registros_asistencia.horas_trabajadas
+                                    ELSE {_ORDINARIAS_ALTERNAR} END,
+            horas_extras = CASE WHEN registros_asistencia.inicio IS NULL THEN registros_asistencia.horas_extras
+                                ELSE {_EXTRAS_ALTERNAR} END
+        WHERE (registros_asistencia.inicio IS NOT NULL AND registros_asistencia.salida IS NULL)
+           OR registros_asistencia.inicio IS NULL
+        RETURNING inicio, salida, horas_trabajadas, horas_extras""",
+}
+
+def marcar_registro(cursor, usuario_id, fecha, ahora, accion='alternar'):
+    """
+    Registra una marcación ('inicio', 'salida' o 'alternar') en una sola sentencia y
+    actualiza el resumen en la misma transacción (el commit es del llamador).
+    Devuelve {'evento': 'inicio'|'salida', 'horas_trabajadas', 'horas_extras'}, o None
+    si no había nada que marcar (entrada ya registrada / sin entrada pendiente).
+    """
+    cursor.execute(SQL_MARCACION[accion], {'usuario': usuario_id, 'fecha': fecha, 'ahora': ahora})
+    fila = cursor.fetchone()
+    if fila is None:
+        return None
+    actualizar_resumen_asistencia(cursor, [(usuario_id, fecha)])
+    return {
+        'evento': 'inicio' if fila['salida'] is None else 'salida',
+        'inicio': fila['inicio'],
+        'salida': fila['salida'],
+        'horas_trabajadas': float(fila['horas_trabajadas'] or 0),
+        'horas_extras': float(fila['horas_extras'] or 0),
+    }
+
+def hora_marcacion(client_timestamp):
+    """
+    Hora de la marcación: la del cliente (ISO, UTC) en la zona local, o la del servidor.
+    Un valor que no es un ISO válido (también un número en el JSON) lanza ValueError.
+    """
+    # FIX: Convertir el timestamp del cliente (UTC) a la zona horaria local del servidor
+    if client_timestamp:
+        return datetime.datetime.fromisoformat(str(client_timestamp).replace('Z', '+00:00')).astimezone(TZ)
+    return now_local()
 
+def _marcar(accion, mensajes):
+    """Camino común de /marcar_inicio, /marcar_salida y /marcar_asistencia."""
     form = EmptyForm()
-    if form.validate_on_submit():
+    if not form.validate_on_submit():
+        return redirect(url_for('dashboard'))
+
+    # ✅ FIX: Usar la hora del cliente (navegador) para mayor precisión.
+    # Si no llega, usar la del servidor como respaldo.
+    client_timestamp = request.form.get('client_timestamp')
+
+    conn = None
+    cursor = None
+    try:
+        ahora = hora_marcacion(client_timestamp)
         conn = get_db_connection()
         cursor = conn.cursor()
-
-        # ✅ FIX: Usar la hora del cliente (navegador) para mayor precisión.
-        client_timestamp = request.form.get('client_timestamp')
-        
-        # FIX: Convertir el timestamp del cliente (UTC) a la zona horaria local del servidor
-        if client_timestamp:
-            ahora = datetime.datetime.fromisoformat(client_timestamp.replace('Z', '+00:00')).astimezone(TZ)
+        resultado = marcar_registro(cursor, current_user.id, today_local_iso(), ahora, accion)
+        if resultado is None:
+            flash(mensajes['sin_cambios'], 'error')
         else:
-            ahora = now_local()
-
-        usuario_id = current_user.id
-        hoy = today_local_iso()
+            conn.commit()
+            logger.info(f"Marcación {resultado['evento']} de {current_user.username}")
+            flash(mensajes[resultado['evento']].format(**resultado), 'message')
+    except Exception as e:
+        if conn: conn.rollback()
+        flash(f'Error al registrar la marcación: {e}', 'error')
+        logger.error(f"Error al marcar {accion} para {current_user.username}: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
 
-        cursor.execute(
-            "SELECT id, inicio FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s AND inicio IS NOT NULL AND salida IS NULL",
-            (usuario_id, hoy)
-        )
-        registro_existente = cursor.fetchone()
+    return redirect(url_for('dashboard'))
 
-        if registro_existente:
-            inicio_iso = registro_existente['inicio']
-            horas_ordinarias, horas_extras = calcular_horas(inicio_iso, ahora)
-            
-            try:
-                cursor.execute(
-                    "UPDATE registros_asistencia SET salida = %s, horas_trabajadas = %s, horas_extras = %s WHERE id = %s",
-                    (ahora.isoformat(), horas_ordinarias, horas_extras, registro_existente['id'])
-                )
-                conn.commit()
-                flash(f'Salida registrada. Horas trabajadas: {horas_ordinarias}h, Extras: {horas_extras}h', 'message')
-            except Exception as e:
-                flash(f'Error al registrar salida: {e}', 'error')
-                logger.error(f"Error al marcar salida para {current_user.username}: {e}")
-        else:
-            flash('No hay registro de inicio pendiente.', 'error')
-        
-        cursor.close()
-        conn.close()
+# ✅ Marcar inicio
+@app.route('/marcar_inicio', methods=['POST'])
+@login_required
+def marcar_inicio():
+    return _marcar('inicio', {
+        'inicio': 'Hora de inicio registrada.',
+        'sin_cambios': 'Ya registraste tu inicio hoy',
+    })
 
-    return redirect(url_for('dashboard'))
+# ✅ Marcar salida
+@app.route('/marcar_salida', methods=['POST'])
+@login_required
+def marcar_salida():
+    return _marcar('salida', {
+        'salida': 'Salida registrada. Horas trabajadas: {horas_trabajadas}h, Extras: {horas_extras}h',
+        'sin_cambios': 'No hay registro de inicio pendiente.',
+    })
 
 # ✅ Marcar asistencia (Entrada/Salida inteligente)
 @app.route('/marcar_asistencia', methods=['POST'])
 @login_required
 def marcar_asistencia():
-    if not current_user.is_authenticated:
-        return redirect(url_for('login'))
+    return _marcar('alternar', {
+        'inicio': '✅ Hora de inicio registrada',
+        'salida': '✅ Salida registrada. Horas trabajadas: {horas_trabajadas}h, Extras: {horas_extras}h',
+        'sin_cambios': 'Ya registraste tu inicio hoy',
+    })
+
+# ✅ API JSON de marcación (kioscos y clientes móviles)
+# Autenticación con token firmado (Authorization: Bearer ...): verificarlo no consulta la base,
+# y el usuario sale de cache_usuarios, así que una marcación cuesta solo su sentencia y el resumen.
+API_TOKEN_TTL = int(os.environ.get('API_TOKEN_TTL_DIAS', '30')) * 86400
+serializador_tokens_api = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='api-marcacion')
+
+def emitir_token_api(usuario_id):
+    return serializador_tokens_api.dumps({'id': int(usuario_id)})
+
+def usuario_de_token_api(token):
+    """Usuario dueño del token, o None si es inválido, venció o la cuenta está bloqueada."""
+    try:
+        datos = serializador_tokens_api.loads(token, max_age=API_TOKEN_TTL)
+    except (BadSignature, SignatureExpired):
+        return None
+    user = load_user(datos.get('id'))
+    if user is None or user.bloqueado:
+        return None
+    return user
+
+def token_api_requerido(funcion):
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+        user = usuario_de_token_api(token.strip()) if esquema.lower() == 'bearer' else None
+        if user is None:
+            return jsonify({'success': False, 'error': 'Token inválido o vencido'}), 401
+        g.usuario_api = user
+        return funcion(*args, **kwargs)
+    return envoltura
+
+def _estado_marcacion(fecha, inicio, salida, horas_trabajadas, horas_extras):
+    return {
+        'fecha': str(fecha),
+        'estado': 'sin_marcar' if inicio is None else ('en_jornada' if salida is None else 'jornada_cerrada'),
+        'inicio': inicio.isoformat() if inicio else None,
+        'salida': salida.isoformat() if salida else None,
+        'horas_trabajadas': horas_trabajadas,
+        'horas_extras': horas_extras,
+    }
 
-    form = EmptyForm()
-    if form.validate_on_submit():
-        conn = get_db_connection()
-        cursor = conn.cursor()
+def _cuerpo_json():
+    """Cuerpo JSON de la petición como dict ({} si no hay), o None si no es un objeto JSON."""
+    datos = request.get_json(silent=True)
+    if datos is None:
+        return {}
+    return datos if isinstance(datos, dict) else None
 
-        # ✅ FIX: Usar la hora del cliente (navegador) para mayor precisión.
-        client_timestamp = request.form.get('client_timestamp')
-        
-        # FIX: Convertir el timestamp del cliente (UTC) a la zona horaria local del servidor
-        if client_timestamp:
-            ahora = datetime.datetime.fromisoformat(client_timestamp.replace('Z', '+00:00')).astimezone(TZ)
-        else:
-            ahora = now_local()
+@app.route('/api/token', methods=['POST'])
+@csrf.exempt
+@limiter.limit("20 per minute")
+def api_token():
+    datos = _cuerpo_json()
+    if datos is None:
+        return jsonify({'success': False, 'error': 'Se esperaba un objeto JSON'}), 400
+    username = str(datos.get('usuario', '')).strip()
+    contrasena = str(datos.get('contrasena', ''))
 
-        usuario_id = current_user.id
-        hoy = today_local_iso()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, contrasena, bloqueado FROM usuarios WHERE username = %s", (username,))
+    user_data = cursor.fetchone()
+    cursor.close()
+    conn.close()
 
-        # Verificar si ya marcó entrada hoy y no ha marcado salida
-        cursor.execute(
-            "SELECT id, inicio FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s AND inicio IS NOT NULL AND salida IS NULL",
-            (usuario_id, hoy)
-        )
-        registro_pendiente = cursor.fetchone()
+    if not user_data or user_data['bloqueado'] or not check_password_hash(user_data['contrasena'], contrasena):
+        logger.warning(f"Token API denegado para usuario: {username}")
+        return jsonify({'success': False, 'error': 'Usuario o contraseña incorrectos'}), 401
+    return jsonify({'success': True, 'token': emitir_token_api(user_data['id']), 'expira_en': API_TOKEN_TTL})
+
+@app.route('/api/marcar', methods=['POST'])
+@csrf.exempt
+@token_api_requerido
+def api_marcar():
+    """
+    Marca entrada/salida sin renderizar nada. Cuerpo JSON opcional:
+    {"accion": "alternar"|"inicio"|"salida", "client_timestamp": "2025-11-03T11:30:00Z"}.
+    Responde el estado del día y las horas calculadas; 409 si no había nada que marcar.
+    La hora del cliente debe ser de hoy y no estar en el futuro (con la misma tolerancia
+    de reloj que los lotes), para que no se puedan registrar horas a voluntad.
+    """
+    datos = _cuerpo_json()
+    if datos is None:
+        return jsonify({'success': False, 'error': 'Se esperaba un objeto JSON'}), 400
+    accion = datos.get('accion', 'alternar')
+    if not isinstance(accion, str) or accion not in SQL_MARCACION:
+        return jsonify({'success': False, 'error': 'Acción inválida'}), 400
+    try:
+        ahora = hora_marcacion(datos.get('client_timestamp'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'client_timestamp inválido'}), 400
+
+    user = g.usuario_api
+    hoy = today_local_iso()
+    if ahora > now_local() + LOTE_TOLERANCIA_FUTURO:
+        return jsonify({'success': False, 'error': 'client_timestamp en el futuro'}), 400
+    if ahora.date().isoformat() != hoy:
+        return jsonify({'success': False, 'error': 'client_timestamp no es de hoy'}), 400
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        resultado = marcar_registro(cursor, user.id, hoy, ahora, accion)
+        if resultado is not None:
+            conn.commit()
+            return jsonify({'success': True, 'evento': resultado['evento'],
+                            **_estado_marcacion(hoy, resultado['inicio'], resultado['salida'],
+                                                resultado['horas_trabajadas'], resultado['horas_extras'])})
+
+        # Nada que marcar: se informa el estado actual (con las horas en curso si la jornada sigue abierta)
+        cursor.execute("SELECT inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s",
+                       (user.id, hoy))
+        fila = cursor.fetchone()
+        if fila is None:
+            estado = _estado_marcacion(hoy, None, None, 0.0, 0.0)
+        elif fila['inicio'] is not None and fila['salida'] is None:
+            estado = _estado_marcacion(hoy, fila['inicio'], None, *calcular_horas(fila['inicio'], ahora))
+        else:
+            estado = _estado_marcacion(hoy, fila['inicio'], fila['salida'],
+                                       float(fila['horas_trabajadas'] or 0), float(fila['horas_extras'] or 0))
+        return jsonify({'success': False, 'error': 'No hay nada que marcar', **estado}), 409
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error en /api/marcar para {user.username}: {e}")
+        return jsonify({'success': False, 'error': 'Error al registrar la marcación'}), 500
+    finally:
+        cursor.close()
+        conn.close()
 
-        if registro_pendiente:
-            # Ya marcó entrada, ahora marcar salida
-            inicio_iso = registro_pendiente['inicio']
-            horas_ordinarias, horas_extras = calcular_horas(inicio_iso, ahora)
-            
-            try:
-                cursor.execute(
-                    "UPDATE registros_asistencia SET salida = %s, horas_trabajadas = %s, horas_extras = %s WHERE id = %s",
-                    (ahora.isoformat(), horas_ordinarias, horas_extras, registro_pendiente['id'])
-                )
-                conn.commit()
-                flash(f'✅ Salida registrada. Horas trabajadas: {horas_ordinarias}h, Extras: {horas_extras}h', 'message')
-            except Exception as e:
-                flash(f'Error al registrar salida: {e}', 'error')
-                logger.error(f"Error al marcar asistencia (salida) para {current_user.username}: {e}")
+# ✅ Marcaciones por lote (kioscos que estuvieron sin conexión)
+LOTE_MAX_MARCACIONES = 500
+LOTE_MAX_DIAS_ATRAS = 7                                   # Marcaciones más viejas se rechazan
+LOTE_TOLERANCIA_FUTURO = datetime.timedelta(minutes=5)    # Desfase de reloj aceptado en el kiosco
+
+# La primera marcación del día es la entrada y la última la salida. Al fusionar con la fila
+# existente se toman el mínimo y el máximo de todas las horas conocidas (LEAST/GREATEST
+# ignoran NULL), así reenviar o reordenar marcaciones siempre deja el mismo resultado.
+_LOTE_INICIO = "LEAST(registros_asistencia.inicio, registros_asistencia.salida, EXCLUDED.inicio, EXCLUDED.salida)"
+_LOTE_SALIDA = f"NULLIF(GREATEST(registros_asistencia.inicio, registros_asistencia.salida, EXCLUDED.inicio, EXCLUDED.salida), {_LOTE_INICIO})"
+_ORDINARIAS_LOTE, _EXTRAS_LOTE = _sql_horas(_LOTE_INICIO, _LOTE_SALIDA)
+
+SQL_UPSERT_LOTE = f"""
+    INSERT INTO registros_asistencia (id_usuario, fecha, inicio, salida, horas_trabajadas, horas_extras) VALUES %s
+    ON CONFLICT (id_usuario, fecha) DO UPDATE
+    SET inicio = {_LOTE_INICIO}, salida = {_LOTE_SALIDA},
+        horas_trabajadas = COALESCE({_ORDINARIAS_LOTE}, 0), horas_extras = COALESCE({_EXTRAS_LOTE}, 0)
+    RETURNING id_usuario, fecha, inicio, salida"""
+
+def _validar_marcacion_lote(item, ahora):
+    """Devuelve (clave, username, hora local) o lanza ValueError con el motivo."""
+    if not isinstance(item, dict):
+        raise ValueError('Marcación mal formada')
+    clave = str(item.get('clave') or '').strip()
+    username = str(item.get('usuario') or '').strip()
+    if not clave or len(clave) > 200:
+        raise ValueError('clave inválida')
+    if not username:
+        raise ValueError('usuario requerido')
+    try:
+        marcada = datetime.datetime.fromisoformat(str(item.get('client_timestamp', '')).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('client_timestamp inválido')
+    # Sin zona horaria la hora es ambigua: el kiosco debe enviarla en UTC o con su desfase
+    if marcada.tzinfo is None:
+        raise ValueError('client_timestamp sin zona horaria')
+    marcada = marcada.astimezone(TZ)
+    if marcada > ahora + LOTE_TOLERANCIA_FUTURO:
+        raise ValueError('client_timestamp en el futuro')
+    if marcada.date() < ahora.date() - datetime.timedelta(days=LOTE_MAX_DIAS_ATRAS):
+        raise ValueError(f'client_timestamp con más de {LOTE_MAX_DIAS_ATRAS} días')
+    return clave, username, marcada
+
+def registrar_marcaciones_lote(cursor, items, user):
+    """
+    Valida y escribe un lote de marcaciones [{clave, usuario, client_timestamp}] con un
+    número fijo de sentencias: usuarios, claves de idempotencia, upsert y resumen.
+    Un usuario no administrador solo puede enviar sus propias marcaciones.
+    Devuelve un resultado por item, en el mismo orden.
+    """
+    ahora = now_local()
+    resultados = [None] * len(items)
+    validas = {}  # clave -> (posición, username, hora)
+    for i, item in enumerate(items):
+        try:
+            clave, username, marcada = _validar_marcacion_lote(item, ahora)
+        except ValueError as e:
+            resultados[i] = {'estado': 'invalida', 'error': str(e)}
+            continue
+        if not user.admin and username != user.username:
+            resultados[i] = {'clave': clave, 'estado': 'invalida', 'error': 'Usuario no autorizado'}
+        elif clave in validas:
+            resultados[i] = {'clave': clave, 'estado': 'duplicada'}
         else:
-            # No ha marcado entrada hoy, marcar entrada
-            cursor.execute(
-                "SELECT id FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s AND inicio IS NOT NULL",
-                (usuario_id, hoy)
-            )
-            if cursor.fetchone():
-                flash('Ya registraste tu inicio hoy', 'error')
-            else:
-                try:
-                    logger.info(f"Inserting registro asistencia asistencia: id_usuario={usuario_id}, fecha={hoy}")
-                    cursor.execute(
-                        "INSERT INTO registros_asistencia (id_usuario, fecha, inicio) VALUES (%s, %s, %s) ON CONFLICT (id_usuario, fecha) DO NOTHING",
-                        (usuario_id, hoy, ahora.isoformat())
-                    )
-                    conn.commit()
-                    flash('✅ Hora de inicio registrada', 'message')
-                except Exception as e:
-                    flash(f'Error al registrar inicio: {e}', 'error')
-                    logger.error(f"Error al marcar asistencia (inicio) para {current_user.username}: {e}")
-        
+            validas[clave] = (i, username, marcada)
+
+    ids = {}
+    if validas:
+        cursor.execute("SELECT id, username FROM usuarios WHERE username = ANY(%s) AND bloqueado IS NOT TRUE",
+                       (sorted({u for _, u, _ in validas.values()}),))
+        ids = {fila['username']: fila['id'] for fila in cursor.fetchall()}
+    for clave, (i, username, _) in list(validas.items()):
+        if username not in ids:
+            resultados[i] = {'clave': clave, 'estado': 'invalida', 'error': 'Usuario inexistente o bloqueado'}
+            del validas[clave]
+
+    nuevas = set()
+    if validas:
+        filas = psycopg2.extras.execute_values(
+            cursor,
+            "INSERT INTO marcaciones_lote (clave, id_usuario, marcada_en) VALUES %s ON CONFLICT (clave) DO NOTHING RETURNING clave",
+            [(clave, ids[username], marcada) for clave, (_, username, marcada) in validas.items()],
+            page_size=len(validas), fetch=True
+        )
+        nuevas = {fila[0] for fila in filas}
+
+    # Entrada y salida de cada (usuario, día) según las marcaciones nuevas del lote
+    dias = {}
+    for clave, (i, username, marcada) in validas.items():
+        if clave not in nuevas:
+            resultados[i] = {'clave': clave, 'estado': 'duplicada'}
+            continue
+        dias.setdefault((ids[username], marcada.date()), []).append(marcada)
+
+    estado_dias = {}
+    if dias:
+        valores = []
+        for (id_usuario, fecha), horas in sorted(dias.items()):
+            inicio, fin = min(horas), max(horas)
+            salida = fin if fin != inicio else None
+            ordinarias, extras = calcular_horas(inicio, salida) if salida else (0.0, 0.0)
+            valores.append((id_usuario, fecha, inicio, salida, ordinarias, extras))
+        filas = psycopg2.extras.execute_values(
+            cursor, SQL_UPSERT_LOTE, valores,
+            template="(%s, %s::date, %s::timestamptz, %s::timestamptz, %s, %s)", page_size=len(valores), fetch=True
+        )
+        estado_dias = {(fila['id_usuario'], fila['fecha']): fila for fila in filas}
+        actualizar_resumen_asistencia(cursor, list(dias))
+
+    for clave, (i, username, marcada) in validas.items():
+        if resultados[i] is not None:
+            continue
+        fila = estado_dias.get((ids[username], marcada.date()))
+        evento = 'inicio' if fila and fila['inicio'] == marcada else ('salida' if fila and fila['salida'] == marcada else 'intermedia')
+        resultados[i] = {'clave': clave, 'estado': 'registrada', 'evento': evento, 'fecha': marcada.date().isoformat()}
+    return resultados
+
+@app.route('/api/marcaciones/lote', methods=['POST'])
+@csrf.exempt
+@token_api_requerido
+def api_marcaciones_lote():
+    """
+    Resincroniza las marcaciones encoladas por un kiosco sin conexión en una sola petición
+    y una sola transacción. Cuerpo: {"marcaciones": [{"clave", "usuario", "client_timestamp"}]}.
+    Reenviar el mismo lote es seguro: las claves ya procesadas vuelven como 'duplicada'.
+    """
+    datos = _cuerpo_json()
+    items = datos.get('marcaciones') if datos is not None else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Se requiere la lista "marcaciones"'}), 400
+    if len(items) > LOTE_MAX_MARCACIONES:
+        return jsonify({'success': False, 'error': f'Máximo {LOTE_MAX_MARCACIONES} marcaciones por lote'}), 413
+
+    user = g.usuario_api
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        resultados = registrar_marcaciones_lote(cursor, items, user)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error en lote de marcaciones de {user.username}: {e}")
+        return jsonify({'success': False, 'error': 'Error al registrar el lote'}), 500
+    finally:
         cursor.close()
         conn.close()
 
-    return redirect(url_for('dashboard'))
+    registradas = sum(1 for r in resultados if r['estado'] == 'registrada')
+    logger.info(f"Lote de marcaciones de {user.username}: {registradas}/{len(items)} registradas")
+    return jsonify({'success': True, 'registradas': registradas, 'resultados': resultados})
 
-# ✅ Exportar datos
-@app.route('/exportar_datos')
-def exportar_datos():
-    if not current_user.is_admin():
-        flash('Acceso denegado', 'error')
-        return redirect(url_for('home'))
+# ✅ Motor de exportación CSV en streaming (compartido por /exportar_datos y /exportar_registros)
+TAMANO_LOTE_EXPORTACION = 2000
+
+def _generar_csv_registros(incluir_costos, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """
+    Genera el CSV de asistencia por trozos. Las filas se leen con un cursor de servidor
+    (con nombre) en lotes de `tamano_lote`, así la memoria no crece con el histórico.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def volcar():
+        trozo = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return trozo
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    salario_minimo = 1384308
-    valor_hora_ordinaria = salario_minimo / (30 * 8)
-    
     # --- Ocultar costos para usuarios normales ---
     headers = ['Usuario','Nombre','Cédula','Cargo','Correo','Fecha y Hora Inicio','Fecha y Hora Salida','Horas Trabajadas','Horas Extras']
-    if current_user.is_admin():
+    if incluir_costos:
         headers.extend(['Costo Horas Ordinarias','Costo Horas Extras','Costo Total'])
     writer.writerow(headers)
     # --- Fin de la ocultación ---
+    yield volcar()
 
-    cursor.execute("""
-        SELECT 
-            u.username, u.nombre, u.cedula, u.cargo, u.correo,
-            ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas, ra.horas_extras
-        FROM usuarios u
-        JOIN registros_asistencia ra ON u.id = ra.id_usuario
-        ORDER BY u.username, ra.fecha
-    """)
-    all_records = cursor.fetchall()
-    
-    for row in all_records:
-        base_row = [
-            row['username'], row['nombre'], row['cedula'], row['cargo'], row['correo'],
-            row['inicio'].isoformat() if row['inicio'] else '',
-            row['salida'].isoformat() if row['salida'] else '',
-            float(row['horas_trabajadas']), float(row['horas_extras'])
-        ]
+    conn = get_db_connection()
+    cursor = conn.cursor(name=f"exportar_{uuid.uuid4().hex}")
+    cursor.itersize = tamano_lote
+    try:
+        cursor.execute("""
+            SELECT 
+                u.username, u.nombre, u.cedula, u.cargo, u.correo,
+                ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas, ra.horas_extras
+            FROM usuarios u
+            JOIN registros_asistencia ra ON u.id = ra.id_usuario
+            ORDER BY u.username, ra.fecha
+        """)
+        valores_hora = {}  # Valor de la hora por año (tarifas de MotorCostos)
+        recargos = motor_costos.RECARGOS
+        while True:
+            lote = cursor.fetchmany(tamano_lote)
+            if not lote:
+                break
+
+            # --- Ocultar costos para usuarios normales ---
+            costos_filas = None
+            if incluir_costos and np is not None:
+                # Con NumPy, costos de todo el lote de una vez
+                costos = motor_costos.costos([row['fecha'] for row in lote],
+                                             [row['horas_trabajadas'] for row in lote],
+                                             [row['horas_extras'] for row in lote])
+                costos_filas = zip(costos['ordinarias'], costos['extras'], costos['total'])
+            # --- Fin de la ocultación ---
+
+            for row in lote:
+                base_row = [
+                    row['username'], row['nombre'], row['cedula'], row['cargo'], row['correo'],
+                    row['inicio'].isoformat() if row['inicio'] else '',
+                    row['salida'].isoformat() if row['salida'] else '',
+                    float(row['horas_trabajadas']), float(row['horas_extras'])
+                ]
+                if costos_filas is not None:
+                    base_row.extend(round(float(costo), 2) for costo in next(costos_filas))
+                elif incluir_costos:
+                    # Sin NumPy, fila a fila: armar columnas para el motor sería más lento
+                    fecha = row['fecha']
+                    valor_hora = valores_hora.get(fecha.year)
+                    if valor_hora is None:
+                        valor_hora = valores_hora[fecha.year] = motor_costos.valor_hora(fecha.year)
+                    costo_ordinarias = float(row['horas_trabajadas']) * valor_hora
+                    costo_extras = float(row['horas_extras']) * valor_hora * recargos[fecha.weekday()]
+                    base_row.extend([round(costo_ordinarias, 2), round(costo_extras, 2),
+                                     round(costo_ordinarias + costo_extras, 2)])
+
+                writer.writerow(base_row)
+            yield volcar()
+    finally:
+        cursor.close()
 
-        # --- Ocultar costos para usuarios normales ---
-        if current_user.is_admin():
-            horas_trabajadas = float(row['horas_trabajadas'])
-            horas_extras = float(row['horas_extras'])
-            costo_ordinarias = horas_trabajadas * valor_hora_ordinaria
-            costo_extras = 0
-            try:
-                fecha_obj = row['fecha']
-                dia_semana = fecha_obj.weekday()
-                multiplicador = 1.75 if dia_semana == 5 else (2.0 if dia_semana == 6 else 1.25)
-                costo_extras = horas_extras * valor_hora_ordinaria * multiplicador
-            except:
-                pass
-            costo_total = costo_ordinarias + costo_extras
-            base_row.extend([round(costo_ordinarias, 2), round(costo_extras, 2), round(costo_total, 2)])
-        # --- Fin de la ocultación ---
+def _respuesta_csv_registros(nombre_archivo):
+    """Respuesta HTTP que envía el CSV a medida que se genera."""
+    generador = _generar_csv_registros(incluir_costos=current_user.is_admin())
+    return Response(stream_with_context(generador), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={nombre_archivo}'})
 
-        writer.writerow(base_row)
+# ✅ Exportar datos
+@app.route('/exportar_datos')
+def exportar_datos():
+    if not current_user.is_admin():
+        flash('Acceso denegado', 'error')
+        return redirect(url_for('home'))
 
-    cursor.close()
-    conn.close()
-    
-    output.seek(0)
-    return send_file(io.BytesIO(output.getvalue().encode('utf-8')),
-                    mimetype='text/csv', as_attachment=True,
-                    download_name='datos_empleados.csv')
+    return _respuesta_csv_registros('datos_empleados.csv')
 
 # ✅ Exportar registros desde dashboard
 @app.route('/exportar_registros')
@@ -1612,66 +3262,7 @@ def exportar_registros():
         flash('Acceso denegado', 'error')
         return redirect(url_for('home'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    salario_minimo = 1384308
-    valor_hora_ordinaria = salario_minimo / (30 * 8)
-    
-    # --- Ocultar costos para usuarios normales ---
-    headers = ['Usuario','Nombre','Cédula','Cargo','Correo','Fecha y Hora Inicio','Fecha y Hora Salida','Horas Trabajadas','Horas Extras']
-    if current_user.is_admin():
-        headers.extend(['Costo Horas Ordinarias','Costo Horas Extras','Costo Total'])
-    writer.writerow(headers)
-    # --- Fin de la ocultación ---
-
-    cursor.execute("""
-        SELECT 
-            u.username, u.nombre, u.cedula, u.cargo, u.correo,
-            ra.fecha, ra.inicio, ra.salida, ra.horas_trabajadas, ra.horas_extras
-        FROM usuarios u
-        JOIN registros_asistencia ra ON u.id = ra.id_usuario
-        ORDER BY u.username, ra.fecha
-    """)
-    all_records = cursor.fetchall()
-    
-    for row in all_records:
-        base_row = [
-            row['username'], row['nombre'], row['cedula'], row['cargo'], row['correo'],
-            row['inicio'].isoformat() if row['inicio'] else '',
-            row['salida'].isoformat() if row['salida'] else '',
-            float(row['horas_trabajadas']), float(row['horas_extras'])
-        ]
-
-        # --- Ocultar costos para usuarios normales ---
-        if current_user.is_admin():
-            horas_trabajadas = float(row['horas_trabajadas'])
-            horas_extras = float(row['horas_extras'])
-            costo_ordinarias = horas_trabajadas * valor_hora_ordinaria
-            costo_extras = 0
-            try:
-                fecha_obj = row['fecha']
-                dia_semana = fecha_obj.weekday()
-                multiplicador = 1.75 if dia_semana == 5 else (2.0 if dia_semana == 6 else 1.25)
-                costo_extras = horas_extras * valor_hora_ordinaria * multiplicador
-            except:
-                pass
-            costo_total = costo_ordinarias + costo_extras
-            base_row.extend([round(costo_ordinarias, 2), round(costo_extras, 2), round(costo_total, 2)])
-        # --- Fin de la ocultación ---
-
-        writer.writerow(base_row)
-
-    cursor.close()
-    conn.close()
-    
-    output.seek(0)
-    return send_file(io.BytesIO(output.getvalue().encode('utf-8')),
-                    mimetype='text/csv', as_attachment=True,
-                    download_name='registros_' + now_local().strftime('%Y%m%d_%H%M%S') + '.csv')
+    return _respuesta_csv_registros('registros_' + now_local().strftime('%Y%m%d_%H%M%S') + '.csv')
 
 # ✅ Ajustes de cuenta - Usuarios normales solo pueden cambiar su contraseña
 @app.route('/ajustes', methods=['GET', 'POST'])
@@ -1708,7 +3299,9 @@ def ajustes():
                         "UPDATE usuarios SET nombre = %s, correo = %s, telefono = %s WHERE id = %s",
                         (nombre, correo, telefono, usuario_id)
                     )
+                    incrementar_version_datos(cursor)
                     conn.commit()
+                    invalidar_usuario_cache(usuario_id)
                     registrar_auditoria('Actualización Datos', f"Admin {current_user.username} actualizó datos de {current_user.username}")
                     flash('Datos actualizados correctamente.', 'message')
             except Exception as e:
@@ -1732,6 +3325,7 @@ def ajustes():
                     hashed_password = generate_password_hash(nueva)
                     cursor.execute("UPDATE usuarios SET contrasena = %s WHERE id = %s", (hashed_password, current_user.id))
                     conn.commit()
+                    invalidar_usuario_cache(current_user.id)
                     registrar_auditoria('Cambio Contraseña', f"Usuario {current_user.username} cambió su propia contraseña.")
                     flash('Contraseña actualizada correctamente.', 'message')
                 except Exception as e:
@@ -1789,7 +3383,9 @@ def actualizar_datos():
                 (nombre, cargo, correo, telefono, usuario_id)
             )
             registrar_auditoria('Actualización Datos', f"Usuario {current_user.username} actualizó sus datos personales")
+            incrementar_version_datos(cursor)
             conn.commit()
+            invalidar_usuario_cache(usuario_id)
             flash('Datos actualizados correctamente', 'message')
         except Exception as e:
             flash(f'Error al actualizar datos: {e}', 'error')
@@ -1847,6 +3443,8 @@ def recuperar_contrasena():
     return render_template('recuperar_contrasena.html', form=form)
 
 # ✅ Panel de Administración
+USUARIOS_POR_PAGINA = 50
+
 @app.route('/admin/usuarios')
 def admin_usuarios():
     if not current_user.is_admin():
@@ -1858,35 +3456,113 @@ def admin_usuarios():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT id, username, nombre, cedula, cargo, correo, telefono, admin, bloqueado FROM usuarios")
-    usuarios_db = cursor.fetchall()
-    
+    # Paginación por clave (username): cada página es un rango del índice UNIQUE,
+    # sin OFFSET, así cuesta lo mismo la primera página que la última.
+    por_pagina = min(max(request.args.get('por_pagina', USUARIOS_POR_PAGINA, type=int), 1), 200)
+    despues = request.args.get('despues')
+    antes = request.args.get('antes')
+    columnas = "SELECT id, username, nombre, cedula, cargo, correo, telefono, admin, bloqueado FROM usuarios"
+    if antes:
+        cursor.execute(columnas + " WHERE username < %s ORDER BY username DESC LIMIT %s", (antes, por_pagina + 1))
+        usuarios_db = cursor.fetchall()
+        hay_anterior = len(usuarios_db) > por_pagina
+        usuarios_db = list(reversed(usuarios_db[:por_pagina]))
+        hay_siguiente = True
+    else:
+        if despues:
+            cursor.execute(columnas + " WHERE username > %s ORDER BY username LIMIT %s", (despues, por_pagina + 1))
+        else:
+            cursor.execute(columnas + " ORDER BY username LIMIT %s", (por_pagina + 1,))
+        usuarios_db = cursor.fetchall()
+        hay_siguiente = len(usuarios_db) > por_pagina
+        usuarios_db = usuarios_db[:por_pagina]
+        hay_anterior = bool(despues)
+
+    # Resumen de asistencia de la página en una sola consulta: totales desde los
+    # resúmenes mensuales y último registro con una lectura del índice por usuario.
+    # El detalle (registros y turnos) se pide al abrir cada usuario (admin_usuario_detalle).
+    resumenes = {}
+    ids = [u['id'] for u in usuarios_db]
+    if ids:
+        cursor.execute("""
+            SELECT u.id,
+                   COALESCE(t.registros, 0) AS registros,
+                   COALESCE(t.horas_trabajadas, 0) AS horas_trabajadas,
+                   COALESCE(t.horas_extras, 0) AS horas_extras,
+                   ult.fecha AS ultimo_registro
+            FROM unnest(%s::int[]) AS u(id)
+            LEFT JOIN (
+                SELECT id_usuario, SUM(registros) AS registros, SUM(horas_trabajadas) AS horas_trabajadas,
+                       SUM(horas_extras) AS horas_extras
+                FROM resumen_asistencia
+                WHERE periodo = 'mes' AND id_usuario = ANY(%s)
+                GROUP BY id_usuario
+            ) t ON t.id_usuario = u.id
+            LEFT JOIN LATERAL (
+                SELECT ra.fecha FROM registros_asistencia ra
+                WHERE ra.id_usuario = u.id ORDER BY ra.fecha DESC LIMIT 1
+            ) ult ON TRUE
+        """, (ids, ids))
+        resumenes = {row['id']: row for row in cursor.fetchall()}
+
     usuarios = {}
-    registros = {} # Esto se llenará con un query por usuario si es necesario
-    
     for user_data in usuarios_db:
-        username = user_data['username']
-        usuarios[username] = user_data
-        
-        # Obtener registros para cada usuario (simplificado para la vista)
-        cursor.execute(
-            "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC",
-            (user_data['id'],)
+        resumen = resumenes.get(user_data['id'])
+        usuarios[user_data['username']] = dict(
+            user_data,
+            registros=resumen['registros'] if resumen else 0,
+            horas_trabajadas=float(resumen['horas_trabajadas']) if resumen else 0.0,
+            horas_extras=float(resumen['horas_extras']) if resumen else 0.0,
+            ultimo_registro=resumen['ultimo_registro'].isoformat() if resumen and resumen['ultimo_registro'] else None,
         )
-        user_registros_db = cursor.fetchall()
-        registros[username] = {}
-        for reg in user_registros_db:
-            registros[username][reg['fecha'].isoformat()] = {
-                'inicio': reg['inicio'].isoformat() if reg['inicio'] else None,
-                'salida': reg['salida'].isoformat() if reg['salida'] else None,
-                'horas_trabajadas': float(reg['horas_trabajadas']),
-                'horas_extras': float(reg['horas_extras'])
-            }
     
     cursor.close()
     conn.close()
-    
-    return render_template('admin_usuarios.html', usuarios=usuarios, registros=registros, form=form)
+
+    paginacion = {
+        'por_pagina': por_pagina,
+        'anterior': usuarios_db[0]['username'] if usuarios_db and hay_anterior else None,
+        'siguiente': usuarios_db[-1]['username'] if usuarios_db and hay_siguiente else None,
+    }
+    return render_template('admin_usuarios.html', usuarios=usuarios, paginacion=paginacion, form=form)
+
+# ✅ Detalle de un usuario bajo demanda (JSON para /admin/usuarios)
+@app.route('/admin/usuarios/<int:user_id>/detalle')
+@login_required
+def admin_usuario_detalle(user_id):
+    if not current_user.is_admin():
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    limite = min(max(request.args.get('limite', 5, type=int), 1), 100)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT fecha, inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s ORDER BY fecha DESC LIMIT %s",
+        (user_id, limite)
+    )
+    registros = [{
+        'fecha': reg['fecha'].isoformat(),
+        'dia_semana': DIAS_SEMANA[reg['fecha'].weekday()],
+        'inicio': reg['inicio'].strftime('%H:%M') if reg['inicio'] else None,
+        'salida': reg['salida'].strftime('%H:%M') if reg['salida'] else None,
+        'horas_trabajadas': float(reg['horas_trabajadas'] or 0),
+        'horas_extras': float(reg['horas_extras'] or 0)
+    } for reg in cursor.fetchall()]
+
+    cursor.execute("""
+        SELECT ta.fecha_asignacion, td.hora
+        FROM turnos_asignados ta
+        JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
+        WHERE ta.id_usuario = %s AND ta.fecha_asignacion >= %s
+        ORDER BY ta.fecha_asignacion, td.hora
+        LIMIT %s
+    """, (user_id, now_local().date(), limite))
+    turnos = [{'fecha': t['fecha_asignacion'].isoformat(), 'hora': t['hora']} for t in cursor.fetchall()]
+
+    cursor.close()
+    conn.close()
+    return jsonify({'success': True, 'registros': registros, 'turnos': turnos})
 
 # ✅ Cambiar contraseña de usuario (Admin)
 @app.route('/admin/cambiar_clave', methods=['GET', 'POST'])
@@ -1912,6 +3588,7 @@ def admin_cambiar_clave():
                             (generate_password_hash(nueva_clave), user_id['id'])
                         )
                         conn.commit()
+                        invalidar_usuario_cache(user_id['id'])
                         flash(f'Contraseña actualizada para {username}', 'message')
                 else:
                     flash('Error al actualizar contraseña', 'error')
@@ -1959,7 +3636,9 @@ def admin_desbloquear():
         if user_id:
             try:
                 cursor.execute("UPDATE usuarios SET bloqueado = FALSE WHERE id = %s", (user_id['id'],))
+                incrementar_version_datos(cursor)
                 conn.commit()
+                invalidar_usuario_cache(user_id['id'])
                 flash(f'Usuario {username} desbloqueado', 'message')
             except Exception as e:
                 flash(f'Error al desbloquear usuario: {e}', 'error')
@@ -1990,7 +3669,9 @@ def admin_bloquear():
         if user_id:
             try:
                 cursor.execute("UPDATE usuarios SET bloqueado = TRUE WHERE id = %s", (user_id['id'],))
+                incrementar_version_datos(cursor)
                 conn.commit()
+                invalidar_usuario_cache(user_id['id'])
                 flash(f'Usuario {username} bloqueado', 'message')
             except Exception as e:
                 flash(f'Error al bloquear usuario: {e}', 'error')
@@ -2026,8 +3707,10 @@ def admin_eliminar_registro():
                     "DELETE FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s",
                     (user_id['id'], fecha_str)
                 )
+                eliminados = cursor.rowcount
+                actualizar_resumen_asistencia(cursor, [(user_id['id'], fecha_str)])
                 conn.commit()
-                if cursor.rowcount > 0:
+                if eliminados > 0:
                     flash(f'Registro del {fecha_str} eliminado para {username}', 'message')
                 else:
                     flash('Registro no encontrado', 'error')
@@ -2070,7 +3753,7 @@ def admin_editar_registro():
             
             try:
                 # Registro de Auditoría Previo
-                registrar_auditoria('Edición Horas', f"Admin editó registro de {username} para {fecha_str}: Inicio {inicio_str}, Salida {salida_str}")
+                registrar_auditoria('Edición Horas', f"Admin editó registro de {username} para {fecha_str}: Inicio {inicio_str}, Salida {salida_str}", durable=True)
 
                 # Upsert lógico: INSERT si no existe, UPDATE si existe
                 # Como la tabla tiene UNIQUE(id_usuario, fecha), podemos usar ON CONFLICT
@@ -2084,6 +3767,7 @@ def admin_editar_registro():
                         horas_trabajadas = EXCLUDED.horas_trabajadas,
                         horas_extras = EXCLUDED.horas_extras
                 """, (user_id['id'], fecha_str, inicio_str, salida_str, horas_trabajadas, horas_extras))
+                actualizar_resumen_asistencia(cursor, [(user_id['id'], fecha_str)])
                 
                 conn.commit()
                 flash('Registro guardado correctamente', 'message')
@@ -2168,6 +3852,7 @@ def admin_agregar_registro():
                     horas_trabajadas = EXCLUDED.horas_trabajadas,
                     horas_extras = EXCLUDED.horas_extras
             """, (user_id_row['id'], fecha_str, inicio_str, salida_str, horas_trabajadas, horas_extras))
+            actualizar_resumen_asistencia(cursor, [(user_id_row['id'], fecha_str)])
             
             conn.commit()
             flash(f'Registro para {username} en la fecha {fecha_str} ha sido guardado.', 'message')
@@ -2217,6 +3902,33 @@ def admin_crear_backup():
     flash('La funcionalidad de crear backup de la base de datos debe ser implementada (ej. mysqldump).', 'warning')
     return redirect(url_for('admin_backups'))
 
+@app.route('/admin/metricas')
+def admin_metricas():
+    if not current_user.is_admin():
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    return jsonify({
+        'success': True,
+        'pool': metricas_pool(),
+        'cache_usuarios': cache_usuarios.estadisticas(),
+        'fragmentos_dashboard': fragmentos_dashboard.estadisticas(),
+        'auditoria': bitacora.estadisticas(),
+        'version_datos': version_datos_diferida.estadisticas(),
+    })
+
+@app.route('/admin/perf')
+def admin_perf():
+    """Endpoints más lentos de la ventana reciente de este proceso (?formato=json para la API)."""
+    if not current_user.is_admin():
+        flash('Acceso denegado', 'error')
+        return redirect(url_for('dashboard'))
+
+    endpoints = metricas_endpoints.resumen(limite=min(request.args.get('limite', 20, type=int) or 20, 200))
+    if request.args.get('formato') == 'json':
+        return jsonify({'success': True, 'ventana_s': metricas_endpoints.ventana, 'pid': os.getpid(), 'endpoints': endpoints})
+    return render_template('admin_perf.html', endpoints=endpoints, ventana_min=round(metricas_endpoints.ventana / 60),
+                           umbral_n_mas_1=PERF_N_MAS_1_UMBRAL, pid=os.getpid())
+
 @app.route('/admin/descargar_backup/<nombre>')
 def admin_descargar_backup(nombre):
     if not current_user.is_admin():
@@ -2279,11 +3991,9 @@ def seleccionar_turno():
                 
                 if hora:
                     # Upsert lógica segura para historial
-                    cursor.execute("SELECT id FROM turnos_disponibles WHERE dia_semana = %s AND hora = %s", (dia_str, hora))
-                    turno_disponible_row = cursor.fetchone()
+                    id_turno_disponible = catalogo_turnos.id_turno(dia_str, hora)
                     
-                    if turno_disponible_row:
-                        id_turno_disponible = turno_disponible_row['id']
+                    if id_turno_disponible:
                         
                         # Insertar nuevo turno (Upsert)
                         cursor.execute("""
@@ -2314,6 +4024,7 @@ def seleccionar_turno():
                             WHERE id_usuario = %s AND fecha_asignacion = %s
                         """, (usuario_id, fecha_asignacion))
 
+            incrementar_version_datos(cursor)
             conn.commit()
             flash('✅ Semana de turnos guardada exitosamente', 'message')
         except Exception as e:
@@ -2358,6 +4069,74 @@ def seleccionar_turno():
 
 
 # ✅ Ver turnos asignados
+TURNOS_POR_PAGINA = 200
+MAX_TURNOS_POR_PAGINA = 5000
+
+def _fecha_param(nombre, por_defecto):
+    """Lee una fecha YYYY-MM-DD de la query string; si falta o es inválida retorna `por_defecto`."""
+    try:
+        return datetime.date.fromisoformat(request.args.get(nombre, ''))
+    except ValueError:
+        return por_defecto
+
+def _consulta_turnos_asignados(admin, usuario_id):
+    """
+    Arma la consulta de turnos asignados según los filtros de la petición.
+    Siempre acotada por rango de fechas (por defecto semana actual y siguiente) y
+    paginada por clave (fecha_asignacion, username, hora, id). Un usuario puede tener
+    varios turnos el mismo día (UNIQUE (id_usuario, fecha_asignacion, id_turno_disponible)),
+    así que ta.id desempata y ninguna fila se pierde entre páginas. Retorna (sql, params, filtros).
+    """
+    hoy = now_local().date()
+    lunes = hoy - datetime.timedelta(days=hoy.weekday())
+    desde = _fecha_param('desde', lunes)
+    hasta = _fecha_param('hasta', lunes + datetime.timedelta(days=13))
+    por_pagina = min(max(request.args.get('por_pagina', TURNOS_POR_PAGINA, type=int), 1), MAX_TURNOS_POR_PAGINA)
+
+    query = """
+        SELECT 
+            ta.id, ta.fecha_asignacion,
+            u.username, u.nombre, u.cedula, u.cargo,
+            td.dia_semana AS dia, td.hora
+        FROM turnos_asignados ta
+        JOIN usuarios u ON ta.id_usuario = u.id
+        JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
+        WHERE ta.fecha_asignacion BETWEEN %s AND %s
+    """
+    params = [desde, hasta]
+
+    # Si no es admin, filtrar por su propio ID; el admin puede filtrar por usuario
+    usuario = None
+    if not admin:
+        query += " AND ta.id_usuario = %s"
+        params.append(usuario_id)
+    elif request.args.get('usuario'):
+        usuario = request.args.get('usuario')
+        query += " AND u.username = %s"
+        params.append(usuario)
+
+    despues_fecha = _fecha_param('despues_fecha', None)
+    despues_usuario = request.args.get('despues_usuario')
+    despues_hora = request.args.get('despues_hora')
+    despues_id = request.args.get('despues_id', type=int)
+    if despues_fecha and despues_usuario is not None and despues_hora is not None and despues_id is not None:
+        query += " AND (ta.fecha_asignacion, u.username, td.hora, ta.id) > (%s, %s, %s, %s)"
+        params.extend([despues_fecha, despues_usuario, despues_hora, despues_id])
+
+    # Se pide una fila de más para saber si hay página siguiente
+    query += " ORDER BY ta.fecha_asignacion, u.username, td.hora, ta.id LIMIT %s"
+    params.append(por_pagina + 1)
+
+    filtros = {'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'usuario': usuario, 'por_pagina': por_pagina}
+    return query, tuple(params), filtros
+
+def _siguiente_turnos(filtros, ultimo):
+    """Parámetros de la página siguiente a partir de la última fila mostrada."""
+    siguiente = {k: v for k, v in filtros.items() if v is not None}
+    siguiente.update(despues_fecha=ultimo['fecha_asignacion'].isoformat(), despues_usuario=ultimo['username'],
+                     despues_hora=ultimo['hora'], despues_id=ultimo['id'])
+    return siguiente
+
 @app.route('/ver_turnos_asignados')
 def ver_turnos_asignados():
     if not current_user.is_authenticated:
@@ -2375,28 +4154,14 @@ def ver_turnos_asignados():
     
     assigned_shifts = {}
     
-    # Construir la consulta base
-    query = """
-        SELECT 
-            ta.fecha_asignacion,
-            u.username, u.nombre, u.cedula, u.cargo,
-            td.dia_semana AS dia, td.hora
-        FROM turnos_asignados ta
-        JOIN usuarios u ON ta.id_usuario = u.id
-        JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-    """
-    params = []
-
-    # Si no es admin, filtrar por su propio ID
-    if not admin:
-        query += " WHERE ta.id_usuario = %s"
-        params.append(usuario_id)
-
-    # Ordenar siempre por fecha (más reciente primero), luego por usuario
-    query += " ORDER BY ta.fecha_asignacion DESC, u.username, td.hora"
-
-    cursor.execute(query, tuple(params))
+    query, params, filtros = _consulta_turnos_asignados(admin, usuario_id)
+    cursor.execute(query, params)
     all_assigned_shifts = cursor.fetchall()
+
+    siguiente = None
+    if len(all_assigned_shifts) > filtros['por_pagina']:
+        all_assigned_shifts = all_assigned_shifts[:filtros['por_pagina']]
+        siguiente = _siguiente_turnos(filtros, all_assigned_shifts[-1])
     
     # Agrupar los turnos por fecha
     turnos_por_fecha = {}
@@ -2430,11 +4195,57 @@ def ver_turnos_asignados():
                         turnos_por_fecha=turnos_por_fecha,
                         admin=admin,
                         assigned_shifts=assigned_shifts, # FIX: Pasar la variable a la plantilla
+                        filtros=filtros,
+                        siguiente=siguiente,
                         data={'usuarios': {}, 'turnos': {'shifts': {}}}, # Data ya no se carga de JSON
                         session=session)
 
+# ✅ Turnos asignados en JSON (streaming, mismos filtros y paginación que la vista HTML)
+@app.route('/ver_turnos_asignados.json')
+@login_required
+def ver_turnos_asignados_json():
+    query, params, filtros = _consulta_turnos_asignados(current_user.is_admin(), current_user.id)
+
+    def generador():
+        conn = get_db_connection()
+        cursor = conn.cursor(name=f"turnos_{uuid.uuid4().hex}")
+        cursor.itersize = TAMANO_LOTE_EXPORTACION
+        try:
+            cursor.execute(query, params)
+            yield '{"filtros": ' + json.dumps(filtros) + ', "turnos": ['
+            enviados, ultimo, siguiente = 0, None, None
+            while siguiente is None:
+                lote = cursor.fetchmany(TAMANO_LOTE_EXPORTACION)
+                if not lote:
+                    break
+                trozos = []
+                for row in lote:
+                    if enviados == filtros['por_pagina']:
+                        # Fila de más: solo indica que hay página siguiente
+                        siguiente = _siguiente_turnos(filtros, ultimo)
+                        break
+                    trozos.append(json.dumps({
+                        'fecha': row['fecha_asignacion'].isoformat(),
+                        'dia': row['dia'],
+                        'hora': row['hora'],
+                        'usuario': row['username'],
+                        'nombre': row['nombre'],
+                        'cedula': row['cedula'],
+                        'cargo': row['cargo']
+                    }))
+                    enviados += 1
+                    ultimo = row
+                if trozos:
+                    yield (',' if enviados > len(trozos) else '') + ','.join(trozos)
+            yield '], "siguiente": ' + json.dumps(siguiente) + '}'
+        finally:
+            cursor.close()
+
+    return Response(stream_with_context(generador()), mimetype='application/json')
+
 # ✅ Gestión de Tiempos Mensual (Admin)
 @app.route('/admin/gestion_tiempos')
+@respuesta_condicional('gestion_tiempos')
 def admin_gestion_tiempos():
     if not current_user.is_admin():
         flash('Acceso denegado', 'error')
@@ -2460,6 +4271,27 @@ def admin_gestion_tiempos():
     import calendar
     num_dias = calendar.monthrange(ano, mes)[1]
     fechas_mes = [datetime.date(ano, mes, d) for d in range(1, num_dias + 1)]
+    primer_dia, ultimo_dia = fechas_mes[0], fechas_mes[-1]
+
+    # Todo el mes en dos consultas por rango; el cruce usuario/día se hace en memoria.
+    # 1. Turnos planificados: (id_usuario, fecha) -> hora
+    cursor.execute("""
+        SELECT ta.id_usuario, ta.fecha_asignacion, td.hora
+        FROM turnos_asignados ta
+        JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
+        WHERE ta.fecha_asignacion BETWEEN %s AND %s
+    """, (primer_dia, ultimo_dia))
+    planificados = {}
+    for row in cursor.fetchall():
+        planificados.setdefault((row['id_usuario'], row['fecha_asignacion']), row['hora'])
+
+    # 2. Registros reales (asistencia): (id_usuario, fecha) -> fila
+    cursor.execute("""
+        SELECT id, id_usuario, fecha, inicio, salida, horas_trabajadas, horas_extras
+        FROM registros_asistencia
+        WHERE fecha BETWEEN %s AND %s
+    """, (primer_dia, ultimo_dia))
+    reales = {(row['id_usuario'], row['fecha']): row for row in cursor.fetchall()}
 
     # Estructura de datos completa: Fecha -> Usuario -> {Planificado, Real}
     calendario_completo = {}
@@ -2484,23 +4316,8 @@ def admin_gestion_tiempos():
 
         for usuario in usuarios_activos:
             user_id = usuario['id']
-            # 1. Buscar turno planificado
-            cursor.execute("""
-                SELECT td.hora 
-                FROM turnos_asignados ta
-                JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-                WHERE ta.id_usuario = %s AND ta.fecha_asignacion = %s
-            """, (user_id, fecha))
-            planificado_row = cursor.fetchone()
-            hora_planificada = planificado_row['hora'] if planificado_row else '-'
-
-            # 2. Buscar registro real (asistencia)
-            cursor.execute("""
-                SELECT id, inicio, salida, horas_trabajadas, horas_extras
-                FROM registros_asistencia
-                WHERE id_usuario = %s AND fecha = %s
-            """, (user_id, fecha))
-            real_row = cursor.fetchone()
+            hora_planificada = planificados.get((user_id, fecha), '-')
+            real_row = reales.get((user_id, fecha))
 
             inicio_time = ''
             salida_time = ''
@@ -2533,39 +4350,27 @@ def admin_gestion_tiempos():
 
     # --- NUEVO: Agregar resumen de uso de turnos por usuario ---
     resumen_uso = []
-    salario_minimo = 1384308
-    valor_hora_ordinaria = salario_minimo / (30 * 8)
+    valor_hora_ordinaria = motor_costos.valor_hora(ano)
+
+    # Turnos del mes, horas extras y costo ajustado según día de semana, para todos los usuarios a la vez
+    cursor.execute("""
+        SELECT ta.id_usuario,
+               COUNT(*) AS total_turnos,
+               SUM(ra.horas_extras) AS total_extras,
+               SUM(ra.horas_extras * """ + motor_costos.sql_recargo('ta.fecha_asignacion') + """) AS costo_ajustado
+        FROM turnos_asignados ta
+        LEFT JOIN registros_asistencia ra ON ta.id_usuario = ra.id_usuario AND ta.fecha_asignacion = ra.fecha
+        WHERE ta.fecha_asignacion BETWEEN %s AND %s
+        GROUP BY ta.id_usuario
+    """, (primer_dia, ultimo_dia))
+    uso_por_usuario = {row['id_usuario']: row for row in cursor.fetchall()}
 
     for usuario in usuarios_activos:
-        user_id = usuario['id']
-        cursor.execute("""
-            SELECT COUNT(*) as total_turnos, SUM(ra.horas_extras) as total_extras
-            FROM turnos_asignados ta
-            LEFT JOIN registros_asistencia ra ON ta.id_usuario = ra.id_usuario AND ta.fecha_asignacion = ra.fecha
-            WHERE ta.id_usuario = %s AND EXTRACT(YEAR FROM ta.fecha_asignacion) = %s AND EXTRACT(MONTH FROM ta.fecha_asignacion) = %s
-        """, (user_id, ano, mes))
-        uso_data = cursor.fetchone()
-        total_turnos = uso_data['total_turnos'] or 0
-        total_extras = float(uso_data['total_extras'] or 0)
-        costo_extras = 0
-        try:
-            # Multiplicador y costo de horas extras aproximado según día de semana
-            cursor.execute("""
-                SELECT SUM(
-                    CASE
-                        WHEN EXTRACT(DOW FROM fecha_asignacion) IN (6) THEN horas_extras * 1.75
-                        WHEN EXTRACT(DOW FROM fecha_asignacion) IN (0) THEN horas_extras * 2.0
-                        ELSE horas_extras * 1.25
-                    END
-                ) as costo_ajustado
-                FROM turnos_asignados ta
-                LEFT JOIN registros_asistencia ra ON ta.id_usuario = ra.id_usuario AND ta.fecha_asignacion = ra.fecha
-                WHERE ta.id_usuario = %s AND EXTRACT(YEAR FROM ta.fecha_asignacion) = %s AND EXTRACT(MONTH FROM ta.fecha_asignacion) = %s
-            """, (user_id, ano, mes))
-            costo_ajustado = cursor.fetchone()['costo_ajustado'] or 0
-            costo_extras = float(costo_ajustado) * valor_hora_ordinaria
-        except Exception:
-            pass
+        uso_data = uso_por_usuario.get(usuario['id'])
+        total_turnos = uso_data['total_turnos'] if uso_data else 0
+        total_extras = float(uso_data['total_extras'] or 0) if uso_data else 0.0
+        costo_ajustado = float(uso_data['costo_ajustado'] or 0) if uso_data else 0.0
+        costo_extras = costo_ajustado * valor_hora_ordinaria
 
         resumen_uso.append({
             'usuario': usuario['username'],
@@ -2584,12 +4389,13 @@ def admin_gestion_tiempos():
     
     hoy = now_local().date()
 
+    # Los tres gráficos leen resumen_asistencia: pocas filas por usuario y periodo
     # Datos diarios (últimos 7 días)
     cursor.execute("""
-        SELECT fecha, SUM(horas_extras) as total_extras
-        FROM registros_asistencia
-        WHERE fecha BETWEEN %s AND %s
-        GROUP BY fecha ORDER BY fecha
+        SELECT inicio AS fecha, SUM(horas_extras) as total_extras
+        FROM resumen_asistencia
+        WHERE periodo = 'dia' AND inicio BETWEEN %s AND %s
+        GROUP BY inicio ORDER BY inicio
     """, (hoy - datetime.timedelta(days=7), hoy))
     diarios = cursor.fetchall()
     for row in diarios:
@@ -2598,30 +4404,31 @@ def admin_gestion_tiempos():
 
     # Datos semanales (últimas 6 semanas)
     cursor.execute("""
-        SELECT EXTRACT(YEAR FROM fecha) as ano, EXTRACT(WEEK FROM fecha) as semana, SUM(horas_extras) as total_extras
-        FROM registros_asistencia
-        WHERE fecha >= %s
-        GROUP BY ano, semana
-        ORDER BY ano, semana
-    """, (hoy - datetime.timedelta(weeks=6),))
+        SELECT inicio, SUM(horas_extras) as total_extras
+        FROM resumen_asistencia
+        WHERE periodo = 'semana' AND inicio >= %s
+        GROUP BY inicio
+        ORDER BY inicio
+    """, (rango_periodo('semana', hoy - datetime.timedelta(weeks=6))[0],))
     semanas = cursor.fetchall()
     for row in semanas:
-        etiqueta_semana = f"Año {int(row['ano'])} Semana {int(row['semana'])}"
+        ano_iso, semana_iso, _ = row['inicio'].isocalendar()
+        etiqueta_semana = f"Año {ano_iso} Semana {semana_iso}"
         extra_horas['semanal']['labels'].append(etiqueta_semana)
         extra_horas['semanal']['data'].append(float(row['total_extras'] or 0))
 
     # Datos mensuales (últimos 6 meses)
     ano_mes_inicio = (hoy.replace(day=1) - datetime.timedelta(days=180))
     cursor.execute("""
-        SELECT EXTRACT(YEAR FROM fecha) as ano, EXTRACT(MONTH FROM fecha) as mes, SUM(horas_extras) as total_extras
-        FROM registros_asistencia
-        WHERE fecha >= %s
-        GROUP BY ano, mes
-        ORDER BY ano, mes
-    """, (ano_mes_inicio,))
+        SELECT inicio, SUM(horas_extras) as total_extras
+        FROM resumen_asistencia
+        WHERE periodo = 'mes' AND inicio >= %s
+        GROUP BY inicio
+        ORDER BY inicio
+    """, (ano_mes_inicio.replace(day=1),))
     meses_extras = cursor.fetchall()
     for row in meses_extras:
-        etiqueta_mes = f"{int(row['ano'])}-{int(row['mes']):02d}"
+        etiqueta_mes = row['inicio'].strftime('%Y-%m')
         extra_horas['mensual']['labels'].append(etiqueta_mes)
         extra_horas['mensual']['data'].append(float(row['total_extras'] or 0))
 
@@ -2674,17 +4481,14 @@ def eliminar_turno():
             return redirect(url_for('ver_turnos_asignados'))
 
         # FIX 3: Corregir la consulta para encontrar el turno disponible
-        cursor.execute("SELECT id FROM turnos_disponibles WHERE dia_semana = %s AND hora = %s", (dia, hora))
-        turno_disponible_row = cursor.fetchone()
+        id_turno_disponible = catalogo_turnos.id_turno(dia, hora)
 
-        if not turno_disponible_row:
+        if not id_turno_disponible:
             flash('Turno no encontrado', 'error')
             cursor.close()
             conn.close()
             return redirect(url_for('ver_turnos_asignados'))
 
-        id_turno_disponible = turno_disponible_row['id']
-
         # Verificar que el turno pertenece al usuario o es admin
         if usuario_a_eliminar == current_user.username or current_user.is_admin():
             try:
@@ -2693,6 +4497,7 @@ def eliminar_turno():
                     (user_to_delete_row['id'], id_turno_disponible, fecha_asignacion)
                 )
                 if cursor.rowcount > 0:
+                    incrementar_version_datos(cursor)
                     conn.commit()
                     flash('✅ Turno eliminado correctamente y disponible para otros', 'message')
                 else:
@@ -2710,6 +4515,35 @@ def eliminar_turno():
     return redirect(url_for('ver_turnos_asignados'))
 
 
+def _diferencias_turnos(cursor, enviados):
+    """
+    Compara la grilla enviada {(id_usuario, fecha): id_turno o None} con lo guardado
+    y retorna (borrar, insertar): las celdas (id_usuario, fecha) a limpiar y las
+    filas (id_usuario, id_turno, fecha) a crear. Las celdas sin cambios no se tocan.
+    """
+    usuarios = sorted({u for u, _ in enviados})
+    fechas = [f for _, f in enviados]
+    cursor.execute(
+        "SELECT id_usuario, fecha_asignacion, id_turno_disponible FROM turnos_asignados "
+        "WHERE fecha_asignacion BETWEEN %s AND %s AND id_usuario = ANY(%s)",
+        (min(fechas), max(fechas), usuarios)
+    )
+    actuales = {}
+    for row in cursor.fetchall():
+        actuales.setdefault((row['id_usuario'], row['fecha_asignacion']), set()).add(row['id_turno_disponible'])
+
+    borrar, insertar = [], []
+    for (usuario_id, fecha), id_turno in sorted(enviados.items()):
+        guardados = actuales.get((usuario_id, fecha), set())
+        if id_turno is None:
+            if guardados:
+                borrar.append((usuario_id, fecha))
+        elif guardados != {id_turno}:
+            if guardados:
+                borrar.append((usuario_id, fecha))
+            insertar.append((usuario_id, id_turno, fecha))
+    return borrar, insertar
+
 # Nueva vista para asignar turnos con estructura jerárquica mes-semana-día y registro histórico sin sobreescribir
 @app.route('/admin/asignar_turnos', methods=['GET', 'POST'])
 def admin_asignar_turnos():
@@ -2742,26 +4576,33 @@ def admin_asignar_turnos():
 
         try:
             # Obtener todos los turnos enviados en el formulario para procesar
-            shifts_to_process = {key: val for key, val in request.form.items() if key.startswith('turno_')}
-            
-            for key, id_turno_disponible_str in shifts_to_process.items():
+            enviados = {}
+            for key, id_turno_disponible_str in request.form.items():
+                if not key.startswith('turno_'):
+                    continue
                 _, usuario_id_str, fecha_str = key.split('_', 2)
-                usuario_id = int(usuario_id_str)
-                fecha = datetime.date.fromisoformat(fecha_str)
-
-                # Primero, borrar cualquier turno existente para ese usuario en ese día para manejar cambios.
-                cursor.execute(
-                    "DELETE FROM turnos_asignados WHERE id_usuario = %s AND fecha_asignacion = %s",
-                    (usuario_id, fecha)
-                )
-
-                # Si se seleccionó un turno válido (no la opción 'eliminar'), insertar el nuevo.
-                if id_turno_disponible_str and id_turno_disponible_str.isdigit():
-                    id_turno_disponible = int(id_turno_disponible_str)
-                    cursor.execute(
-                        "INSERT INTO turnos_asignados (id_usuario, id_turno_disponible, fecha_asignacion) VALUES (%s, %s, %s)",
-                        (usuario_id, id_turno_disponible, fecha)
+                id_turno = int(id_turno_disponible_str) if id_turno_disponible_str and id_turno_disponible_str.isdigit() else None
+                enviados[(int(usuario_id_str), datetime.date.fromisoformat(fecha_str))] = id_turno
+
+            if enviados:
+                borrar, insertar = _diferencias_turnos(cursor, enviados)
+                # Solo se tocan las celdas que cambiaron, en lotes
+                if borrar:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        """DELETE FROM turnos_asignados ta USING (VALUES %s) AS b(id_usuario, fecha)
+                           WHERE ta.id_usuario = b.id_usuario AND ta.fecha_asignacion = b.fecha""",
+                        borrar, template="(%s::int, %s::date)", page_size=1000
                     )
+                if insertar:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        "INSERT INTO turnos_asignados (id_usuario, id_turno_disponible, fecha_asignacion) VALUES %s ON CONFLICT DO NOTHING",
+                        insertar, page_size=1000
+                    )
+                if borrar or insertar:
+                    incrementar_version_datos(cursor)
+                logger.info(f"Asignación de turnos: {len(enviados)} celdas enviadas, {len(borrar)} borradas, {len(insertar)} insertadas.")
 
             conn.commit()
             flash('Turnos actualizados correctamente.', 'success')
@@ -2856,11 +4697,9 @@ def admin_asignar_turno_manual():
 
                 if hora: 
                     # 1. Obtener ID del turno disponible
-                    cursor.execute("SELECT id FROM turnos_disponibles WHERE dia_semana = %s AND hora = %s", (dia_str, hora))
-                    turno_disponible_row = cursor.fetchone()
+                    id_turno_disponible = catalogo_turnos.id_turno(dia_str, hora)
                     
-                    if turno_disponible_row:
-                        id_turno_disponible = turno_disponible_row['id']
+                    if id_turno_disponible:
                         
                         # Insertar el nuevo turno.
                         cursor.execute("""
@@ -2910,6 +4749,7 @@ def admin_asignar_turno_manual():
                     except Exception as e_inner:
                         logger.error(f"Error en limpieza de turnos: {e_inner}")
 
+            incrementar_version_datos(cursor)
             conn.commit()
             flash('✅ Turnos actualizados correctamente (Historial protegido)', 'message')
         except Exception as e:
@@ -2938,15 +4778,15 @@ def admin_limpiar_turno():
         hora = request.form.get('hora')
         
         if dia and hora:
-            cursor.execute("SELECT id FROM turnos_disponibles WHERE dia_semana = %s AND hora = %s", (dia, hora))
-            turno_disponible_id = cursor.fetchone()
+            turno_disponible_id = catalogo_turnos.id_turno(dia, hora)
             
             if turno_disponible_id:
                 try:
                     cursor.execute(
                         "DELETE FROM turnos_asignados WHERE id_turno_disponible = %s AND fecha_asignacion = %s",
-                        (turno_disponible_id['id'], today_local_iso())
+                        (turno_disponible_id, today_local_iso())
                     )
+                    incrementar_version_datos(cursor)
                     conn.commit()
                     flash('✅ Turno liberado', 'message')
                 except Exception as e:
@@ -3111,7 +4951,9 @@ def admin_actualizar_usuario_completo():
                         "UPDATE usuarios SET nombre = %s, cedula = %s, cargo = %s, correo = %s, telefono = %s, admin = %s WHERE id = %s",
                         (nombre, cedula, cargo, correo, telefono, is_admin, user_id['id'])
                     )
+                incrementar_version_datos(cursor)
                 conn.commit()
+                invalidar_usuario_cache(user_id['id'])
                 flash('✅ Usuario actualizado completamente', 'message')
             except Exception as e:
                 flash(f'Error al actualizar usuario: {e}', 'error')
@@ -3151,6 +4993,7 @@ def admin_actualizar_registro():
                 "UPDATE registros_asistencia SET inicio = %s, salida = %s, horas_trabajadas = %s, horas_extras = %s WHERE id_usuario = %s AND fecha = %s",
                 (inicio_str, salida_str, horas_netas, horas_extras, user_id['id'], fecha_str)
             )
+            actualizar_resumen_asistencia(cursor, [(user_id['id'], fecha_str)])
             conn.commit()
             cursor.close()
             conn.close()
@@ -3192,7 +5035,9 @@ def admin_eliminar_usuario(usuario):
             cursor.execute("DELETE FROM reset_tokens WHERE id_usuario = %s", (user_id['id'],))
             # Finalmente, eliminar usuario
             cursor.execute("DELETE FROM usuarios WHERE id = %s", (user_id['id'],))
+            incrementar_version_datos(cursor)
             conn.commit()
+            invalidar_usuario_cache(user_id['id'])
             flash(f'✅ Usuario {usuario} eliminado completamente', 'message')
         except Exception as e:
             flash(f'Error al eliminar usuario: {e}', 'error')
@@ -3209,14 +5054,15 @@ def validar_turno_usuario(id_usuario, user_role, dia, hora):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    mes_actual = now_local().strftime('%Y-%m')
+    hoy = now_local().date()
+    primer_dia, ultimo_dia = rango_mes(hoy.year, hoy.month)
     
     # Contar turnos asignados este mes
     cursor.execute("""
         SELECT COUNT(*) AS total
         FROM turnos_asignados ta
-        WHERE ta.id_usuario = %s AND TO_CHAR(ta.fecha_asignacion, 'YYYY-MM') = %s
-    """, (id_usuario, mes_actual))
+        WHERE ta.id_usuario = %s AND ta.fecha_asignacion BETWEEN %s AND %s
+    """, (id_usuario, primer_dia, ultimo_dia))
     turnos_mes = cursor.fetchone()['total']
 
     # Si ya tiene 4 turnos, no puede seleccionar más hasta próximo mes
@@ -3257,6 +5103,7 @@ def validar_turno_usuario(id_usuario, user_role, dia, hora):
 
 # ✅ Módulo de Turnos con Trazabilidad
 @app.route('/modulo_turnos')
+@respuesta_condicional('modulo_turnos')
 def modulo_turnos():
     if not current_user.is_authenticated:
         flash('Debes iniciar sesión primero', 'error')
@@ -3267,12 +5114,8 @@ def modulo_turnos():
     
     semana_param = request.args.get('semana', type=int) or 0
     
-    if TZ:
-        fecha_base = datetime.datetime(2025, 11, 3, tzinfo=TZ)
-        hoy = now_local()
-    else:
-        fecha_base = datetime.datetime(2025, 11, 3)
-        hoy = datetime.datetime.now()
+    fecha_base = datetime.datetime.combine(motor_rotacion.fecha_base, datetime.time(), tzinfo=TZ)
+    hoy = now_local() if TZ else datetime.datetime.now()
     
     dias_transcurridos = (hoy.date() - fecha_base.date()).days
     semana_actual = (dias_transcurridos // 7) + 1
@@ -3360,16 +5203,10 @@ def generar_historial_turnos(fecha_base):
     cursor = conn.cursor()
 
     # Configuración de turnos por cédula
-    asignaciones_base = {
-        "1070963486": {"turnos": ["06:30", "08:30"]},
-        "1067949514": {"turnos": ["08:00", "06:30"]},
-        "1140870406": {"turnos": ["08:30", "09:00"]},
-        "1068416077": {"turnos": ["09:00", "08:00", "06:30"]}
-    }
+    asignaciones_base = {cedula: {"turnos": horas} for cedula, horas in motor_rotacion.patrones().items()}
     
     # Encontrar usuarios por cédula
-    cursor.execute("SELECT id, username, nombre, cedula, cargo FROM usuarios WHERE cedula IN (%s, %s, %s, %s)", tuple(asignaciones_base.keys()))
-    users_with_cedula = cursor.fetchall()
+    users_with_cedula = motor_rotacion.empleados(cursor)
 
     for user_info in users_with_cedula:
         cedula = user_info['cedula']
@@ -3381,7 +5218,23 @@ def generar_historial_turnos(fecha_base):
     
     hoy = now_local()
     semanas_transcurridas = ((hoy - fecha_base).days // 7) + 1
-    
+
+    # Turnos por (usuario, semana) de todo el periodo en una sola consulta.
+    # La semana se cuenta desde fecha_base (un lunes) y, como antes, solo de lunes a sábado.
+    ids_rotacion = [info['id_usuario'] for info in asignaciones_base.values() if 'id_usuario' in info]
+    turnos_por_semana = {}
+    if ids_rotacion and semanas_transcurridas > 0:
+        inicio = fecha_base.date()
+        cursor.execute("""
+            SELECT ta.id_usuario, (ta.fecha_asignacion - %s::date) / 7 + 1 AS semana, COUNT(*) AS total
+            FROM turnos_asignados ta
+            WHERE ta.id_usuario = ANY(%s)
+              AND ta.fecha_asignacion BETWEEN %s AND %s
+              AND (ta.fecha_asignacion - %s::date) %% 7 < 6
+            GROUP BY ta.id_usuario, semana
+        """, (inicio, ids_rotacion, inicio, inicio + datetime.timedelta(weeks=semanas_transcurridas), inicio))
+        turnos_por_semana = {(row['id_usuario'], row['semana']): row['total'] for row in cursor.fetchall()}
+
     for semana in range(1, semanas_transcurridas + 1):
         fecha_inicio = fecha_base + datetime.timedelta(weeks=semana-1)
         
@@ -3391,12 +5244,7 @@ def generar_historial_turnos(fecha_base):
                 estado_class = "info"
                 
                 # Verificar si hay turnos asignados para esta semana
-                cursor.execute("""
-                    SELECT COUNT(*) AS total FROM turnos_asignados ta
-                    JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-                    WHERE ta.id_usuario = %s AND ta.fecha_asignacion BETWEEN %s AND %s
-                """, (info['id_usuario'], fecha_inicio.date(), (fecha_inicio + datetime.timedelta(days=5)).date()))
-                turnos_count = cursor.fetchone()['total']
+                turnos_count = turnos_por_semana.get((info['id_usuario'], semana), 0)
 
                 if turnos_count > 0:
                     if semana < semanas_transcurridas:
@@ -3428,25 +5276,22 @@ def obtener_usuarios_con_turnos():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    patrones_cedula = {
-        "1070963486": ["06:30", "08:30"],
-        "1067949514": ["08:00", "06:30"],
-        "1140870406": ["08:30", "09:00"],
-        "1068416077": ["09:00", "08:00", "06:30"]
-    }
-    
-    cursor.execute("SELECT id, username, nombre, cedula, cargo FROM usuarios WHERE cedula IN (%s, %s, %s, %s)", tuple(patrones_cedula.keys()))
-    users_with_cedula = cursor.fetchall()
+    patrones_cedula = motor_rotacion.patrones()
+    users_with_cedula = motor_rotacion.empleados(cursor)
+
+    # Turnos de hoy de todos los empleados en rotación
+    turnos_hoy = {}
+    if users_with_cedula:
+        cursor.execute("""
+            SELECT ta.id_usuario, COUNT(*) AS total FROM turnos_asignados ta
+            WHERE ta.id_usuario = ANY(%s) AND ta.fecha_asignacion = %s
+            GROUP BY ta.id_usuario
+        """, ([u['id'] for u in users_with_cedula], today_local_iso()))
+        turnos_hoy = {row['id_usuario']: row['total'] for row in cursor.fetchall()}
 
     for user_info in users_with_cedula:
         cedula = user_info['cedula']
-        
-        # Contar turnos del usuario para hoy
-        cursor.execute("""
-            SELECT COUNT(*) AS total FROM turnos_asignados ta
-            WHERE ta.id_usuario = %s AND ta.fecha_asignacion = %s
-        """, (user_info['id'], today_local_iso()))
-        total_turnos = cursor.fetchone()['total']
+        total_turnos = turnos_hoy.get(user_info['id'], 0)
         
         usuarios_info.append({
             'usuario': user_info['username'],
@@ -3520,6 +5365,7 @@ def resetear_clave(token):
 
 @app.route('/turnos_mensual')
 @login_required
+@respuesta_condicional('turnos_mensual')
 def turnos_mensual():
     if not current_user.is_authenticated:
         flash('Debes iniciar sesión primero', 'error')
@@ -3537,18 +5383,27 @@ def turnos_mensual():
         9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
     }
     
-    patrones_cedula = {
-        "1070963486": ["06:30", "08:30"],
-        "1067949514": ["08:00", "06:30"],
-        "1140870406": ["08:30", "09:00"],
-        "1068416077": ["09:00", "08:00", "06:30"]
-    }
+    patrones_cedula = motor_rotacion.patrones()
     
     LIMITE_MENSUAL_TURNOS = 20
+    primer_dia, ultimo_dia = rango_mes(ano, mes)
     
     gestores_data = []
-    cursor.execute("SELECT id, username, nombre, cedula, cargo FROM usuarios WHERE cedula IN (%s, %s, %s, %s)", tuple(patrones_cedula.keys()))
-    gestores_db = cursor.fetchall()
+    gestores_db = motor_rotacion.empleados(cursor)
+
+    # Turnos del mes (con su asistencia) de todos los gestores en una sola consulta
+    turnos_por_usuario = {}
+    if gestores_db:
+        cursor.execute("""
+            SELECT ta.id_usuario, ta.fecha_asignacion, td.dia_semana, td.hora, ra.inicio, ra.horas_trabajadas
+            FROM turnos_asignados ta
+            JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
+            LEFT JOIN registros_asistencia ra ON ta.id_usuario = ra.id_usuario AND ta.fecha_asignacion = ra.fecha
+            WHERE ta.id_usuario = ANY(%s) AND ta.fecha_asignacion BETWEEN %s AND %s
+            ORDER BY ta.fecha_asignacion, td.hora
+        """, ([u['id'] for u in gestores_db], primer_dia, ultimo_dia))
+        for row in cursor.fetchall():
+            turnos_por_usuario.setdefault(row['id_usuario'], []).append(row)
 
     for user_info in gestores_db:
         user_id = user_info['id']
@@ -3556,15 +5411,7 @@ def turnos_mensual():
         cedula = user_info['cedula']
 
         turnos_usados_mes = []
-        cursor.execute("""
-            SELECT ta.fecha_asignacion, td.dia_semana, td.hora, ra.inicio, ra.horas_trabajadas
-            FROM turnos_asignados ta
-            JOIN turnos_disponibles td ON ta.id_turno_disponible = td.id
-            LEFT JOIN registros_asistencia ra ON ta.id_usuario = ra.id_usuario AND ta.fecha_asignacion = ra.fecha
-            WHERE ta.id_usuario = %s AND EXTRACT(YEAR FROM ta.fecha_asignacion) = %s AND EXTRACT(MONTH FROM ta.fecha_asignacion) = %s
-            ORDER BY ta.fecha_asignacion, td.hora
-        """, (user_id, ano, mes))
-        user_shifts_and_records = cursor.fetchall()
+        user_shifts_and_records = turnos_por_usuario.get(user_id, [])
 
         for record in user_shifts_and_records:
             # Ahora iteramos sobre todos los turnos asignados
@@ -3673,6 +5520,7 @@ def _do_importar_turnos_historicos():
     imported_count = 0
     skipped_count = 0
     error_messages = []
+    registros_importados = []
 
     for user_name, user_data in raw_shift_data.items():
         cedula = user_data["cedula"]
@@ -3730,15 +5578,12 @@ def _do_importar_turnos_historicos():
                     continue
 
                 # Obtener id_turno_disponible
-                cursor.execute("SELECT id FROM turnos_disponibles WHERE dia_semana = %s AND hora = %s", (dia_semana, hora_24h))
-                turno_disponible_id_row = cursor.fetchone()
+                id_turno_disponible = catalogo_turnos.id_turno(dia_semana, hora_24h)
 
-                if not turno_disponible_id_row:
+                if not id_turno_disponible:
                     error_messages.append(f"Turno disponible '{dia_semana} {hora_24h}' no encontrado en la base de datos para {user_name} en {date_str}. Asegúrate de que init_db() se ejecutó correctamente. Saltando.")
                     skipped_count += 1
                     continue
-                
-                id_turno_disponible = turno_disponible_id_row['id']
 
                 # ✅ RESTAURAR TURNO HISTÓRICO: Insertar en turnos_asignados para la fecha pasada
                 cursor.execute(
@@ -3774,6 +5619,7 @@ def _do_importar_turnos_historicos():
                     "INSERT INTO registros_asistencia (id_usuario, fecha, inicio) VALUES (%s, %s, %s) ON CONFLICT (id_usuario, fecha) DO NOTHING",
                     (id_usuario, fecha_asignacion, inicio_dt_tz.isoformat())
                 )
+                registros_importados.append((id_usuario, fecha_asignacion))
                 # No necesitamos contar esto por separado, el conteo de turnos es suficiente
 
             except Exception as e:
@@ -3781,6 +5627,9 @@ def _do_importar_turnos_historicos():
                 logger.error(f"Error importando turno histórico: {e}")
                 skipped_count += 1
 
+    # Resúmenes de los días importados, en bloque
+    actualizar_resumen_asistencia(cursor, registros_importados)
+    incrementar_version_datos(cursor)
     conn.commit()
     cursor.close()
     conn.close()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+"""
+Prueba de carga del pico de marcación de la mañana contra un PostgreSQL local.
+
+1. --sembrar crea N empleados (usuarios carga_NNNNNN) con M meses de registros_asistencia
+   y turnos_asignados, y reconstruye los resúmenes. Los registros de hoy quedan vacíos.
+2. La carga simula la ráfaga de las 6:30: cada empleado hace login, POST /marcar_asistencia
+   y sigue la redirección a /dashboard, con --concurrencia hilos a la vez. Corre la app
+   en proceso (cliente de pruebas de Flask), así que mide app + base sin red de por medio.
+3. Reporta p50/p95/p99, throughput y consultas por petición para cada endpoint, y guarda un
+   JSON (--salida) que --comparar enfrenta con el de otro commit.
+
+Antes de cada corrida se borran las marcaciones de hoy de los empleados de carga, para que
+la ráfaga siempre registre entradas. Usa las mismas variables DB_* / DATABASE_URL que la app.
+
+Uso:
+    python benchmarks/bench_carga_marcacion.py --sembrar --empleados 2000 --meses 6
+    python benchmarks/bench_carga_marcacion.py --concurrencia 32 --salida carga_antes.json
+    python benchmarks/bench_carga_marcacion.py --concurrencia 32 --comparar carga_antes.json
+    python benchmarks/bench_carga_marcacion.py --limpiar
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAIZ)
+
+from werkzeug.security import generate_password_hash
+
+from app import (app, limiter, init_db, get_db_connection, reconstruir_resumen_asistencia,
+                 incrementar_version_datos, cache_usuarios, fragmentos_dashboard, _sql_horas, now_local, TZ)
+
+PREFIJO = 'carga_'
+CONTRASENA = 'Carga123!'
+ENDPOINTS = ('POST /login', 'POST /marcar_asistencia', 'GET /dashboard')
+
+# La app informa las consultas de cada petición en Server-Timing (ver CursorInstrumentado)
+_CONSULTAS_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) consultas"')
+
+
+def sembrar(empleados, meses):
+    """Empleados de carga con `meses` de historial hasta ayer y turnos hasta dentro de dos semanas."""
+    hoy = now_local().date()
+    desde = hoy - datetime.timedelta(days=30 * meses)
+    ayer = hoy - datetime.timedelta(days=1)
+    zona = TZ.key if TZ else 'UTC'
+    ordinarias, extras = _sql_horas('ini', 'sal')
+
+    with app.app_context():
+        init_db()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """INSERT INTO usuarios (username, contrasena, admin, nombre, cedula, cargo, correo, telefono)
+               SELECT %(prefijo)s || lpad(i::text, 6, '0'), %(hash)s, FALSE, 'Empleado de carga ' || i,
+                      'carga-' || i, 'Gestor', %(prefijo)s || i || '@carga.local', ''
+               FROM generate_series(1, %(n)s) i
+               ON CONFLICT (username) DO NOTHING""",
+            {'prefijo': PREFIJO, 'hash': generate_password_hash(CONTRASENA), 'n': empleados})
+        filtro = {'patron': PREFIJO.replace('_', r'\_') + '%', 'desde': desde, 'ayer': ayer,
+                  'hasta': hoy + datetime.timedelta(days=13), 'zona': zona}
+        # Entrada entre 6:30 y 8:00, jornadas de 8 a 11 horas; lunes a sábado
+        cursor.execute(
+            f"""INSERT INTO registros_asistencia (id_usuario, fecha, inicio, salida, horas_trabajadas, horas_extras)
+                SELECT id_usuario, fecha, ini, sal, {ordinarias}, {extras}
+                FROM (SELECT id_usuario, fecha, ini, ini + (8 + random() * 3) * INTERVAL '1 hour' AS sal
+                      FROM (SELECT u.id AS id_usuario, d::date AS fecha,
+                                   (d::date + TIME '06:30' + random() * INTERVAL '90 minutes') AT TIME ZONE %(zona)s AS ini
+                            FROM usuarios u, generate_series(%(desde)s::date, %(ayer)s::date, INTERVAL '1 day') d
+                            WHERE u.username LIKE %(patron)s AND EXTRACT(ISODOW FROM d) < 7) s) x
+                ON CONFLICT (id_usuario, fecha) DO NOTHING""", filtro)
+        cursor.execute(
+            """INSERT INTO turnos_asignados (id_usuario, id_turno_disponible, fecha_asignacion)
+               SELECT u.id, td.id, d::date
+               FROM usuarios u
+               CROSS JOIN generate_series(%(desde)s::date, %(hasta)s::date, INTERVAL '1 day') d
+               JOIN turnos_disponibles td ON td.dia_semana = TO_CHAR(d, 'FMday') AND td.hora = '08:00'
+               WHERE u.username LIKE %(patron)s AND EXTRACT(ISODOW FROM d) < 7
+               ON CONFLICT DO NOTHING""", filtro)
+        reconstruir_resumen_asistencia(cursor, desde, ayer)
+        incrementar_version_datos(cursor)
+        conn.commit()
+        cursor.close()
+    print(f"Sembrados {empleados} empleados con historial desde {desde}.")
+
+
+def limpiar():
+    with app.app_context():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        patron = PREFIJO.replace('_', r'\_') + '%'
+        ids = "SELECT id FROM usuarios WHERE username LIKE %s"
+        cursor.execute(f"DELETE FROM resumen_asistencia WHERE id_usuario IN ({ids})", (patron,))
+        cursor.execute(f"DELETE FROM registros_asistencia WHERE id_usuario IN ({ids})", (patron,))
+        cursor.execute("DELETE FROM usuarios WHERE username LIKE %s", (patron,))
+        incrementar_version_datos(cursor)
+        conn.commit()
+        cursor.close()
+    print("Empleados de carga eliminados.")
+
+
+def preparar_corrida(activos):
+    """Borra las marcaciones de hoy de los empleados de carga y devuelve los usernames a usar."""
+    hoy = now_local().date()
+    with app.app_context():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        patron = PREFIJO.replace('_', r'\_') + '%'
+        cursor.execute("SELECT username FROM usuarios WHERE username LIKE %s ORDER BY username LIMIT %s", (patron, activos))
+        usernames = [fila['username'] for fila in cursor.fetchall()]
+        cursor.execute("""DELETE FROM registros_asistencia WHERE fecha = %s
+                          AND id_usuario IN (SELECT id FROM usuarios WHERE username LIKE %s)""", (hoy, patron))
+        reconstruir_resumen_asistencia(cursor, hoy, hoy)
+        incrementar_version_datos(cursor)
+        conn.commit()
+        cursor.close()
+    return usernames
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return None
+    return valores[max(0, math.ceil(p / 100.0 * len(valores)) - 1)]
+
+
+def jornada(username, medidas, candado):
+    """Login, marcación y dashboard de un empleado; cada petición se mide por separado."""
+    cliente = app.test_client()
+    pasos = [
+        ('POST /login', lambda: cliente.post('/login', data={'usuario': username, 'contrasena': CONTRASENA}), 302),
+        ('POST /marcar_asistencia', lambda: cliente.post(
+            '/marcar_asistencia',
+            data={'client_timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat()}), 302),
+        ('GET /dashboard', lambda: cliente.get('/dashboard'), 200),
+    ]
+    for endpoint, peticion, esperado in pasos:
+        consultas = 0
+        inicio = time.perf_counter()
+        try:
+            respuesta = peticion()
+            ok = respuesta.status_code == esperado
+            if ok and esperado == 302:  # Un login fallido también redirige, pero de vuelta a /login
+                ok = respuesta.location.endswith('/dashboard')
+            encontrado = _CONSULTAS_SERVER_TIMING.search(respuesta.headers.get('Server-Timing', ''))
+            consultas = int(encontrado.group(2)) if encontrado else 0
+        except Exception:
+            ok = False
+        transcurrido = time.perf_counter() - inicio
+        with candado:
+            medidas[endpoint].append((transcurrido, consultas, ok))
+        if not ok:
+            return
+
+
+def correr(usernames, concurrencia):
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['PERF_SERVER_TIMING'] = True  # Las consultas por petición salen de Server-Timing
+    limiter.enabled = False  # Todos los clientes vienen de la misma IP
+    cache_usuarios.invalidar()
+    fragmentos_dashboard.invalidar()
+    medidas = {endpoint: [] for endpoint in ENDPOINTS}
+    candado = threading.Lock()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        for futuro in [ejecutor.submit(jornada, u, medidas, candado) for u in usernames]:
+            futuro.result()
+    duracion = time.perf_counter() - inicio
+
+    endpoints = {}
+    for endpoint, filas in medidas.items():
+        latencias = sorted(t * 1000 for t, _, ok in filas if ok)
+        consultas = [n for _, n, ok in filas if ok]
+        endpoints[endpoint] = {
+            'peticiones': len(filas),
+            'errores': sum(1 for _, _, ok in filas if not ok),
+            'p50_ms': percentil(latencias, 50),
+            'p95_ms': percentil(latencias, 95),
+            'p99_ms': percentil(latencias, 99),
+            'media_ms': sum(latencias) / len(latencias) if latencias else None,
+            'rps': len(latencias) / duracion if duracion else None,
+            'consultas_media': sum(consultas) / len(consultas) if consultas else None,
+            'consultas_max': max(consultas) if consultas else None,
+        }
+    total = sum(len(f) for f in medidas.values())
+    return {'duracion_s': duracion, 'throughput_rps': total / duracion if duracion else None, 'endpoints': endpoints}
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _fmt(valor, ancho=9, decimales=1):
+    return f"{valor:>{ancho}.{decimales}f}" if valor is not None else f"{'-':>{ancho}}"
+
+
+def imprimir(resultado, base=None):
+    print(f"Commit {resultado['commit']}: {resultado['parametros']['empleados']} empleados, "
+          f"concurrencia {resultado['parametros']['concurrencia']}, {resultado['duracion_s']:.1f}s, "
+          f"{resultado['throughput_rps']:.1f} req/s")
+    print(f"{'Endpoint':<26} {'Pet.':>6} {'Err.':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'Consultas':>10}")
+    for endpoint, m in resultado['endpoints'].items():
+        print(f"{endpoint:<26} {m['peticiones']:>6} {m['errores']:>5} {_fmt(m['p50_ms'])} {_fmt(m['p95_ms'])} "
+              f"{_fmt(m['p99_ms'])} {_fmt(m['rps'])} {_fmt(m['consultas_media'], 10)}")
+    if base:
+        print(f"\nFrente a {base.get('commit')} (variación relativa):")
+        for endpoint, m in resultado['endpoints'].items():
+            previo = base['endpoints'].get(endpoint)
+            if not previo:
+                continue
+            cambios = []
+            for clave in ('p50_ms', 'p95_ms', 'p99_ms', 'consultas_media'):
+                if m[clave] is not None and previo.get(clave):
+                    cambios.append(f"{clave} {100.0 * (m[clave] - previo[clave]) / previo[clave]:+.1f}%")
+            print(f"  {endpoint:<26} " + ", ".join(cambios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sembrar', action='store_true', help='Crea los empleados e historial de carga')
+    parser.add_argument('--limpiar', action='store_true', help='Elimina los empleados de carga y sus datos')
+    parser.add_argument('--empleados', type=int, default=500, help='Empleados a sembrar / a usar en la ráfaga')
+    parser.add_argument('--meses', type=int, default=6, help='Meses de historial a sembrar')
+    parser.add_argument('--concurrencia', type=int, default=16, help='Empleados marcando a la vez')
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para comparar')
+    args = parser.parse_args()
+
+    if args.limpiar:
+        limpiar()
+        return
+    if args.sembrar:
+        sembrar(args.empleados, args.meses)
+    usernames = preparar_corrida(args.empleados)
+    if not usernames:
+        parser.error('No hay empleados de carga: ejecute primero con --sembrar')
+    resultado = correr(usernames, args.concurrencia)
+
+    resultado = {
+        'commit': commit_actual(),
+        'fecha': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'parametros': {'empleados': len(usernames), 'concurrencia': args.concurrencia,
+                       'db_pool_max': int(os.environ.get('DB_POOL_MAX', 10))},
+        **resultado,
+    }
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+    imprimir(resultado, base)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado guardado en {args.salida}")
+
+
+if __name__ == '__main__':
+    main()
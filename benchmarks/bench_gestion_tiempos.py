@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Benchmark de /admin/gestion_tiempos con 10, 100 y 1000 empleados.
+
+Renderiza la página completa (consultas + cruce en memoria + plantilla) sobre una
+conexión simulada que añade un tiempo de ida y vuelta fijo por sentencia (--rtt-ms),
+que es el costo dominante cuando la página hacía 2 consultas por (usuario, día).
+
+Uso:
+    python benchmarks/bench_gestion_tiempos.py [--rtt-ms 0.5] [--usuarios 10 100 1000]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from unittest.mock import patch
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAIZ)
+sys.path.append(os.path.join(RAIZ, 'tests'))
+
+from app import app, User, login_manager
+from fake_db import ConexionFalsa
+
+
+def datos_mes(num_usuarios, ano, mes):
+    """Un turno planificado y un registro de asistencia por empleado y día del mes."""
+    import calendar
+    dias = [datetime.date(ano, mes, d) for d in range(1, calendar.monthrange(ano, mes)[1] + 1)]
+    usuarios = [{'id': i, 'username': f'user{i}', 'nombre': f'Usuario {i:04d}'} for i in range(num_usuarios)]
+    planificados = [{'id_usuario': u['id'], 'fecha_asignacion': d, 'hora': '08:00'} for u in usuarios for d in dias]
+    reales = []
+    for u in usuarios:
+        for d in dias:
+            inicio = datetime.datetime.combine(d, datetime.time(8, 0))
+            reales.append({'id': len(reales) + 1, 'id_usuario': u['id'], 'fecha': d, 'inicio': inicio,
+                           'salida': inicio + datetime.timedelta(hours=10), 'horas_trabajadas': 8.0, 'horas_extras': 1.0})
+    resumen = [{'id_usuario': u['id'], 'total_turnos': len(dias), 'total_extras': len(dias), 'costo_ajustado': len(dias) * 1.25}
+               for u in usuarios]
+    return usuarios, planificados, reales, resumen, len(dias)
+
+
+def responder_con_latencia(datos, rtt):
+    usuarios, planificados, reales, resumen, _ = datos
+
+    def responder(sql, params):
+        time.sleep(rtt)
+        if 'FROM usuarios WHERE bloqueado' in sql:
+            return usuarios
+        if 'ta.fecha_asignacion, td.hora' in sql:
+            return planificados
+        if 'FROM registros_asistencia' in sql and 'WHERE fecha BETWEEN' in sql and 'SUM' not in sql:
+            return reales
+        if 'costo_ajustado' in sql:
+            return resumen
+        return []
+
+    return responder
+
+
+def medir(num_usuarios, rtt, ano=2025, mes=11):
+    datos = datos_mes(num_usuarios, ano, mes)
+    conn = ConexionFalsa(responder_con_latencia(datos, rtt))
+    admin = User(1, 'admin', True, 'Administrador', 'N/A', 'COORDINADOR', 'admin@empresa.com', '', False, None)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with patch('app.get_db_connection', return_value=conn), \
+         patch.object(login_manager, '_user_callback', lambda user_id: admin):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['_user_id'] = '1'
+                sess['_fresh'] = True
+            inicio = time.perf_counter()
+            respuesta = client.get(f'/admin/gestion_tiempos?mes={mes}&ano={ano}')
+            transcurrido = time.perf_counter() - inicio
+
+    assert respuesta.status_code == 200, respuesta.status_code
+    num_dias = datos[-1]
+    consultas_previas = 2 * num_usuarios * num_dias + 2 * num_usuarios + 4  # Implementación anterior
+    return conn.num_consultas, consultas_previas, transcurrido
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='Latencia simulada por sentencia (ms)')
+    parser.add_argument('--usuarios', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    print(f"RTT simulado por sentencia: {args.rtt_ms} ms")
+    print(f"{'Usuarios':>9} {'Consultas':>10} {'Antes (est.)':>13} {'Latencia (ms)':>14} {'Antes (est. ms)':>16}")
+    for n in args.usuarios:
+        consultas, previas, segundos = medir(n, args.rtt_ms / 1000.0)
+        # Estimación de la versión anterior: mismo trabajo en memoria + RTT por cada consulta extra
+        previa_ms = segundos * 1000 + (previas - consultas) * args.rtt_ms
+        print(f"{n:>9} {consultas:>10} {previas:>13} {segundos * 1000:>14.1f} {previa_ms:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark del cálculo de costos de nómina sobre registros sintéticos (1M por defecto).
+
+Compara el cálculo fila a fila que usan las exportaciones sin NumPy con
+MotorCostos.costos() en su versión Python pura y con NumPy (si está instalado).
+
+Uso:
+    python benchmarks/bench_motor_costos.py [--registros 1000000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from unittest.mock import patch
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAIZ)
+
+import app as modulo_app
+from app import MotorCostos
+
+
+def registros_sinteticos(n, semilla=42):
+    """Columnas (fechas, horas, extras) de `n` registros repartidos en dos años."""
+    azar = random.Random(semilla)
+    inicio = datetime.date(2025, 1, 1)
+    fechas = [inicio + datetime.timedelta(days=azar.randrange(730)) for _ in range(n)]
+    horas = [round(azar.uniform(4, 8), 2) for _ in range(n)]
+    extras = [round(azar.choice((0, 0, 0, azar.uniform(0, 4))), 2) for _ in range(n)]
+    return fechas, horas, extras
+
+
+def costos_fila_a_fila(fechas, horas, extras, motor=MotorCostos()):
+    """Cálculo de la exportación sin NumPy: valor de hora por año del motor, recargo por registro."""
+    valores_hora = {}
+    recargos = motor.RECARGOS
+    ordinarias, costo_extras, total = [], [], []
+    for fecha, h, e in zip(fechas, horas, extras):
+        valor_hora_ordinaria = valores_hora.get(fecha.year)
+        if valor_hora_ordinaria is None:
+            valor_hora_ordinaria = valores_hora[fecha.year] = motor.valor_hora(fecha.year)
+        costo_ordinarias = float(h) * valor_hora_ordinaria
+        costo_extra = float(e) * valor_hora_ordinaria * recargos[fecha.weekday()]
+        ordinarias.append(costo_ordinarias)
+        costo_extras.append(costo_extra)
+        total.append(costo_ordinarias + costo_extra)
+    return {'ordinarias': ordinarias, 'extras': costo_extras, 'total': total}
+
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registros', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"Generando {args.registros:,} registros sintéticos...")
+    columnas = registros_sinteticos(args.registros)
+    motor = MotorCostos()
+
+    costos_filas, t_filas = medir(costos_fila_a_fila, *columnas)
+    with patch('app.np', None):
+        costos_py, t_py = medir(motor.costos, *columnas)
+    print(f"{'Método':<22} {'Tiempo (s)':>11} {'Registros/s':>14} {'Total':>20}")
+    print(f"{'Fila a fila':<22} {t_filas:>11.3f} {args.registros / t_filas:>14,.0f} {sum(costos_filas['total']):>20,.2f}")
+    print(f"{'Motor (Python)':<22} {t_py:>11.3f} {args.registros / t_py:>14,.0f} {sum(costos_py['total']):>20,.2f}")
+
+    if modulo_app.np is None:
+        print("NumPy no está instalado: se omite la versión vectorizada.")
+        return
+    np = modulo_app.np
+    costos_np, t_np = medir(motor.costos, *columnas)
+    print(f"{'Motor (NumPy)':<22} {t_np:>11.3f} {args.registros / t_np:>14,.0f} {float(costos_np['total'].sum()):>20,.2f}")
+
+    # Con columnas ya en arrays (p. ej. leídas por lotes) se evita la conversión desde listas
+    arrays = (np.asarray(columnas[0], dtype='datetime64[D]'), np.asarray(columnas[1]), np.asarray(columnas[2]))
+    costos_arr, t_arr = medir(motor.costos, *arrays)
+    print(f"{'Motor (NumPy, arrays)':<22} {t_arr:>11.3f} {args.registros / t_arr:>14,.0f} {float(costos_arr['total'].sum()):>20,.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import argparse
+import datetime
+
+from app import app, get_db_connection, motor_rotacion, transaccion_db
+
+def generar_rotacion(desde, hasta):
+    """
+    Asigna a todos los empleados con patrón de rotación sus turnos entre `desde`
+    y `hasta` (inclusive) en un solo INSERT. Los días ya asignados se respetan.
+    """
+    with app.app_context():
+        with transaccion_db() as conn:
+            cursor = conn.cursor()
+            empleados = [(e['id'], e['cedula']) for e in motor_rotacion.empleados(cursor)]
+            insertados = motor_rotacion.generar(cursor, empleados, desde, hasta)
+            cursor.close()
+        get_db_connection().commit()
+        print(f"✅ {insertados} turnos asignados a {len(empleados)} empleados entre {desde} y {hasta}.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera los turnos rotativos de un periodo.')
+    parser.add_argument('desde', type=datetime.date.fromisoformat, help='Fecha inicial (YYYY-MM-DD)')
+    parser.add_argument('hasta', type=datetime.date.fromisoformat, help='Fecha final (YYYY-MM-DD)')
+    args = parser.parse_args()
+    generar_rotacion(args.desde, args.hasta)
@@ -0,0 +1,28 @@
+import argparse
+import datetime
+
+from app import app, get_db_connection, reconstruir_resumen_asistencia
+
+def reconstruir(desde=None, hasta=None):
+    """
+    Rehace la tabla resumen_asistencia desde registros_asistencia. Sin fechas
+    reconstruye todo el histórico; con fechas, solo los periodos que tocan el rango.
+    Útil tras cargas masivas o correcciones hechas directamente en la base de datos.
+    """
+    with app.app_context():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        reconstruir_resumen_asistencia(cursor, desde, hasta)
+        conn.commit()
+        cursor.close()
+        rango = f"entre {desde} y {hasta}" if desde else "completo"
+        print(f"✅ Resumen de asistencia reconstruido ({rango}).")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconstruye los resúmenes de asistencia.')
+    parser.add_argument('--desde', type=datetime.date.fromisoformat, help='Fecha inicial (YYYY-MM-DD)')
+    parser.add_argument('--hasta', type=datetime.date.fromisoformat, help='Fecha final (YYYY-MM-DD)')
+    args = parser.parse_args()
+    if bool(args.desde) != bool(args.hasta):
+        parser.error('--desde y --hasta deben indicarse juntos')
+    reconstruir(args.desde, args.hasta)
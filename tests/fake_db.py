@@ -0,0 +1,82 @@
+"""
+Conexión/cursor de prueba que registra cada sentencia ejecutada.
+Permite contar consultas por página sin un PostgreSQL real: las filas que
+devuelve cada SELECT las decide una función `responder(sql, params)`.
+"""
+
+
+class FilaFalsa(dict):
+    """Imita psycopg2.extras.DictRow: acceso por nombre de columna y por posición."""
+
+    def __getitem__(self, clave):
+        if isinstance(clave, int):
+            return list(self.values())[clave]
+        return super().__getitem__(clave)
+
+
+class CursorFalso:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.connection = conexion  # Lo usa psycopg2.extras.execute_values
+        self._filas = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        if isinstance(sql, bytes):  # Sentencias armadas por execute_values
+            sql = sql.decode()
+        self.conexion.sentencias.append((sql, params))
+        self._filas = [FilaFalsa(f) for f in (self.conexion.responder(sql, params) or [])]
+        self.rowcount = len(self._filas)
+
+    def mogrify(self, sql, params=None):
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        return (sql % tuple(repr(p) for p in params) if params else sql).encode()
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchall(self):
+        filas, self._filas = self._filas, []
+        return filas
+
+    def fetchmany(self, size=None):
+        size = size or 1
+        filas, self._filas = self._filas[:size], self._filas[size:]
+        return filas
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def __init__(self, responder=None):
+        self.responder = responder or (lambda sql, params: [])
+        self.sentencias = []
+        self.closed = False
+        self.encoding = 'UTF8'
+
+    def cursor(self, *args, **kwargs):
+        return CursorFalso(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    @property
+    def num_consultas(self):
+        return len(self.sentencias)
@@ -0,0 +1,113 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+
+
+class DummyAdminUser:
+    admin = True
+    id = 1
+    username = "admin"
+    nombre = "Administrador"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "1"
+    def is_admin(self):
+        return True
+
+
+def responder_usuarios(num_usuarios):
+    """Empresa con `num_usuarios` empleados; simula el rango por username y el LIMIT."""
+    usuarios = [{'id': i, 'username': f'user{i:05d}', 'nombre': f'Usuario {i}', 'cedula': str(i), 'cargo': 'Gestor',
+                 'correo': f'u{i}@empresa.com', 'telefono': '', 'admin': False, 'bloqueado': False}
+                for i in range(num_usuarios)]
+
+    def responder(sql, params):
+        if 'FROM usuarios' in sql and 'ORDER BY username' in sql:
+            filas = usuarios
+            if 'username >' in sql:
+                filas = [u for u in filas if u['username'] > params[0]]
+            if 'username <' in sql:
+                filas = [u for u in reversed(filas) if u['username'] < params[0]]
+            return filas[:params[-1]]
+        if 'unnest' in sql:
+            return [{'id': i, 'registros': 100, 'horas_trabajadas': 800, 'horas_extras': 12.5,
+                     'ultimo_registro': datetime.date(2025, 11, 3)} for i in params[0]]
+        if 'FROM registros_asistencia WHERE id_usuario' in sql:
+            return [{'fecha': datetime.date(2025, 11, 3), 'inicio': datetime.datetime(2025, 11, 3, 8, 0),
+                     'salida': datetime.datetime(2025, 11, 3, 18, 0), 'horas_trabajadas': 8, 'horas_extras': 2}]
+        if 'FROM turnos_asignados' in sql:
+            return [{'fecha_asignacion': datetime.date(2025, 11, 10), 'hora': '08:00'}]
+        return []
+
+    return responder
+
+
+class AdminUsuariosPaginacionTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def pedir(self, num_usuarios, url):
+        conn = ConexionFalsa(responder_usuarios(num_usuarios))
+        with self.client, patch('app.get_db_connection', return_value=conn):
+            login_user(DummyAdminUser())
+            response = self.client.get(url)
+            logout_user()
+        return response, conn
+
+    def test_primera_pagina_y_siguiente(self):
+        response, _ = self.pedir(120, '/admin/usuarios?por_pagina=50')
+        self.assertEqual(response.status_code, 200)
+        usuarios = self.get_context_variable('usuarios')
+        paginacion = self.get_context_variable('paginacion')
+        self.assertEqual(len(usuarios), 50)
+        self.assertEqual(usuarios['user00000']['registros'], 100)
+        self.assertIsNone(paginacion['anterior'])
+        self.assertEqual(paginacion['siguiente'], 'user00049')
+
+        self.pedir(120, '/admin/usuarios?por_pagina=50&despues=user00099')
+        usuarios = self.get_context_variable('usuarios')
+        self.assertEqual(list(usuarios)[0], 'user00100')
+        self.assertEqual(len(usuarios), 20)
+        self.assertIsNone(self.get_context_variable('paginacion')['siguiente'])
+
+    def test_pagina_anterior_mantiene_el_orden(self):
+        self.pedir(120, '/admin/usuarios?por_pagina=50&antes=user00050')
+        usuarios = list(self.get_context_variable('usuarios'))
+        self.assertEqual(usuarios[0], 'user00000')
+        self.assertEqual(usuarios[-1], 'user00049')
+        self.assertIsNone(self.get_context_variable('paginacion')['anterior'])
+
+    def test_numero_de_consultas_constante(self):
+        """El listado no consulta el historial por usuario: dos sentencias por página."""
+        _, pocos = self.pedir(3, '/admin/usuarios')
+        _, muchos = self.pedir(5000, '/admin/usuarios?por_pagina=200')
+        self.assertEqual(pocos.num_consultas, 2)
+        self.assertEqual(muchos.num_consultas, 2)
+        self.assertFalse(any('id_usuario = %s' in sql for sql, _ in muchos.sentencias))
+
+    def test_detalle_json(self):
+        response, conn = self.pedir(3, '/admin/usuarios/1/detalle')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['success'])
+        self.assertEqual(response.json['registros'][0]['inicio'], '08:00')
+        self.assertEqual(response.json['registros'][0]['dia_semana'], 'monday')
+        self.assertEqual(response.json['turnos'], [{'fecha': '2025-11-10', 'hora': '08:00'}])
+        self.assertEqual(conn.num_consultas, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import sys
+import os
+import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from werkzeug.security import generate_password_hash
+from app import app, emitir_token_api, User, now_local
+from fake_db import ConexionFalsa
+
+
+def usuario(bloqueado=False):
+    return User(id=7, username='natalia', admin=False, nombre='Natalia', cedula='1070963486', cargo='Gestor',
+                correo='n@empresa.com', telefono='', bloqueado=bloqueado, fecha_creacion=None)
+
+
+def utc_iso(instante):
+    return instante.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class ApiMarcacionTest(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.token = emitir_token_api(7)
+
+    def marcar(self, responder, token=None, **cuerpo):
+        conn = ConexionFalsa(responder)
+        with patch('app.get_db_connection', return_value=conn), patch('app.load_user', return_value=usuario()):
+            response = self.client.post('/api/marcar', json=cuerpo,
+                                        headers={'Authorization': f'Bearer {token or self.token}'})
+        return response, conn
+
+    def test_token_con_credenciales(self):
+        fila = {'id': 7, 'contrasena': generate_password_hash('secreta'), 'bloqueado': False}
+        conn = ConexionFalsa(lambda sql, params: [fila] if 'FROM usuarios' in sql else [])
+        with patch('app.get_db_connection', return_value=conn):
+            ok = self.client.post('/api/token', json={'usuario': 'natalia', 'contrasena': 'secreta'})
+            mal = self.client.post('/api/token', json={'usuario': 'natalia', 'contrasena': 'otra'})
+        self.assertEqual(ok.status_code, 200)
+        self.assertTrue(ok.json['token'])
+        self.assertEqual(mal.status_code, 401)
+
+    def test_sin_token_o_token_alterado(self):
+        self.assertEqual(self.client.post('/api/marcar', json={}).status_code, 401)
+        response, conn = self.marcar(None, token=self.token + 'x')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(conn.num_consultas, 0)
+
+    def test_salida_devuelve_estado_y_horas_sin_plantilla(self):
+        fila = {'inicio': datetime.datetime(2025, 11, 3, 7, 0, tzinfo=datetime.timezone.utc),
+                'salida': datetime.datetime(2025, 11, 3, 17, 0, tzinfo=datetime.timezone.utc),
+                'horas_trabajadas': Decimal('8.00'), 'horas_extras': Decimal('1.00')}
+        with patch('app.render_template') as render:
+            response, conn = self.marcar(lambda sql, params: [fila] if 'RETURNING inicio, salida' in sql else [])
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['evento'], 'salida')
+        self.assertEqual(response.json['estado'], 'jornada_cerrada')
+        self.assertEqual((response.json['horas_trabajadas'], response.json['horas_extras']), (8.0, 1.0))
+        self.assertIn('ON CONFLICT (id_usuario, fecha)', conn.sentencias[0][0])
+
+    def test_nada_que_marcar_informa_horas_en_curso(self):
+        ahora = now_local().replace(second=0, microsecond=0)
+        inicio = ahora - datetime.timedelta(hours=4)
+
+        def responder(sql, params):
+            if sql.startswith('SELECT inicio, salida'):
+                return [{'inicio': inicio, 'salida': None, 'horas_trabajadas': 0, 'horas_extras': 0}]
+            return []
+
+        response, _ = self.marcar(responder, accion='inicio', client_timestamp=utc_iso(ahora))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json['estado'], 'en_jornada')
+        self.assertEqual(response.json['horas_trabajadas'], 4.0)
+
+    def test_client_timestamp_futuro_o_de_otro_dia(self):
+        futuro = now_local() + datetime.timedelta(hours=1)
+        ayer = now_local() - datetime.timedelta(days=1)
+        for instante, error in ((futuro, 'client_timestamp en el futuro'), (ayer, 'client_timestamp no es de hoy')):
+            response, conn = self.marcar(None, accion='inicio', client_timestamp=utc_iso(instante))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json['error'], error)
+            self.assertEqual(conn.num_consultas, 0)
+
+    def test_cuerpo_o_accion_que_no_son_del_tipo_esperado(self):
+        for cuerpo in ([], {'accion': ['inicio']}, {'accion': {'a': 1}}):
+            conn = ConexionFalsa()
+            with patch('app.get_db_connection', return_value=conn), patch('app.load_user', return_value=usuario()):
+                response = self.client.post('/api/marcar', json=cuerpo, headers={'Authorization': f'Bearer {self.token}'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(conn.num_consultas, 0)
+        with patch('app.get_db_connection', return_value=ConexionFalsa()), patch('app.load_user', return_value=usuario()):
+            token = self.client.post('/api/token', json=['natalia', 'secreta'])
+            lote = self.client.post('/api/marcaciones/lote', json=[{'clave': 'k1'}],
+                                    headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(token.status_code, 400)
+        self.assertEqual(lote.status_code, 400)
+
+    def test_client_timestamp_no_texto(self):
+        response, conn = self.marcar(None, accion='inicio', client_timestamp=1762169400)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['error'], 'client_timestamp inválido')
+        self.assertEqual(conn.num_consultas, 0)
+
+    def test_accion_invalida(self):
+        response, conn = self.marcar(None, accion='borrar')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(conn.num_consultas, 0)
+
+if __name__ == '__main__':
+    unittest.main()
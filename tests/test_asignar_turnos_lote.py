@@ -0,0 +1,79 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, _diferencias_turnos
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+
+
+class DummyAdminUser:
+    admin = True
+    id = "dummy_admin_user_id"
+    username = "dummy_admin_username"
+    nombre = "Dummy Admin"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return self.id
+    def is_admin(self):
+        return True
+
+
+def responder_turnos(guardados):
+    """guardados: lista de (id_usuario, fecha, id_turno) ya asignados."""
+    def responder(sql, params):
+        if 'FROM turnos_asignados WHERE fecha_asignacion BETWEEN' in sql:
+            return [{'id_usuario': u, 'fecha_asignacion': f, 'id_turno_disponible': t} for u, f, t in guardados]
+        return []
+    return responder
+
+
+class DiferenciasTurnosTest(unittest.TestCase):
+    def test_solo_cambios(self):
+        d1, d2, d3 = (datetime.date(2025, 11, d) for d in (1, 2, 3))
+        conn = ConexionFalsa(responder_turnos([(1, d1, 5), (1, d2, 5), (2, d1, 7)]))
+        enviados = {(1, d1): 5, (1, d2): 6, (1, d3): 8, (2, d1): None, (2, d2): None}
+        borrar, insertar = _diferencias_turnos(conn.cursor(), enviados)
+        self.assertEqual(borrar, [(1, d2), (2, d1)])
+        self.assertEqual(insertar, [(1, 6, d2), (1, 8, d3)])
+
+
+class AsignarTurnosLoteTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def test_mes_completo_en_pocas_sentencias(self):
+        """Guardar 30 usuarios x 30 días no debe emitir una sentencia por celda."""
+        dias = [datetime.date(2025, 11, d) for d in range(1, 31)]
+        guardados = [(u, f, 5) for u in range(30) for f in dias[:15]]
+        form = {'mes_actual': '11', 'ano_actual': '2025'}
+        for u in range(30):
+            for f in dias:
+                form[f'turno_{u}_{f.isoformat()}'] = '6' if u == 0 else ('5' if f in dias[:15] else '')
+
+        conn = ConexionFalsa(responder_turnos(guardados))
+        with self.client, patch('app.get_db_connection', return_value=conn):
+            login_user(DummyAdminUser())
+            response = self.client.post('/admin/asignar_turnos', data=form)
+            logout_user()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertLessEqual(conn.num_consultas, 5)
+        insert = [sql for sql, _ in conn.sentencias if sql.startswith('INSERT INTO turnos_asignados')]
+        self.assertEqual(len(insert), 1)
+        self.assertEqual(insert[0].count("(0,6,"), 30)  # Solo cambia el usuario 0
+        self.assertNotIn("(1,", insert[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, BitacoraAuditoria, registrar_auditoria, now_local
+from fake_db import ConexionFalsa
+
+
+class BitacoraAuditoriaTest(unittest.TestCase):
+    def test_entradas_se_escriben_por_lotes(self):
+        lotes = []
+        bitacora = BitacoraAuditoria(max_cola=1000, tamano_lote=100, intervalo=0.05)
+        with patch('app._nueva_conexion_pool', side_effect=lambda: ConexionFalsa()), \
+             patch('app.psycopg2.extras.execute_values', side_effect=lambda cur, sql, filas, page_size: lotes.append(len(filas))):
+            for i in range(250):
+                bitacora.registrar((now_local(), 'admin', 'Asignación Turno', f'detalle {i}', '127.0.0.1'))
+            bitacora.vaciar()
+            bitacora.cerrar()
+
+        self.assertEqual(sum(lotes), 250)
+        self.assertLess(len(lotes), 250)
+        self.assertTrue(all(n <= 100 for n in lotes))
+        self.assertEqual(bitacora.estadisticas()['escritas'], 250)
+
+    def test_cola_llena_no_usa_la_conexion_de_la_peticion(self):
+        peticion, propia = ConexionFalsa(), ConexionFalsa()
+        bitacora = BitacoraAuditoria(max_cola=1, intervalo=60)
+        bitacora._asegurar_hilo = lambda: None  # Sin hilo de escritura: la cola se llena
+        with app.test_request_context(), patch('app.get_db_connection', return_value=peticion), \
+             patch('app._nueva_conexion_pool', return_value=propia), \
+             patch.object(peticion, 'commit') as commit, patch.object(peticion, 'rollback') as rollback:
+            bitacora.registrar((now_local(), 'admin', 'Edición', 'uno', '127.0.0.1'))
+            bitacora.registrar((now_local(), 'admin', 'Edición', 'dos', '127.0.0.1'))
+        self.assertEqual(peticion.num_consultas, 0)
+        commit.assert_not_called()
+        rollback.assert_not_called()
+        self.assertEqual(propia.num_consultas, 1)
+        self.assertEqual(bitacora.estadisticas()['sincronas'], 1)
+
+    def test_durable_escribe_en_la_transaccion_de_la_peticion(self):
+        conn = ConexionFalsa()
+        with app.test_request_context(), patch('app.get_db_connection', return_value=conn):
+            registrar_auditoria('Edición Horas', 'detalle', usuario='admin', durable=True)
+        self.assertEqual(conn.num_consultas, 1)
+        self.assertIn('INSERT INTO bitacora_auditoria', conn.sentencias[0][0])
+
+if __name__ == '__main__':
+    unittest.main()
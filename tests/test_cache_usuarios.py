@@ -0,0 +1,57 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, load_user, cache_usuarios, invalidar_usuario_cache, CacheTTL
+from fake_db import ConexionFalsa
+
+
+def responder_usuario(sql, params):
+    if 'FROM usuarios WHERE id' in sql:
+        return [{'id': 7, 'username': 'natalia', 'admin': False, 'nombre': 'Natalia', 'cedula': '1070963486',
+                 'cargo': 'Gestor', 'correo': 'n@empresa.com', 'telefono': '', 'bloqueado': False,
+                 'fecha_creacion': None}]
+    return []
+
+
+class CacheUsuariosTest(unittest.TestCase):
+    def setUp(self):
+        cache_usuarios.invalidar()
+
+    def test_load_user_usa_cache(self):
+        conn = ConexionFalsa(responder_usuario)
+        with app.app_context(), patch('app.get_db_connection', return_value=conn):
+            primero = load_user('7')
+            segundo = load_user('7')
+        self.assertEqual(conn.num_consultas, 1)
+        self.assertIs(primero, segundo)
+        self.assertEqual(segundo.username, 'natalia')
+
+    def test_invalidacion_fuerza_recarga(self):
+        conn = ConexionFalsa(responder_usuario)
+        with app.app_context(), patch('app.get_db_connection', return_value=conn):
+            load_user('7')
+            invalidar_usuario_cache(7)
+            load_user('7')
+        self.assertEqual(conn.num_consultas, 2)
+
+    def test_expiracion_y_lru(self):
+        cache = CacheTTL(max_entradas=2, ttl=60)
+        cache.guardar('a', 1)
+        cache.guardar('b', 2)
+        cache.obtener('a')
+        cache.guardar('c', 3)  # Desaloja 'b', el menos usado
+        self.assertIsNone(cache.obtener('b'))
+        self.assertEqual(cache.obtener('a'), 1)
+
+        expirada = CacheTTL(ttl=-1)
+        expirada.guardar('a', 1)
+        self.assertIsNone(expirada.obtener('a'))
+        self.assertEqual(expirada.estadisticas()['fallos'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
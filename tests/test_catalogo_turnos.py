@@ -0,0 +1,50 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import CatalogoTurnos
+from fake_db import ConexionFalsa
+
+
+def responder_catalogo(filas):
+    def responder(sql, params):
+        if 'MAX(id)' in sql:
+            return [{'total': len(filas), 'max_id': max((f['id'] for f in filas), default=0)}]
+        if 'FROM turnos_disponibles' in sql:
+            return filas
+        return []
+    return responder
+
+
+class CatalogoTurnosTest(unittest.TestCase):
+    def setUp(self):
+        self.filas = [{'id': 1, 'dia_semana': 'monday', 'hora': '08:00'},
+                      {'id': 2, 'dia_semana': 'monday', 'hora': '08:30'}]
+        self.conn = ConexionFalsa(responder_catalogo(self.filas))
+
+    def test_busquedas_sin_consultas_repetidas(self):
+        catalogo = CatalogoTurnos()
+        with patch('app.get_db_connection', return_value=self.conn):
+            for _ in range(50):
+                self.assertEqual(catalogo.id_turno('monday', '08:30'), 2)
+            self.assertEqual(catalogo.turno(1), ('monday', '08:00'))
+            self.assertIsNone(catalogo.id_turno('sunday', '23:00'))
+        self.assertEqual(self.conn.num_consultas, 2)  # Versión + carga
+
+    def test_recarga_solo_si_cambia_la_version(self):
+        catalogo = CatalogoTurnos(intervalo_verificacion=-1)  # Verifica en cada búsqueda
+        with patch('app.get_db_connection', return_value=self.conn):
+            catalogo.id_turno('monday', '08:00')
+            catalogo.id_turno('monday', '08:00')
+            self.assertEqual(catalogo.cargas, 1)
+
+            self.filas.append({'id': 3, 'dia_semana': 'monday', 'hora': '09:00'})
+            self.assertEqual(catalogo.id_turno('monday', '09:00'), 3)
+            self.assertEqual(catalogo.cargas, 2)
+
+if __name__ == '__main__':
+    unittest.main()
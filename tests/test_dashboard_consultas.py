@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+
+
+def responder_dashboard(num_usuarios):
+    """Simula una empresa con `num_usuarios` empleados, todos con horas extras."""
+    hoy = datetime.date.today()
+
+    def responder(sql, params):
+        if 'total_registros' in sql:
+            return [{'id': i, 'username': f'user{i}', 'nombre': f'Usuario {i}',
+                     'ano': hoy.year, 'total_registros': 20, 'extras_ponderadas': 2.5, 'inicio_hoy': i % 2 == 0}
+                    for i in range(num_usuarios)]
+        if 'FILTER' in sql:
+            return [{'nombre': f'Usuario {i}', 'hoy': 1, 'semana': 2, 'mes': i}
+                    for i in range(num_usuarios)]
+        if 'SELECT username, nombre FROM usuarios' in sql:
+            return [{'username': f'user{i}', 'nombre': f'Usuario {i}'} for i in range(num_usuarios)]
+        if 'SELECT username, cargo FROM usuarios' in sql:
+            return [{'username': f'user{i}', 'cargo': 'Gestor'} for i in range(num_usuarios)]
+        if "periodo = 'dia'" in sql:
+            return [{'fecha': hoy, 'total_horas': 8 * num_usuarios}]
+        return []
+
+    return responder
+
+
+class DashboardConsultasTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def consultas_dashboard_admin(self, num_usuarios):
+        """Renderiza /dashboard como admin y retorna (respuesta, número de consultas)."""
+        class DummyAdminUser:
+            def __init__(self):
+                self.admin = True
+                self._nombre = "Dummy Admin"
+            def is_active(self):
+                return True
+            def is_authenticated(self):
+                return True
+            def get_id(self):
+                return "dummy_admin_user_id"
+            def is_admin(self):
+                return True
+            @property
+            def id(self):
+                return "dummy_admin_user_id"
+            @property
+            def username(self):
+                return "dummy_admin_username"
+            @property
+            def nombre(self):
+                return self._nombre
+
+        conn = ConexionFalsa(responder_dashboard(num_usuarios))
+        with self.client, patch('app.get_db_connection', return_value=conn):
+            login_user(DummyAdminUser())
+            response = self.client.get('/dashboard')
+            logout_user()
+        return response, conn.num_consultas
+
+    def test_dashboard_admin_renderiza(self):
+        response, _ = self.consultas_dashboard_admin(3)
+        self.assertEqual(response.status_code, 200)
+        self.assert_template_used('dashboard.html')
+        self.assertEqual(self.get_context_variable('total_registros'), 60)
+        self.assertEqual(self.get_context_variable('usuarios_iniciados_hoy'), 2)
+        self.assertEqual(len(self.get_context_variable('resumen_horas_extras')), 3)
+
+    def test_numero_de_consultas_constante(self):
+        """El número de consultas no debe crecer con la cantidad de empleados."""
+        _, consultas_pocos = self.consultas_dashboard_admin(3)
+        _, consultas_muchos = self.consultas_dashboard_admin(300)
+        self.assertEqual(consultas_pocos, consultas_muchos)
+        self.assertLessEqual(consultas_muchos, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+import time
+import threading
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, CacheFragmentos, fragmentos_dashboard, incrementar_version_datos, VersionDatosDiferida
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+from test_dashboard_consultas import responder_dashboard
+
+
+class DummyAdminUser:
+    admin = True
+    id = 1
+    username = "admin"
+    nombre = "Administrador"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "1"
+    def is_admin(self):
+        return True
+
+
+class CacheFragmentosTest(unittest.TestCase):
+    def test_version_distinta_regenera(self):
+        cache = CacheFragmentos()
+        generados = []
+        generar = lambda: generados.append(1) or f'<div>{len(generados)}</div>'
+        self.assertEqual(cache.obtener('semana', '2025-11-03', 1, generar), '<div>1</div>')
+        self.assertEqual(cache.obtener('semana', '2025-11-03', 1, generar), '<div>1</div>')
+        self.assertEqual(cache.obtener('semana', '2025-11-03', 2, generar), '<div>2</div>')
+        self.assertEqual(cache.estadisticas()['secciones']['semana'], {'aciertos': 1, 'fallos': 2})
+
+    def test_sin_version_no_cachea(self):
+        cache = CacheFragmentos()
+        generados = []
+        for _ in range(3):
+            cache.obtener('mes', '2025-11', None, lambda: generados.append(1) or 'x')
+        self.assertEqual(len(generados), 3)
+        self.assertEqual(cache.estadisticas()['entradas'], 0)
+
+
+class VersionDatosDiferidaTest(unittest.TestCase):
+    def test_en_peticion_se_sube_una_vez_al_final(self):
+        conn = ConexionFalsa()
+        with patch('app.version_datos_diferida') as diferida:
+            with app.app_context():
+                incrementar_version_datos(conn.cursor())
+                incrementar_version_datos(conn.cursor())
+                diferida.subir.assert_not_called()
+        self.assertEqual(conn.num_consultas, 0)  # Nada dentro de la transacción de la escritura
+        diferida.subir.assert_called_once_with()
+
+    def test_subidas_concurrentes_se_agrupan(self):
+        diferida = VersionDatosDiferida()
+        conexiones = []
+        nueva = lambda: conexiones.append(ConexionFalsa()) or conexiones[-1]
+        with patch('app._nueva_conexion_pool', side_effect=nueva):
+            with diferida._escritura:  # Una subida en curso mientras llegan las demás
+                hilos = [threading.Thread(target=diferida.subir) for _ in range(8)]
+                for hilo in hilos:
+                    hilo.start()
+                while diferida.estadisticas()['pedidas'] < 8:
+                    time.sleep(0.001)
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual(sum(c.num_consultas for c in conexiones), 1)
+        self.assertEqual(diferida.estadisticas(), {'pedidas': 8, 'subidas': 1, 'errores': 0})
+
+
+class DashboardFragmentosTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def setUp(self):
+        fragmentos_dashboard.invalidar()
+        self.version = 1
+
+    def pedir_dashboard(self):
+        base = responder_dashboard(5)
+
+        def responder(sql, params):
+            if 'FROM version_datos' in sql:
+                return [{'version': self.version, 'actualizado_en': None}]
+            return base(sql, params)
+
+        conn = ConexionFalsa(responder)
+        with self.client, patch('app.get_db_connection', return_value=conn):
+            login_user(DummyAdminUser())
+            response = self.client.get('/dashboard')
+            logout_user()
+        self.assertEqual(response.status_code, 200)
+        return response, conn.num_consultas
+
+    def test_fragmentos_se_reutilizan_hasta_que_cambia_la_version(self):
+        primera, consultas_frio = self.pedir_dashboard()
+        segunda, consultas_caliente = self.pedir_dashboard()
+        self.assertLess(consultas_caliente, consultas_frio)
+        self.assertEqual(primera.data, segunda.data)
+
+        self.version = 2  # Una escritura incrementó version_datos
+        _, consultas_nueva_version = self.pedir_dashboard()
+        self.assertEqual(consultas_nueva_version, consultas_frio)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import generar_historial_turnos, now_local, motor_rotacion
+from fake_db import ConexionFalsa
+
+
+def responder_historial(conteos):
+    """conteos: {(id_usuario, semana): total}"""
+    def responder(sql, params):
+        if 'FROM patrones_rotacion' in sql:
+            return [{'cedula': '1070963486', 'horas': ['06:30', '08:30']},
+                    {'cedula': '1067949514', 'horas': ['08:00', '06:30']}]
+        if 'FROM usuarios WHERE cedula' in sql:
+            return [{'id': 1, 'username': 'ana', 'nombre': 'Ana', 'cedula': '1070963486', 'cargo': 'Gestor'},
+                    {'id': 2, 'username': 'luis', 'nombre': 'Luis', 'cedula': '1067949514', 'cargo': 'Gestor'}]
+        if 'GROUP BY ta.id_usuario, semana' in sql:
+            return [{'id_usuario': u, 'semana': s, 'total': t} for (u, s), t in conteos.items()]
+        return []
+    return responder
+
+
+class HistorialTurnosTest(unittest.TestCase):
+    def historial(self, semanas_atras, conteos):
+        hoy = now_local().replace(tzinfo=None)
+        lunes = datetime.datetime.combine((hoy - datetime.timedelta(days=hoy.weekday())).date(), datetime.time())
+        fecha_base = lunes - datetime.timedelta(weeks=semanas_atras)
+        conn = ConexionFalsa(responder_historial(conteos))
+        motor_rotacion.invalidar()
+        with patch('app.get_db_connection', return_value=conn):
+            historial = generar_historial_turnos(fecha_base)
+        return historial, conn.num_consultas
+
+    def test_consultas_constantes_en_el_tiempo(self):
+        historial_corto, consultas_corto = self.historial(1, {})
+        historial_largo, consultas_largo = self.historial(104, {})
+        self.assertEqual(len(historial_corto), 2 * 2)
+        self.assertEqual(len(historial_largo), 105 * 2)
+        self.assertEqual(consultas_corto, consultas_largo)
+        self.assertEqual(consultas_largo, 3)  # Patrones + usuarios + conteo
+
+    def test_estados(self):
+        historial, _ = self.historial(2, {(1, 1): 6, (1, 3): 2})
+        estados = {(h['usuario'], h['semana']): h['estado'] for h in historial}
+        self.assertEqual(estados[('Ana', 1)], 'Completado')
+        self.assertEqual(estados[('Ana', 2)], 'Pendiente')
+        self.assertEqual(estados[('Ana', 3)], 'En Curso')
+        self.assertEqual(estados[('Luis', 3)], 'Pendiente')
+        self.assertEqual(historial[0]['semana'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
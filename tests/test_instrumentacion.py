@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from flask import Response, stream_with_context
+from app import app, RegistroConsultas, registro_consultas, metricas_endpoints, MetricasEndpoints, _huella_sql, CursorInstrumentado
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+
+
+class DummyAdminUser:
+    admin = True
+    id = 1
+    username = "admin"
+    nombre = "Administrador"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "1"
+    def is_admin(self):
+        return True
+
+
+class RegistroConsultasTest(unittest.TestCase):
+    def test_huella_ignora_literales(self):
+        self.assertEqual(_huella_sql(b"SELECT * FROM turnos WHERE id = 17 AND dia = 'monday'"),
+                         _huella_sql("SELECT *  FROM turnos WHERE id = 4 AND dia = 'friday'"))
+
+    def test_lentas_y_n_mas_1(self):
+        registro = RegistroConsultas()
+        for i in range(6):
+            registro.registrar(f"SELECT hora FROM turnos_asignados WHERE id_usuario = {i}", 0.001)
+        registro.registrar("SELECT * FROM usuarios", 0.050)
+        self.assertEqual(registro.consultas, 7)
+        self.assertAlmostEqual(registro.tiempo, 0.056)
+        self.assertEqual(registro.lentas[0], (0.050, 'SELECT * FROM usuarios'))
+        self.assertEqual(len(registro.lentas), 3)
+        self.assertEqual(list(registro.n_mas_1().values()), [6])
+
+    def test_ventana_descarta_muestras_viejas(self):
+        metricas = MetricasEndpoints(ventana=-1)
+        metricas.registrar('GET /dashboard', 0.1, RegistroConsultas())
+        self.assertEqual(metricas.resumen(), [])
+
+
+class ServerTimingTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def test_cabecera_y_ventana(self):
+        with app.test_request_context('/welcome'), patch('app.logger') as log, \
+                patch.dict(app.config, {'PERF_SERVER_TIMING': True}):
+            app.preprocess_request()
+            for i in range(5):
+                registro_consultas().registrar(f"SELECT * FROM registros_asistencia WHERE id = {i}", 0.002)
+            respuesta = app.process_response(Response('ok'))
+
+        cabecera = respuesta.headers['Server-Timing']
+        self.assertIn('db;dur=10.00;desc="5 consultas"', cabecera)
+        self.assertIn('app;dur=', cabecera)
+        self.assertIn('n1;desc="1 repetidas"', cabecera)
+        linea = log.info.call_args[0][0]
+        self.assertTrue(linea.startswith('perf {'))
+        self.assertIn('"consultas": 5', linea)
+
+        fila = next(e for e in metricas_endpoints.resumen(limite=200) if e['endpoint'] == 'GET /welcome')
+        self.assertGreaterEqual(fila['n_mas_1'], 1)
+        self.assertEqual(fila['consultas_max'], 5)
+
+    def test_sin_cabecera_para_anonimos(self):
+        with app.test_request_context('/login'):
+            app.preprocess_request()
+            registro_consultas().registrar("SELECT * FROM usuarios WHERE username = 'x'", 0.002)
+            respuesta = app.process_response(Response('ok'))
+        self.assertNotIn('Server-Timing', respuesta.headers)
+
+    def test_respuesta_en_streaming_se_registra_al_cerrar(self):
+        class CursorConNombre(CursorInstrumentado):
+            """Sin conexión real: solo interesa lo que se anota por cada FETCH."""
+            def __init__(self):
+                pass
+            name = 'exportar_1f2e3d'
+
+        def generar():
+            for _ in range(6):
+                with patch('psycopg2.extras.DictCursor.fetchmany', return_value=[]):
+                    CursorConNombre().fetchmany(500)
+                yield 'fila\n'
+
+        with app.test_request_context('/exportar_datos'), patch('app.logger') as log:
+            app.preprocess_request()
+            respuesta = app.process_response(Response(stream_with_context(generar())))
+            self.assertNotIn('Server-Timing', respuesta.headers)
+            log.info.assert_not_called()
+            respuesta.get_data()
+            respuesta.close()
+
+        linea = log.info.call_args[0][0]
+        self.assertIn('"consultas": 6', linea)
+        self.assertIn('"n_mas_1": []', linea)  # Los FETCH por lotes no son N+1
+        self.assertIn('FETCH FROM exportar', linea)
+
+    def test_admin_perf(self):
+        with self.client, patch('app.get_db_connection', return_value=ConexionFalsa()):
+            login_user(DummyAdminUser())
+            bienvenida = self.client.get('/welcome')
+            response = self.client.get('/admin/perf?formato=json')
+            pagina = self.client.get('/admin/perf')
+            logout_user()
+        self.assertIn('Server-Timing', bienvenida.headers)  # Los administradores sí la reciben
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET /welcome', [e['endpoint'] for e in response.json['endpoints']])
+        self.assertEqual(pagina.status_code, 200)
+        self.assertIn(b'Rendimiento por Endpoint', pagina.data)
+
+if __name__ == '__main__':
+    unittest.main()
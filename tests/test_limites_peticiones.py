@@ -0,0 +1,63 @@
+import unittest
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, AlmacenLimitesPostgres, init_db
+from fake_db import ConexionFalsa
+from test_migraciones_indices import conexion_real
+
+
+class AlmacenLimitesPostgresTest(unittest.TestCase):
+    def test_incremento_atomico_en_una_sentencia(self):
+        conn = ConexionFalsa(lambda sql, params: [{'contador': 3}] if 'RETURNING contador' in sql else [])
+        almacen = AlmacenLimitesPostgres()
+        with patch('app._nueva_conexion_pool', return_value=conn):
+            self.assertEqual(almacen.incr('LIMITER/127.0.0.1/login', 60), 3)
+            self.assertEqual(almacen.incr('LIMITER/127.0.0.1/login', 60), 3)
+        sentencias = [sql for sql, _ in conn.sentencias]
+        self.assertIn('ON CONFLICT (clave) DO UPDATE', sentencias[0])
+        # La purga de vencidos corre una vez por intervalo, no en cada incremento
+        self.assertEqual(sum('DELETE FROM limites_peticiones' in sql for sql in sentencias), 1)
+        self.assertEqual(len(sentencias), 3)
+
+    def test_clave_inexistente(self):
+        almacen = AlmacenLimitesPostgres()
+        with patch('app._nueva_conexion_pool', return_value=ConexionFalsa()):
+            self.assertEqual(almacen.get('LIMITER/x'), 0)
+
+
+class AlmacenLimitesConcurrenciaTest(unittest.TestCase):
+    """Con PostgreSQL real: incrementos concurrentes desde varios hilos no se pierden."""
+
+    @classmethod
+    def setUpClass(cls):
+        conn = conexion_real()
+        if conn is None:
+            raise unittest.SkipTest("PostgreSQL no disponible")
+        conn.close()
+        with app.app_context():
+            init_db()
+
+    def test_incrementos_concurrentes(self):
+        almacen = AlmacenLimitesPostgres()
+        almacen.clear('prueba/concurrencia')
+
+        def golpear():
+            for _ in range(25):
+                almacen.incr('prueba/concurrencia', 60)
+
+        hilos = [threading.Thread(target=golpear) for _ in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.assertEqual(almacen.get('prueba/concurrencia'), 200)
+        almacen.clear('prueba/concurrencia')
+
+if __name__ == '__main__':
+    unittest.main()
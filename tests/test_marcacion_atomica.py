@@ -0,0 +1,188 @@
+import unittest
+import sys
+import os
+import datetime
+import threading
+from decimal import Decimal
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import psycopg2.extras
+from app import app, init_db, marcar_registro, calcular_horas, TZ, _parametros_conexion
+from flask import session
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+from test_migraciones_indices import conexion_real
+
+
+class DummyUser:
+    admin = False
+    id = 7
+    username = "natalia"
+    nombre = "Natalia"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "7"
+    def is_admin(self):
+        return False
+
+
+def responder_marcacion(fila):
+    def responder(sql, params):
+        if 'RETURNING inicio, salida' in sql:
+            return [fila] if fila else []
+        return []
+    return responder
+
+
+class MarcacionTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def marcar(self, url, fila):
+        conn = ConexionFalsa(responder_marcacion(fila))
+        with self.client, patch('app.get_db_connection', return_value=conn), patch('app.version_datos_diferida'):
+            login_user(DummyUser())
+            response = self.client.post(url, data={'client_timestamp': '2025-11-03T22:00:00Z'})
+            flashes = session.get('_flashes', [])
+            logout_user()
+        return response, conn, flashes
+
+    def test_entrada_en_una_sentencia(self):
+        fila = {'inicio': datetime.datetime(2025, 11, 3, 17, 0), 'salida': None, 'horas_trabajadas': Decimal('0'), 'horas_extras': Decimal('0')}
+        response, conn, flashes = self.marcar('/marcar_asistencia', fila)
+        self.assertEqual(response.status_code, 302)
+        marcacion = conn.sentencias[0]
+        self.assertIn('ON CONFLICT (id_usuario, fecha) DO UPDATE', marcacion[0])
+        self.assertFalse(any('FROM registros_asistencia' in sql and sql.lstrip().startswith('SELECT')
+                             for sql, _ in conn.sentencias))
+        # Marcación + resumen (candado, upsert, borrado); la versión se sube después del commit
+        self.assertEqual(conn.num_consultas, 4)
+        self.assertEqual(flashes, [('message', '✅ Hora de inicio registrada')])
+
+    def test_salida_devuelve_horas_de_la_fila(self):
+        fila = {'inicio': datetime.datetime(2025, 11, 3, 7, 0), 'salida': datetime.datetime(2025, 11, 3, 17, 0),
+                'horas_trabajadas': Decimal('8.00'), 'horas_extras': Decimal('1.00')}
+        _, conn, flashes = self.marcar('/marcar_salida', fila)
+        self.assertTrue(conn.sentencias[0][0].lstrip().startswith('UPDATE registros_asistencia'))
+        self.assertEqual(flashes, [('message', 'Salida registrada. Horas trabajadas: 8.0h, Extras: 1.0h')])
+
+    def test_alternar_completa_fila_sin_inicio(self):
+        # Fila creada por el admin sin inicio: el upsert solo la toca si su WHERE la admite
+        def responder(sql, params):
+            if 'RETURNING inicio, salida' in sql and 'OR registros_asistencia.inicio IS NULL' in sql:
+                return [{'inicio': params['ahora'], 'salida': None, 'horas_trabajadas': None, 'horas_extras': None}]
+            return []
+
+        conn = ConexionFalsa(responder)
+        with self.client, patch('app.get_db_connection', return_value=conn), patch('app.version_datos_diferida'):
+            login_user(DummyUser())
+            self.client.post('/marcar_asistencia', data={'client_timestamp': '2025-11-03T12:00:00Z'})
+            flashes = session.get('_flashes', [])
+            logout_user()
+        self.assertIn('WHEN registros_asistencia.inicio IS NULL THEN EXCLUDED.inicio', conn.sentencias[0][0])
+        self.assertEqual(flashes, [('message', '✅ Hora de inicio registrada')])
+
+    def test_entrada_repetida_no_toca_el_resumen(self):
+        _, conn, flashes = self.marcar('/marcar_inicio', None)
+        self.assertEqual(conn.num_consultas, 1)
+        self.assertEqual(flashes, [('error', 'Ya registraste tu inicio hoy')])
+
+
+class MarcacionConcurrenteTest(unittest.TestCase):
+    """Con PostgreSQL real: cientos de clics simultáneos producen una sola entrada y una sola salida."""
+
+    HILOS = 20
+    CLICS_POR_HILO = 15
+
+    @classmethod
+    def setUpClass(cls):
+        conn = conexion_real()
+        if conn is None:
+            raise unittest.SkipTest("PostgreSQL no disponible")
+        with app.app_context():
+            init_db()
+        cursor = conn.cursor()
+        cursor.execute("""INSERT INTO usuarios (username, contrasena, admin, nombre, cedula, cargo, correo, telefono)
+                          VALUES ('prueba_marcacion', 'x', FALSE, 'Prueba', '0', 'Gestor', 'p@empresa.com', '')
+                          ON CONFLICT (username) DO UPDATE SET nombre = EXCLUDED.nombre RETURNING id""")
+        cls.usuario_id = cursor.fetchone()[0]
+        conn.commit()
+        cls.conn = conn
+
+    @classmethod
+    def tearDownClass(cls):
+        cursor = cls.conn.cursor()
+        cursor.execute("DELETE FROM resumen_asistencia WHERE id_usuario = %s", (cls.usuario_id,))
+        cursor.execute("DELETE FROM registros_asistencia WHERE id_usuario = %s", (cls.usuario_id,))
+        cursor.execute("DELETE FROM usuarios WHERE id = %s", (cls.usuario_id,))
+        cls.conn.commit()
+        cls.conn.close()
+
+    def setUp(self):
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM registros_asistencia WHERE id_usuario = %s", (self.usuario_id,))
+        self.conn.commit()
+
+    def disparar(self, accion, fecha, inicio):
+        eventos = []
+        candado = threading.Lock()
+        barrera = threading.Barrier(self.HILOS)
+
+        def trabajador(n):
+            args, kwargs = _parametros_conexion()
+            conn = psycopg2.connect(*args, **kwargs)
+            try:
+                barrera.wait()
+                for i in range(self.CLICS_POR_HILO):
+                    ahora = inicio + datetime.timedelta(hours=(n * self.CLICS_POR_HILO + i) / 30)
+                    with conn.cursor() as cursor:
+                        resultado = marcar_registro(cursor, self.usuario_id, fecha, ahora, accion)
+                    conn.commit()
+                    if resultado:
+                        with candado:
+                            eventos.append(resultado['evento'])
+            finally:
+                conn.close()
+
+        hilos = [threading.Thread(target=trabajador, args=(n,)) for n in range(self.HILOS)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        return eventos
+
+    def test_entradas_simultaneas(self):
+        fecha = datetime.date(2025, 11, 3)
+        eventos = self.disparar('inicio', fecha, datetime.datetime(2025, 11, 3, 6, 30, tzinfo=TZ))
+        self.assertEqual(eventos, ['inicio'])
+
+    def test_alternar_simultaneo_cierra_una_sola_jornada(self):
+        fecha = datetime.date(2025, 11, 4)
+        eventos = self.disparar('alternar', fecha, datetime.datetime(2025, 11, 4, 6, 30, tzinfo=TZ))
+        self.assertEqual(sorted(eventos), ['inicio', 'salida'])
+
+        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute("SELECT inicio, salida, horas_trabajadas, horas_extras FROM registros_asistencia WHERE id_usuario = %s AND fecha = %s",
+                       (self.usuario_id, fecha))
+        filas = cursor.fetchall()
+        self.assertEqual(len(filas), 1)
+        ordinarias, extras = calcular_horas(filas[0]['inicio'], filas[0]['salida'])
+        self.assertAlmostEqual(float(filas[0]['horas_trabajadas']), ordinarias, places=2)
+        self.assertAlmostEqual(float(filas[0]['horas_extras']), extras, places=2)
+        cursor.execute("SELECT registros FROM resumen_asistencia WHERE periodo = 'dia' AND inicio = %s AND id_usuario = %s",
+                       (fecha, self.usuario_id))
+        self.assertEqual(cursor.fetchone()['registros'], 1)
+        self.conn.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, emitir_token_api, registrar_marcaciones_lote, now_local, User
+from fake_db import ConexionFalsa
+
+
+def usuario(admin=True, username='kiosco'):
+    return User(id=1, username=username, admin=admin, nombre='Kiosco', cedula='0', cargo='Kiosco',
+                correo='k@empresa.com', telefono='', bloqueado=False, fecha_creacion=None)
+
+
+def marca(horas_atras=None, hora_de_ayer=None):
+    """client_timestamp en UTC: `horas_atras` horas antes de ahora, o ayer a la `hora_de_ayer` local."""
+    if hora_de_ayer is not None:
+        ayer = now_local() - datetime.timedelta(days=1)
+        instante = ayer.replace(hour=hora_de_ayer, minute=0, second=0, microsecond=0)
+    else:
+        instante = now_local() - datetime.timedelta(hours=horas_atras)
+    return instante.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z'), instante
+
+
+def responder_lote(ya_procesadas=(), filas_registros=()):
+    def responder(sql, params):
+        if 'FROM usuarios WHERE username = ANY' in sql:
+            return [{'id': 7, 'username': 'natalia'}, {'id': 8, 'username': 'pedro'}]
+        if 'INSERT INTO marcaciones_lote' in sql:
+            return [{'clave': c} for c in ('k1', 'k2', 'k3', 'k4') if c in sql and c not in ya_procesadas]
+        if 'INSERT INTO registros_asistencia' in sql:
+            return list(filas_registros)
+        return []
+    return responder
+
+
+class MarcacionesLoteTest(unittest.TestCase):
+    def test_resultados_por_item_y_sentencias_fijas(self):
+        entrada, t_entrada = marca(hora_de_ayer=6)
+        salida, t_salida = marca(hora_de_ayer=15)
+        intermedia, _ = marca(hora_de_ayer=10)
+        fecha = t_entrada.date()
+        fila = {'id_usuario': 7, 'fecha': fecha, 'inicio': t_entrada, 'salida': t_salida}
+        items = [
+            {'clave': 'k1', 'usuario': 'natalia', 'client_timestamp': entrada},
+            {'clave': 'k2', 'usuario': 'natalia', 'client_timestamp': salida},
+            {'clave': 'k3', 'usuario': 'natalia', 'client_timestamp': intermedia},
+            {'clave': 'k4', 'usuario': 'pedro', 'client_timestamp': entrada},
+            {'clave': 'k1', 'usuario': 'natalia', 'client_timestamp': entrada},
+            {'clave': 'k5', 'usuario': 'fantasma', 'client_timestamp': entrada},
+            {'clave': 'k6', 'usuario': 'natalia', 'client_timestamp': '2025-11-03T08:00:00'},
+        ]
+        conn = ConexionFalsa(responder_lote(ya_procesadas={'k4'}, filas_registros=[fila]))
+        with patch('app.get_db_connection', return_value=conn):
+            resultados = registrar_marcaciones_lote(conn.cursor(), items, usuario())
+
+        self.assertEqual([r['estado'] for r in resultados],
+                         ['registrada', 'registrada', 'registrada', 'duplicada', 'duplicada', 'invalida', 'invalida'])
+        self.assertEqual([r['evento'] for r in resultados[:3]], ['inicio', 'salida', 'intermedia'])
+        self.assertEqual(resultados[6]['error'], 'client_timestamp sin zona horaria')
+        # Usuarios, claves de idempotencia, upsert y resumen (4): una transacción, sin importar el tamaño
+        self.assertEqual(conn.num_consultas, 7)
+        upsert = next(sql for sql, _ in conn.sentencias if 'INSERT INTO registros_asistencia' in sql)
+        self.assertIn('ON CONFLICT (id_usuario, fecha) DO UPDATE', upsert)
+
+    def test_validacion_de_horas(self):
+        futuro, _ = marca(-2)
+        viejo, _ = marca(24 * 30)
+        items = [{'clave': 'a', 'usuario': 'natalia', 'client_timestamp': futuro},
+                 {'clave': 'b', 'usuario': 'natalia', 'client_timestamp': viejo},
+                 {'clave': 'c', 'usuario': 'natalia', 'client_timestamp': 'ayer'}]
+        conn = ConexionFalsa(responder_lote())
+        resultados = registrar_marcaciones_lote(conn.cursor(), items, usuario())
+        self.assertEqual([r['error'] for r in resultados],
+                         ['client_timestamp en el futuro', 'client_timestamp con más de 7 días', 'client_timestamp inválido'])
+        self.assertEqual(conn.num_consultas, 0)
+
+    def test_empleado_solo_envia_sus_marcaciones(self):
+        ts, _ = marca(1)
+        conn = ConexionFalsa(responder_lote())
+        resultados = registrar_marcaciones_lote(conn.cursor(), [{'clave': 'k1', 'usuario': 'pedro', 'client_timestamp': ts}],
+                                                usuario(admin=False, username='natalia'))
+        self.assertEqual(resultados[0]['error'], 'Usuario no autorizado')
+
+    def test_endpoint(self):
+        app.config['TESTING'] = True
+        client = app.test_client()
+        ts, _ = marca(1)
+        conn = ConexionFalsa(responder_lote())
+        with patch('app.get_db_connection', return_value=conn), patch('app.load_user', return_value=usuario()), \
+                patch('app.version_datos_diferida') as diferida:
+            response = client.post('/api/marcaciones/lote', headers={'Authorization': f'Bearer {emitir_token_api(1)}'},
+                                   json={'marcaciones': [{'clave': 'k1', 'usuario': 'natalia', 'client_timestamp': ts}]})
+            vacio = client.post('/api/marcaciones/lote', headers={'Authorization': f'Bearer {emitir_token_api(1)}'}, json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['registradas'], 1)
+        self.assertEqual(vacio.status_code, 400)
+        diferida.subir.assert_called_once_with()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import psycopg2, psycopg2.extras
+from app import app, aplicar_migraciones, init_db, rango_mes, MIGRACIONES, _parametros_conexion
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+from test_dashboard_consultas import responder_dashboard
+from test_ver_turnos_asignados import responder_turnos
+
+
+def conexion_real():
+    """Conexión directa a PostgreSQL, o None si no hay servidor disponible."""
+    args, kwargs = _parametros_conexion()
+    try:
+        return psycopg2.connect(*args, connect_timeout=2, **kwargs)
+    except psycopg2.OperationalError:
+        return None
+
+
+class MigracionesTest(unittest.TestCase):
+    def test_aplica_solo_las_pendientes(self):
+        ya_aplicadas = {1}
+
+        def responder(sql, params):
+            if 'FROM schema_migraciones WHERE version' in sql and params[0] in ya_aplicadas:
+                return [{'?column?': 1}]
+            return []
+
+        conn = ConexionFalsa(responder)
+        with patch('app.get_db_connection', return_value=conn):
+            aplicadas = aplicar_migraciones()
+
+        self.assertEqual(aplicadas, [v for v, _, _ in MIGRACIONES if v not in ya_aplicadas])
+        registradas = [p[0] for sql, p in conn.sentencias if sql.startswith('INSERT INTO schema_migraciones')]
+        self.assertEqual(registradas, aplicadas)
+
+    def test_versiones_unicas_y_ordenadas(self):
+        versiones = [v for v, _, _ in MIGRACIONES]
+        self.assertEqual(versiones, sorted(set(versiones)))
+
+    def test_rango_mes(self):
+        self.assertEqual(rango_mes(2024, 2), (datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)))
+        self.assertEqual(rango_mes(2025, 12), (datetime.date(2025, 12, 1), datetime.date(2025, 12, 31)))
+
+
+class DummyAdminUser:
+    admin = True
+    id = 1
+    username = "admin"
+    nombre = "Administrador"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "1"
+    def is_admin(self):
+        return True
+
+
+class ConexionSinCerrar:
+    """La conexión de pruebas vista como la de una petición: close() no la cierra."""
+    def __init__(self, conn):
+        self._conn = conn
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+    def close(self):
+        pass
+
+
+TABLAS_CALIENTES = ('turnos_asignados', 'registros_asistencia', 'resumen_asistencia')
+
+
+class IndicesExplainTest(TestCase):
+    """
+    EXPLAIN de las consultas que la app ejecuta de verdad en el dashboard de admin,
+    admin_gestion_tiempos y la paginación de ver_turnos_asignados: se capturan con
+    ConexionFalsa al pedir cada página y se planifican en una base de pruebas aparte.
+    Si un cambio en app.py deja un filtro sin índice, el plan muestra un Seq Scan.
+    Solo corre con TEST_DATABASE_URL (crea tablas: nunca usar la base de la app).
+    """
+
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    @classmethod
+    def setUpClass(cls):
+        url = os.environ.get('TEST_DATABASE_URL')
+        if not url:
+            raise unittest.SkipTest("TEST_DATABASE_URL no configurada")
+        try:
+            cls.conn = psycopg2.connect(url, connect_timeout=2, cursor_factory=psycopg2.extras.DictCursor)
+        except psycopg2.OperationalError:
+            raise unittest.SkipTest("Base de pruebas no disponible")
+        with app.app_context(), patch('app.get_db_connection', return_value=ConexionSinCerrar(cls.conn)):
+            init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+
+    def sentencias(self, url, responder=None):
+        conn = ConexionFalsa(responder)
+        with self.client, patch('app.get_db_connection', return_value=conn):
+            login_user(DummyAdminUser())
+            response = self.client.get(url)
+            logout_user()
+        self.assertEqual(response.status_code, 200)
+        return [(sql, params) for sql, params in conn.sentencias
+                if isinstance(sql, str) and any(t in sql for t in TABLAS_CALIENTES)]
+
+    def plan(self, sql, params):
+        cursor = self.conn.cursor()
+        # Con tablas casi vacías el planificador prefiere seq scan; se desactiva para ver si el índice es utilizable
+        cursor.execute("SET enable_seqscan = off")
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.conn.rollback()
+        cursor.close()
+        return plan
+
+    def assertSinSeqScan(self, sentencias):
+        self.assertTrue(sentencias)
+        for sql, params in sentencias:
+            plan = self.plan(sql, params)
+            for tabla in TABLAS_CALIENTES:
+                self.assertNotIn(f'Seq Scan on {tabla}', plan, f"{' '.join(sql.split())[:200]}\n{plan}")
+
+    def test_dashboard_admin(self):
+        self.assertSinSeqScan(self.sentencias('/dashboard', responder_dashboard(3)))
+
+    def test_admin_gestion_tiempos(self):
+        sentencias = self.sentencias('/admin/gestion_tiempos?mes=11&ano=2025')
+        self.assertSinSeqScan(sentencias)
+        registros = next(s for s in sentencias if s[0].lstrip().startswith('SELECT id, id_usuario, fecha'))
+        self.assertIn('idx_registros_asistencia_fecha', self.plan(*registros))
+
+    def test_ver_turnos_asignados_keyset(self):
+        sentencias = self.sentencias('/ver_turnos_asignados?despues_fecha=2025-11-03&despues_usuario=user0'
+                                     '&despues_hora=08:00&despues_id=1', responder_turnos(5))
+        self.assertSinSeqScan(sentencias)
+        self.assertIn('idx_turnos_asignados_fecha', self.plan(*sentencias[0]))
+
+    def test_predicado_no_sargable_se_detecta(self):
+        plan = self.plan("SELECT * FROM turnos_asignados WHERE TO_CHAR(fecha_asignacion, 'YYYY-MM') = %s", ('2025-11',))
+        self.assertIn('Seq Scan on turnos_asignados', plan)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import app as modulo_app
+from app import app, MotorCostos, _generar_csv_registros
+from fake_db import ConexionFalsa
+
+
+class MotorCostosTest(unittest.TestCase):
+    fechas = [datetime.date(2025, 11, 14), datetime.date(2025, 11, 15), datetime.date(2025, 11, 16),
+              datetime.date(2026, 1, 2)]
+    horas = [8, 8, 8, None]
+    extras = [1, 2, 1.5, 0]
+
+    def test_recargos_por_dia(self):
+        motor = MotorCostos()
+        valor = 1384308 / 240
+        costos = motor.costos(self.fechas[:3], self.horas[:3], self.extras[:3])
+        self.assertAlmostEqual(float(costos['ordinarias'][0]), 8 * valor)
+        self.assertAlmostEqual(float(costos['extras'][0]), 1 * valor * 1.25)   # Viernes
+        self.assertAlmostEqual(float(costos['extras'][1]), 2 * valor * 1.75)   # Sábado
+        self.assertAlmostEqual(float(costos['extras'][2]), 1.5 * valor * 2.0)  # Domingo
+        self.assertAlmostEqual(float(costos['total'][1]), 8 * valor + 2 * valor * 1.75)
+
+    def test_tarifas_por_ano(self):
+        motor = MotorCostos({'2025': {'salario_minimo': 1384308}, '2026': {'salario_minimo': 1500000}})
+        self.assertEqual(motor.valor_hora(2024), 1384308 / 240)  # Antes de la primera: usa la primera
+        self.assertEqual(motor.valor_hora(2027), 1500000 / 240)  # Sin tarifa: usa la anterior
+        costos = motor.costos([datetime.date(2026, 1, 5)], [8], [0])
+        self.assertAlmostEqual(float(costos['ordinarias'][0]), 8 * 1500000 / 240)
+
+    def test_numpy_y_python_coinciden(self):
+        if modulo_app.np is None:
+            self.skipTest("NumPy no instalado")
+        motor = MotorCostos({'2026': {'salario_minimo': 1500000}})
+        con_numpy = motor.costos(self.fechas, self.horas, self.extras)
+        with patch('app.np', None):
+            sin_numpy = motor.costos(self.fechas, self.horas, self.extras)
+        for clave in ('ordinarias', 'extras', 'total'):
+            for a, b in zip(con_numpy[clave], sin_numpy[clave]):
+                self.assertAlmostEqual(float(a), b)
+
+    def test_sql_recargo(self):
+        sql = MotorCostos().sql_recargo('ra.fecha')
+        self.assertEqual(sql, "CASE EXTRACT(ISODOW FROM ra.fecha) WHEN 6 THEN 1.75 WHEN 7 THEN 2.0 ELSE 1.25 END")
+
+    def test_exportacion_sin_numpy_coincide_con_el_motor(self):
+        filas = [{'username': 'natalia', 'nombre': 'Natalia', 'cedula': '1', 'cargo': 'Gestor', 'correo': 'n@empresa.com',
+                  'fecha': f, 'inicio': None, 'salida': None, 'horas_trabajadas': h or 0, 'horas_extras': e}
+                 for f, h, e in zip(self.fechas, self.horas, self.extras)]
+        motor = MotorCostos({'2026': {'salario_minimo': 1500000}})
+        conn = ConexionFalsa(lambda sql, params: filas if 'FROM usuarios u' in sql else [])
+        with app.app_context(), patch('app.get_db_connection', return_value=conn), \
+                patch('app.motor_costos', motor), patch('app.np', None):
+            csv = ''.join(_generar_csv_registros(incluir_costos=True, tamano_lote=3))
+        with patch('app.np', None):
+            esperado = motor.costos(self.fechas, self.horas, self.extras)
+        lineas = csv.strip().splitlines()[1:]
+        self.assertEqual(len(lineas), 4)
+        for i, linea in enumerate(lineas):
+            self.assertEqual([float(c) for c in linea.split(',')[-3:]],
+                             [round(esperado[clave][i], 2) for clave in ('ordinarias', 'extras', 'total')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import MotorRotacion, catalogo_turnos, DIAS_SEMANA
+from fake_db import ConexionFalsa
+
+HORAS = ['06:30', '08:00', '08:30', '09:00']
+
+
+def responder_rotacion(sql, params):
+    if 'FROM patrones_rotacion' in sql:
+        return [{'cedula': '1070963486', 'horas': ['06:30', '08:30']},
+                {'cedula': '1068416077', 'horas': ['09:00', '08:00', '06:30']}]
+    if 'MAX(id)' in sql:
+        return [{'total': 28, 'max_id': 28}]
+    if 'FROM turnos_disponibles' in sql:
+        return [{'id': i * 4 + j + 1, 'dia_semana': dia, 'hora': hora}
+                for i, dia in enumerate(DIAS_SEMANA) for j, hora in enumerate(HORAS)]
+    return []
+
+
+class MotorRotacionTest(unittest.TestCase):
+    def setUp(self):
+        self.motor = MotorRotacion(fecha_base=datetime.date(2025, 11, 3))
+        self.conn = ConexionFalsa(responder_rotacion)
+        catalogo_turnos.invalidar()
+
+    def test_hora_por_semana(self):
+        with patch('app.get_db_connection', return_value=self.conn):
+            self.assertEqual(self.motor.hora_turno('1070963486', datetime.date(2025, 11, 3)), '06:30')
+            self.assertEqual(self.motor.hora_turno('1070963486', datetime.date(2025, 11, 9)), '06:30')
+            self.assertEqual(self.motor.hora_turno('1070963486', datetime.date(2025, 11, 10)), '08:30')
+            self.assertEqual(self.motor.hora_turno('1068416077', datetime.date(2025, 11, 17)), '06:30')
+            self.assertEqual(self.motor.hora_turno('1068416077', datetime.date(2026, 11, 2)), '08:00')  # Semana 53
+            self.assertIsNone(self.motor.hora_turno('999', datetime.date(2025, 11, 3)))
+        self.assertEqual(self.conn.num_consultas, 1)  # Los patrones se cargan una vez
+
+    def test_generar_mes_en_un_insert(self):
+        empleados = [(1, '1070963486'), (2, '1068416077'), (3, 'sin_patron')]
+        with patch('app.get_db_connection', return_value=self.conn):
+            cursor = self.conn.cursor()
+            filas = self.motor.filas_periodo(empleados, datetime.date(2025, 12, 1), datetime.date(2025, 12, 31))
+            self.motor.generar(cursor, empleados, datetime.date(2025, 12, 1), datetime.date(2025, 12, 31))
+
+        self.assertEqual(len(filas), 2 * 31)
+        self.assertEqual(filas[0], (1, 1, datetime.date(2025, 12, 1)))  # Semana 5 -> 06:30 el lunes
+        self.assertEqual(filas[7], (1, 3, datetime.date(2025, 12, 8)))  # Semana 6 -> 08:30
+        inserts = [sql for sql, _ in self.conn.sentencias if sql.lstrip().startswith('INSERT INTO turnos_asignados')]
+        self.assertEqual(len(inserts), 1)
+
+if __name__ == '__main__':
+    unittest.main()
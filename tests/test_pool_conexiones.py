@@ -0,0 +1,79 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import psycopg2
+import psycopg2.extensions
+from app import PoolConexiones
+
+
+class ConexionPg:
+    """Lo mínimo de una conexión psycopg2 que usa PoolConexiones; `caida` simula un reinicio de la base."""
+    status = psycopg2.extensions.STATUS_READY
+
+    class info:
+        transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def __init__(self):
+        self.closed = 0
+        self.caida = False
+
+    def cursor(self):
+        conexion = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, sql):
+                if conexion.caida:
+                    raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        return Cursor()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class PoolConexionesTest(unittest.TestCase):
+    def setUp(self):
+        self.abiertas = []
+        nueva = lambda *args, **kwargs: self.abiertas.append(ConexionPg()) or self.abiertas[-1]
+        parche = patch('psycopg2.connect', side_effect=nueva)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_conserva_las_libres_hasta_maxconn(self):
+        pool = PoolConexiones(1, 4)
+        conexiones = [pool.obtener() for _ in range(3)]
+        for conn in conexiones:
+            pool.devolver(conn)
+        self.assertFalse(any(c.closed for c in self.abiertas))
+        otra_vez = [pool.obtener() for _ in range(3)]
+        self.assertEqual(len(self.abiertas), 3)  # Sin reconectar
+        self.assertEqual({id(c) for c in otra_vez}, {id(c) for c in conexiones})
+
+    def test_tras_un_reinicio_descarta_todas_las_caidas(self):
+        pool = PoolConexiones(1, 4, chequeo_tras=0)
+        conexiones = [pool.obtener() for _ in range(3)]
+        for conn in conexiones:
+            pool.devolver(conn)
+            conn.caida = True
+
+        conn = pool.obtener()
+        self.assertNotIn(conn, conexiones)
+        self.assertFalse(conn.closed)
+        self.assertTrue(all(c.closed for c in conexiones))
+        self.assertEqual(pool.estadisticas()['fallos_salud'], 3)
+        self.assertEqual(pool._ultimo_uso, {})  # Sin entradas de conexiones cerradas
+
+if __name__ == '__main__':
+    unittest.main()
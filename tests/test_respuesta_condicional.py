@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app, fragmentos_dashboard
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+from test_dashboard_consultas import responder_dashboard
+
+
+class DummyAdminUser:
+    admin = True
+    id = 1
+    username = "admin"
+    nombre = "Administrador"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "1"
+    def is_admin(self):
+        return True
+
+
+class RespuestaCondicionalTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def setUp(self):
+        fragmentos_dashboard.invalidar()
+        self.version = 1
+        self.actualizado_en = datetime.datetime(2025, 11, 5, 14, 0, tzinfo=datetime.timezone.utc)
+
+    def pedir(self, headers=None, flash_pendiente=False, sesion_nueva=False):
+        base = responder_dashboard(5)
+
+        def responder(sql, params):
+            if 'FROM version_datos' in sql:
+                return [{'version': self.version, 'actualizado_en': self.actualizado_en}]
+            return base(sql, params)
+
+        conn = ConexionFalsa(responder)
+        with self.client, patch('app.get_db_connection', return_value=conn):
+            login_user(DummyAdminUser())
+            if flash_pendiente:
+                with self.client.session_transaction() as sess:
+                    sess['_flashes'] = [('message', 'Hora de inicio registrada')]
+            if sesion_nueva:  # logout + login: session.clear() descarta el token CSRF
+                with self.client.session_transaction() as sess:
+                    sess.pop('csrf_token', None)
+            response = self.client.get('/dashboard', headers=headers or {})
+            logout_user()
+        return response, conn.num_consultas
+
+    def test_sin_cambios_responde_304_sin_ejecutar_la_vista(self):
+        primera, _ = self.pedir()
+        self.assertEqual(primera.status_code, 200)
+        etag = primera.headers['ETag']
+        self.assertIsNotNone(primera.headers.get('Last-Modified'))
+
+        segunda, consultas = self.pedir({'If-None-Match': etag})
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(consultas, 1)  # Solo el sello de datos
+        self.assertEqual(segunda.headers['ETag'], etag)
+
+    def test_escritura_cambia_el_etag(self):
+        primera, _ = self.pedir()
+        self.version = 2
+        segunda, _ = self.pedir({'If-None-Match': primera.headers['ETag']})
+        self.assertEqual(segunda.status_code, 200)
+        self.assertNotEqual(segunda.headers['ETag'], primera.headers['ETag'])
+
+    def test_if_modified_since(self):
+        primera, _ = self.pedir()
+        segunda, _ = self.pedir({'If-Modified-Since': primera.headers['Last-Modified']})
+        self.assertEqual(segunda.status_code, 304)
+
+    def test_mensajes_flash_pendientes_siempre_renderizan(self):
+        primera, _ = self.pedir()
+        segunda, _ = self.pedir({'If-None-Match': primera.headers['ETag']}, flash_pendiente=True)
+        self.assertEqual(segunda.status_code, 200)
+
+    def test_sesion_nueva_cambia_el_etag(self):
+        primera, _ = self.pedir()
+        segunda, _ = self.pedir({'If-None-Match': primera.headers['ETag']}, sesion_nueva=True)
+        self.assertEqual(segunda.status_code, 200)
+        self.assertNotEqual(segunda.headers['ETag'], primera.headers['ETag'])
+
+if __name__ == '__main__':
+    unittest.main()
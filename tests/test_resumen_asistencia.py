@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import actualizar_resumen_asistencia, reconstruir_resumen_asistencia, rango_periodo, totales_historicos_usuario, MotorCostos
+from fake_db import ConexionFalsa
+
+
+class ResumenAsistenciaTest(unittest.TestCase):
+    def test_rango_periodo(self):
+        fecha = datetime.date(2025, 12, 31)  # Miércoles
+        self.assertEqual(rango_periodo('dia', fecha), (fecha, fecha))
+        self.assertEqual(rango_periodo('semana', fecha), (datetime.date(2025, 12, 29), datetime.date(2026, 1, 4)))
+        self.assertEqual(rango_periodo('mes', fecha), (datetime.date(2025, 12, 1), fecha))
+        self.assertEqual(rango_periodo('ano', fecha), (datetime.date(2025, 1, 1), fecha))
+
+    def test_actualizacion_incremental_con_upsert(self):
+        conn = ConexionFalsa()
+        cursor = conn.cursor()
+        # Dos días de la misma semana y mes: 2 filas 'dia' + 1 'semana' + 1 'mes' + 1 'ano'
+        actualizar_resumen_asistencia(cursor, [(7, '2025-11-12'), (7, datetime.date(2025, 11, 13))])
+        self.assertEqual(conn.num_consultas, 4)
+        (candado, params_candado), (upsert, _), (borrado, _), (version, _) = conn.sentencias
+        self.assertIn('pg_advisory_xact_lock', candado)
+        self.assertEqual(params_candado[1], [7])
+        self.assertIn('ON CONFLICT (periodo, inicio, id_usuario) DO UPDATE', upsert)
+        self.assertEqual(upsert.count("'dia'"), 2)
+        self.assertEqual(upsert.count("'semana'"), 1)
+        self.assertEqual(upsert.count("'mes'"), 1)
+        self.assertEqual(upsert.count("'ano'"), 1)
+        self.assertIn("('semana', datetime.date(2025, 11, 10)::date, datetime.date(2025, 11, 16)::date, 7::int)", upsert)
+        # Solo se borran los periodos que se quedaron sin registros
+        self.assertIn('DELETE FROM resumen_asistencia', borrado)
+        self.assertIn('NOT EXISTS', borrado)
+        self.assertIn('UPDATE version_datos', version)  # Fuera de una petición va en la misma transacción
+
+    def test_sin_cambios_no_consulta(self):
+        conn = ConexionFalsa()
+        actualizar_resumen_asistencia(conn.cursor(), [])
+        self.assertEqual(conn.num_consultas, 0)
+
+    def test_reconstruccion_por_rango(self):
+        conn = ConexionFalsa()
+        reconstruir_resumen_asistencia(conn.cursor(), datetime.date(2025, 11, 5), datetime.date(2025, 11, 20))
+        self.assertEqual(conn.num_consultas, 8)  # DELETE + INSERT por periodo
+        _, params_mes = conn.sentencias[5]
+        self.assertEqual(params_mes, ['mes', 'month', datetime.date(2025, 11, 1), datetime.date(2025, 11, 30)])
+
+    def test_totales_historicos_valoran_cada_ano(self):
+        def responder(sql, params):
+            if "periodo = 'ano'" in sql:
+                return [{'inicio': datetime.date(2024, 1, 1), 'registros': 200, 'extras_ponderadas': 10},
+                        {'inicio': datetime.date(2025, 1, 1), 'registros': 150, 'extras_ponderadas': 20}]
+            return []
+        conn = ConexionFalsa(responder)
+        with patch('app.motor_costos', MotorCostos({2024: {'salario_minimo': 2400}, 2025: {'salario_minimo': 4800}})):
+            registros, costo = totales_historicos_usuario(conn.cursor(), 7)
+        self.assertEqual(registros, 350)
+        self.assertAlmostEqual(costo, 10 * 10 + 20 * 20)
+        self.assertEqual(conn.num_consultas, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import json
+import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app import app
+from flask_testing import TestCase
+from flask_login import login_user, logout_user
+from fake_db import ConexionFalsa
+
+
+class DummyUser:
+    def __init__(self, admin):
+        self.admin = admin
+    id = 7
+    username = "natalia"
+    nombre = "Natalia"
+    def is_active(self):
+        return True
+    def is_authenticated(self):
+        return True
+    def get_id(self):
+        return "7"
+    def is_admin(self):
+        return self.admin
+
+
+def responder_turnos(num_filas, filas=None):
+    """
+    Turnos consecutivos desde el lunes 2025-11-03 (o las `filas` dadas); simula el
+    orden, la clave de paginación y el LIMIT de la consulta.
+    """
+    if filas is None:
+        filas = [{'id': i + 1, 'fecha_asignacion': datetime.date(2025, 11, 3) + datetime.timedelta(days=i // 3),
+                  'username': f'user{i % 3}', 'nombre': f'Usuario {i % 3}', 'cedula': str(i % 3), 'cargo': 'Gestor',
+                  'dia': 'monday', 'hora': '08:00'} for i in range(num_filas)]
+    clave = lambda f: (f['fecha_asignacion'], f['username'], f['hora'], f['id'])
+    filas = sorted(filas, key=clave)
+
+    def responder(sql, params):
+        if 'FROM turnos_asignados' in sql:
+            resultado = filas
+            if 'u.username, td.hora, ta.id) >' in sql:
+                resultado = [f for f in filas if clave(f) > tuple(params[-5:-1])]
+            return resultado[:params[-1]]
+        return []
+
+    return responder
+
+
+class VerTurnosAsignadosTest(TestCase):
+    def create_app(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        return app
+
+    def pedir(self, url, admin=True, num_filas=5, filas=None):
+        conn = ConexionFalsa(responder_turnos(num_filas, filas))
+        with self.client, patch('app.get_db_connection', return_value=conn), \
+             patch('app.now_local', return_value=datetime.datetime(2025, 11, 5, 9, 0)):
+            login_user(DummyUser(admin))
+            response = self.client.get(url)
+            datos = response.get_data(as_text=True)
+            logout_user()
+        return response, datos, conn
+
+    def test_vista_por_defecto_acotada_a_dos_semanas(self):
+        response, _, conn = self.pedir('/ver_turnos_asignados')
+        self.assertEqual(response.status_code, 200)
+        sql, params = conn.sentencias[0]
+        self.assertIn('BETWEEN', sql)
+        self.assertIn('LIMIT', sql)
+        self.assertEqual(params[:2], (datetime.date(2025, 11, 3), datetime.date(2025, 11, 16)))
+        self.assertIsNone(self.get_context_variable('siguiente'))
+
+    def test_pagina_siguiente_por_clave(self):
+        self.pedir('/ver_turnos_asignados?por_pagina=4', num_filas=10)
+        siguiente = self.get_context_variable('siguiente')
+        self.assertEqual(siguiente['despues_fecha'], '2025-11-04')
+        self.assertEqual(siguiente['despues_usuario'], 'user0')
+        self.assertEqual((siguiente['despues_hora'], siguiente['despues_id']), ('08:00', 4))
+
+        _, _, conn = self.pedir('/ver_turnos_asignados?despues_fecha=2025-11-04&despues_usuario=user0'
+                                '&despues_hora=08:00&despues_id=4&usuario=user1')
+        sql, params = conn.sentencias[0]
+        self.assertIn('(ta.fecha_asignacion, u.username, td.hora, ta.id) > (%s, %s, %s, %s)', sql)
+        self.assertIn('u.username = %s', sql)
+        self.assertEqual(params[2:7], ('user1', datetime.date(2025, 11, 4), 'user0', '08:00', 4))
+
+    def test_dos_turnos_del_mismo_dia_en_el_borde_de_pagina(self):
+        """Un usuario con dos turnos el mismo día partidos entre páginas: no se pierde ninguno."""
+        base = {'fecha_asignacion': datetime.date(2025, 11, 3), 'nombre': 'N', 'cedula': '1', 'cargo': 'Gestor', 'dia': 'monday'}
+        filas = [dict(base, id=10, username='ana', hora='06:00'),
+                 dict(base, id=3, username='ana', hora='14:00'),
+                 dict(base, id=7, username='bruno', hora='08:00')]
+        self.pedir('/ver_turnos_asignados?por_pagina=1', filas=filas)
+        siguiente = self.get_context_variable('siguiente')
+        self.assertEqual((siguiente['despues_usuario'], siguiente['despues_hora'], siguiente['despues_id']), ('ana', '06:00', 10))
+
+        self.pedir('/ver_turnos_asignados?' + '&'.join(f'{k}={v}' for k, v in siguiente.items()), filas=filas)
+        turnos = self.get_context_variable('turnos_por_fecha')['2025-11-03']
+        self.assertEqual([(t['usuario'], t['hora']) for t in turnos], [('ana', '14:00')])
+
+        _, datos, _ = self.pedir('/ver_turnos_asignados.json?por_pagina=1', filas=filas)
+        self.assertEqual(json.loads(datos)['siguiente']['despues_id'], 10)
+
+    def test_usuario_normal_solo_ve_sus_turnos(self):
+        _, _, conn = self.pedir('/ver_turnos_asignados?usuario=otro', admin=False)
+        sql, params = conn.sentencias[0]
+        self.assertIn('ta.id_usuario = %s', sql)
+        self.assertNotIn('u.username = %s', sql)
+        self.assertEqual(params[2], 7)
+
+    def test_json_en_streaming(self):
+        response, datos, _ = self.pedir('/ver_turnos_asignados.json?por_pagina=2', num_filas=5)
+        self.assertEqual(response.mimetype, 'application/json')
+        cuerpo = json.loads(datos)
+        self.assertEqual(len(cuerpo['turnos']), 2)
+        self.assertEqual(cuerpo['turnos'][1]['usuario'], 'user1')
+        self.assertEqual(cuerpo['siguiente']['despues_usuario'], 'user1')
+
+        _, datos, _ = self.pedir('/ver_turnos_asignados.json', num_filas=5)
+        cuerpo = json.loads(datos)
+        self.assertEqual(len(cuerpo['turnos']), 5)
+        self.assertIsNone(cuerpo['siguiente'])
+
+if __name__ == '__main__':
+    unittest.main()